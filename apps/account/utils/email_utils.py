@@ -1,14 +1,15 @@
-from django.conf import settings
-from django.core.mail import send_mail
 from django.http import HttpRequest
 from django.template.loader import render_to_string
 
+from apps.messaging.outbox import queue_email
+
 from .static_utils import get_full_static_url
 
 
 def send_forget_password_mail(request: HttpRequest, email: str, name: str, code: str) -> None:
     """
-    Sends an email with a password reset code to the specified email address.
+    Queues an email with a password reset code to the specified email address, it is sent off the request
+    by the email outbox.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -31,19 +32,13 @@ def send_forget_password_mail(request: HttpRequest, email: str, name: str, code:
     }
     html_msg = render_to_string(template, context)
 
-    send_mail(
-        subject=subject,
-        recipient_list=[email],
-        html_message=html_msg,
-        message=f"Your verification code is: {code}",
-        from_email=settings.EMAIL_HOST_USER,
-        fail_silently=True,
-    )
+    queue_email(email, subject, f"Your verification code is: {code}", html_body=html_msg)
 
 
 def send_verify_email_mail(request: HttpRequest, email: str, name: str, code: str) -> None:
     """
-    Sends a welcome email with a verification code to the specified email address.
+    Queues a welcome email with a verification code to the specified email address, it is sent off the
+    request by the email outbox.
 
     Args:
         request (HttpRequest): The HTTP request object.
@@ -66,11 +61,4 @@ def send_verify_email_mail(request: HttpRequest, email: str, name: str, code: st
     }
     html_msg = render_to_string(template, context)
 
-    send_mail(
-        subject=subject,
-        recipient_list=[email],
-        html_message=html_msg,
-        message=f"Your verification code is: {code}",
-        from_email=settings.EMAIL_HOST_USER,
-        fail_silently=True,
-    )
+    queue_email(email, subject, f"Your verification code is: {code}", html_body=html_msg)
@@ -0,0 +1,104 @@
+from django.conf import settings
+
+from apps.products.models import Product
+from core.redis_client import get_redis
+
+from .models import CartItem
+
+GUEST_CART_KEY = "carts:guest:{token}"
+GUEST_CART_SESSION_KEY = "guest_cart"
+GUEST_CART_TTL = getattr(settings, "CARTS_GUEST_CART_TTL", 60 * 60 * 24 * 7)
+
+
+def guest_carts_in_redis() -> bool:
+    """True when carts of anonymous visitors are kept in Redis, see `CARTS_GUEST_CART_STORE` setting."""
+    return getattr(settings, "CARTS_GUEST_CART_STORE", "database") == "redis"
+
+
+class GuestCart:
+    """
+    Cart of an anonymous visitor kept in a Redis hash of product id -> quantity, instead of a `Cart` row.
+    The hash is keyed by a random token stored in the session (it survives the session key change at login)
+    and expires `CARTS_GUEST_CART_TTL` seconds after the last change.
+    A cart without a token is empty and is never written.
+    methods:
+        - get_quantities: quantity per product id
+        - get_quantity: quantity of one product
+        - set_quantities: add or update the quantity of products
+        - increment_quantity: add to the quantity of a product
+        - remove: remove products
+        - clear: remove all products
+        - pop_quantities: atomically read and remove all products
+        - get_items: unsaved `CartItem` instances with their products loaded
+    """
+
+    user = None
+
+    def __init__(self, token: str | None):
+        self.token = token
+
+    def __repr__(self):
+        return f"<GuestCart {self.token}>"
+
+    @property
+    def key(self) -> str:
+        return GUEST_CART_KEY.format(token=self.token)
+
+    def get_quantities(self) -> dict[int, int]:
+        if not self.token:
+            return {}
+        return {int(product_id): int(quantity) for product_id, quantity in get_redis().hgetall(self.key).items()}
+
+    def get_quantity(self, product_id: int) -> int:
+        if not self.token:
+            return 0
+        return int(get_redis().hget(self.key, product_id) or 0)
+
+    def set_quantities(self, quantities: dict[int, int]) -> None:
+        if not quantities:
+            return
+        if not self.token:
+            raise ValueError("A guest cart without a token can not be written.")
+        pipe = get_redis().pipeline()
+        pipe.hset(self.key, mapping=quantities)
+        pipe.expire(self.key, GUEST_CART_TTL)
+        pipe.execute()
+
+    def increment_quantity(self, product_id: int, quantity: int, stock: int) -> int:
+        """Adds to the quantity of a product without reading it first, the result is clamped to the stock."""
+        if not self.token:
+            raise ValueError("A guest cart without a token can not be written.")
+        redis = get_redis()
+        new_quantity = redis.hincrby(self.key, product_id, quantity)
+        if new_quantity > stock:
+            redis.hset(self.key, product_id, stock)
+            new_quantity = stock
+        redis.expire(self.key, GUEST_CART_TTL)
+        return new_quantity
+
+    def remove(self, *product_ids: int) -> bool:
+        if not self.token or not product_ids:
+            return False
+        return bool(get_redis().hdel(self.key, *product_ids))
+
+    def clear(self) -> None:
+        if self.token:
+            get_redis().delete(self.key)
+
+    def pop_quantities(self) -> dict[int, int]:
+        """Reads and removes all products in one transaction, so they are handed out only once."""
+        if not self.token:
+            return {}
+        pipe = get_redis().pipeline()
+        pipe.hgetall(self.key)
+        pipe.delete(self.key)
+        quantities, _ = pipe.execute()
+        return {int(product_id): int(quantity) for product_id, quantity in quantities.items()}
+
+    def get_items(self) -> list[CartItem]:
+        """Unsaved cart items in the order of product ids, with products and their images loaded in one go."""
+        quantities = self.get_quantities()
+        if not quantities:
+            return []
+        products = Product.objects.filter(id__in=quantities).prefetch_related("product_images").order_by("id")
+        return [CartItem(product=product, quantity=quantities[product.id]) for product in products]
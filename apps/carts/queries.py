@@ -1,15 +1,19 @@
 import contextlib
+import uuid
 
+from django.db import connection, transaction
 from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.forms import ValidationError
 
 from apps.account.models import User
 from apps.products.models import Product
-from apps.products.queries import calculate_product_discount
+from apps.products.queries import attach_products_pricing, clear_user_wishlist, get_user_wishlist_ids
 from apps.promotions.models.coupon import Coupon
-from apps.promotions.queries import calculate_cart_discount, coupon_validate
+from apps.promotions.queries import calculate_cart_discount, coupon_validate, get_coupon_by_code
+from core.http import get_session_key
 
+from .guest import GUEST_CART_SESSION_KEY, GuestCart, guest_carts_in_redis
 from .models import Cart, CartItem
 
 
@@ -50,37 +54,85 @@ def get_total_inside_cart(product: object, user=None, session_id: str = None) ->
     if not cart:
         return 0
 
-    item = cart.items.filter(product=product).first()
+    item = get_cart_item(cart, product)
     quantity = item.quantity if item else 0
     return quantity
 
 
-def add_or_update_cart_item(product: object, quantity: int = 1, cart: Cart = None) -> CartItem:
+def upsert_cart_item(cart: Cart | GuestCart, product_id: int, quantity: int, increment: bool = False) -> tuple[int, int]:
     """
-    Adds a product to the cart or updates its quantity if it already exists.
+    Sets the quantity of a product in the cart, or adds to it when `increment` is set, clamped to the product stock.
+
+    A database cart is changed by a single `INSERT ... ON CONFLICT DO UPDATE` statement that reads the stock,
+    writes the item and sums the cart, so concurrent requests neither lose updates nor hit the
+    `unique_product_cart` constraint, and the product is never loaded. Inactive, unknown and out of stock
+    products are not added, an item already in the cart is left untouched then.
 
     Args:
-        product (object): The product to add or update in the cart.
-        quantity (int): The quantity of the product to add to the cart. Defaults to 1.
-        cart (Cart): The cart to which the product belongs. This is required.
+        cart (Cart | GuestCart): The cart to change.
+        product_id (int): Id of the product to add or update.
+        quantity (int): The new quantity, or the quantity to add when `increment` is set. Must be at least 1.
+        increment (bool): Add to the current quantity instead of replacing it.
 
     Returns:
-        CartItem: The updated or newly created cart item.
+        tuple[int, int]: The quantity of the product in the cart after the change (0 when not in the cart)
+        and the total quantity of all items in the cart.
     """
-    available_quantity = min(quantity, product.stock)
-    if not available_quantity:
-        return None
+    if isinstance(cart, GuestCart):
+        stock = Product.objects.active().filter(id=product_id).values_list("stock", flat=True).first()
+        if stock:
+            if increment:
+                cart.increment_quantity(product_id, quantity, stock)
+            else:
+                cart.set_quantities({product_id: min(quantity, stock)})
+        quantities = cart.get_quantities()
+        return quantities.get(product_id, 0), sum(quantities.values())
+
+    item_table = CartItem._meta.db_table
+    new_quantity = f"{item_table}.quantity + EXCLUDED.quantity" if increment else "EXCLUDED.quantity"
+    # The CTEs see the cart as it was before the statement, the changed row is taken from `upsert`
+    sql = f"""
+        WITH product AS (
+            SELECT id, stock FROM {Product._meta.db_table} WHERE id = %(product_id)s AND is_active
+        ), upsert AS (
+            INSERT INTO {item_table} (cart_id, product_id, quantity, created_at, updated_at, is_active)
+            SELECT %(cart_id)s, product.id, LEAST(%(quantity)s, product.stock), NOW(), NOW(), TRUE
+            FROM product
+            WHERE product.stock > 0
+            ON CONFLICT (cart_id, product_id) DO UPDATE
+            SET quantity = LEAST({new_quantity}, (SELECT stock FROM product)), updated_at = EXCLUDED.updated_at
+            RETURNING quantity
+        ), item AS (
+            SELECT COALESCE(
+                (SELECT quantity FROM upsert),
+                (SELECT quantity FROM {item_table} WHERE cart_id = %(cart_id)s AND product_id = %(product_id)s),
+                0
+            ) AS quantity
+        )
+        SELECT item.quantity, item.quantity + COALESCE(
+            (SELECT SUM(quantity) FROM {item_table} WHERE cart_id = %(cart_id)s AND product_id <> %(product_id)s), 0
+        )
+        FROM item
+    """  # noqa: S608, only table names are interpolated
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"cart_id": cart.id, "product_id": product_id, "quantity": quantity})
+        item_quantity, cart_count = cursor.fetchone()
+    return item_quantity, int(cart_count)
 
-    product_item, new_item = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={"quantity": quantity},
-    )
-    if not new_item:
-        product_item.quantity = quantity
-        product_item.save()
 
-    return product_item
+def add_or_update_cart_item(product: object, quantity: int = 1, cart: Cart = None) -> int:
+    """
+    Adds a product to the cart or updates its quantity if it already exists, see `upsert_cart_item`.
+
+    Args:
+        product (object): The product (or its id) to add or update in the cart.
+        quantity (int): The quantity of the product to add to the cart. Defaults to 1.
+        cart (Cart): The cart to which the product belongs. This is required.
+
+    Returns:
+        int: The quantity of the product in the cart, clamped to the stock.
+    """
+    return upsert_cart_item(cart, getattr(product, "id", product), quantity)[0]
 
 
 def remove_from_cart_item(product: object, cart: Cart = None) -> bool:
@@ -88,36 +140,124 @@ def remove_from_cart_item(product: object, cart: Cart = None) -> bool:
     Removes a product from the cart.
 
     Args:
-        product (object): The product to remove from the cart.
+        product (object): The product (or its id) to remove from the cart.
         cart (Cart): The cart from which to remove the product.
 
     Returns:
         bool: True if the item was removed, False otherwise.
     """
-    product_item = cart.items.filter(
-        product=product,
-    ).first()
-    if product_item:
-        product_item.delete()
+    product_id = getattr(product, "id", product)
+    if isinstance(cart, GuestCart):
+        return cart.remove(product_id)
+
+    deleted, _ = cart.items.filter(product_id=product_id).delete()
+    return bool(deleted)
+
 
-    return bool(product_item)
+CART_ITEMS_ON_CONFLICT = {
+    # Quantity of an item already in the cart: replaced, added to, or kept
+    "replace": "LEAST(EXCLUDED.quantity, {stock})",
+    "increment": "LEAST({table}.quantity + EXCLUDED.quantity, {stock})",
+    "ignore": None,
+}
 
 
-def add_or_update_cart_items(cart: Cart, products: list[tuple[object, int]]) -> QuerySet[CartItem]:
+def upsert_cart_items(cart: Cart | GuestCart, quantities: dict[int, int], on_conflict: str = "replace") -> dict[int, int]:
     """
-    Adds or updates multiple products in the cart.
+    Adds, updates or removes many products of the cart at once, clamped to the product stock.
+    A database cart is changed by at most two statements whatever the number of products: a DELETE for the
+    removed products and a single `INSERT ... SELECT FROM UNNEST(...) ON CONFLICT DO UPDATE` for the others.
+    Inactive, unknown and out of stock products are not added, items already in the cart are left untouched then.
+
+    Args:
+        cart (Cart | GuestCart): The cart to change.
+        quantities (dict[int, int]): Quantity per product id, a quantity below 1 removes the product
+            (ignored with "increment").
+        on_conflict (str): What happens to products already in the cart, their quantity is replaced ("replace"),
+            added to ("increment") or kept ("ignore").
+
+    Returns:
+        dict[int, int]: The new quantity per written product id, removed products map to 0.
+    """
+    if on_conflict not in CART_ITEMS_ON_CONFLICT:
+        raise ValueError(f"Unknown on_conflict {on_conflict!r}.")
+
+    removed_ids = [] if on_conflict == "increment" else [pid for pid, quantity in quantities.items() if quantity < 1]
+    upserts = {product_id: quantity for product_id, quantity in quantities.items() if quantity >= 1}
+    result = dict.fromkeys(removed_ids, 0)
+
+    if isinstance(cart, GuestCart):
+        cart.remove(*removed_ids)
+        stocks = dict(Product.objects.active().filter(id__in=upserts, stock__gt=0).values_list("id", "stock"))
+        current = cart.get_quantities() if on_conflict != "replace" else {}
+        for product_id, stock in stocks.items():
+            if on_conflict == "ignore" and product_id in current:
+                continue
+            result[product_id] = min(upserts[product_id] + current.get(product_id, 0), stock)
+        cart.set_quantities({product_id: result[product_id] for product_id in stocks if product_id in result})
+        return result
+
+    if removed_ids:
+        cart.items.filter(product_id__in=removed_ids).delete()
+    if not upserts:
+        return result
+
+    item_table, product_table = CartItem._meta.db_table, Product._meta.db_table
+    update = CART_ITEMS_ON_CONFLICT[on_conflict]
+    if update is None:
+        conflict = "DO NOTHING"
+    else:
+        # The joined product of the SELECT is not visible here, the stock is read through a subquery
+        stock = f"(SELECT stock FROM {product_table} WHERE id = EXCLUDED.product_id)"  # noqa: S608
+        update = update.format(table=item_table, stock=stock)
+        conflict = f"DO UPDATE SET quantity = {update}, updated_at = EXCLUDED.updated_at"
+    sql = f"""
+        INSERT INTO {item_table} (cart_id, product_id, quantity, created_at, updated_at, is_active)
+        SELECT %(cart_id)s, product.id, LEAST(item.quantity, product.stock), NOW(), NOW(), TRUE
+        FROM UNNEST(%(product_ids)s::bigint[], %(quantities)s::integer[]) AS item(product_id, quantity)
+        JOIN {product_table} product ON product.id = item.product_id
+        WHERE product.is_active AND product.stock > 0
+        ON CONFLICT (cart_id, product_id) {conflict}
+        RETURNING product_id, quantity
+    """  # noqa: S608, only table names and fixed expressions are interpolated
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"cart_id": cart.id, "product_ids": list(upserts), "quantities": list(upserts.values())})
+        result.update(cursor.fetchall())
+    return result
+
+
+def add_or_update_cart_items(cart: Cart, products: list[tuple[object, int]]) -> dict[int, int]:
+    """
+    Adds or updates multiple products in the cart, see `upsert_cart_items`.
 
     Args:
         cart (Cart): The cart to which the products belong.
-        products (list of tuple): A list of tuples, each containing a product and its quantity.
+        products (list of tuple): A list of tuples, each containing a product (or its id) and its quantity.
 
     Returns:
-        QuerySet[CartItem]: A queryset of the created or updated CartItem instances.
+        dict[int, int]: The new quantity per product id.
+    """
+    return upsert_cart_items(cart, {getattr(product, "id", product): quantity for product, quantity in products})
+
+
+def move_wishlist_to_cart(user: User, cart: Cart, clear_wishlist: bool = False) -> dict[int, int]:
     """
-    cart_items = [add_or_update_cart_item(cart, product, quantity) for (product, quantity) in products]
-    cart_items = filter(None, cart_items)
-    cart_items = CartItem.objects.bulk_create(cart_items)
-    return cart_items
+    Adds every product of the user's wishlist to the cart with quantity 1 in a single statement,
+    products already in the cart keep their quantity.
+
+    Args:
+        user (User): The user whose wishlist is moved.
+        cart (Cart): The cart the products are added to.
+        clear_wishlist (bool): Empty the wishlist afterwards.
+
+    Returns:
+        dict[int, int]: Quantity per added product id.
+    """
+    wishlist_ids = get_user_wishlist_ids(user)
+    added = upsert_cart_items(cart, dict.fromkeys(wishlist_ids, 1), on_conflict="ignore")
+    if clear_wishlist:
+        clear_user_wishlist(user.id)
+    return added
 
 
 def get_cart(user: User = None, session_id: str = None) -> Cart | None:
@@ -134,13 +274,9 @@ def get_cart(user: User = None, session_id: str = None) -> Cart | None:
     if user and user.is_anonymous:
         user = None
 
-    cart = (
-        Cart.objects.filter(
-            Q(user=user) | Q(session_id=session_id),
-        )
-        .order_by("-updated_at")
-        .first()
-    )
+    # A user's cart is looked up by the user only, a guest's by the session only
+    lookup = Q(user=user) if user else Q(user=None, session_id=session_id)
+    cart = Cart.objects.filter(lookup).order_by("-updated_at").first()
     print(user, session_id)
     if not cart:
         cart = create_cart(user, session_id)
@@ -158,6 +294,9 @@ def get_cart_item(cart: Cart, product: Product) -> QuerySet[CartItem]:
     Returns:
         QuerySet[CartItem]: A queryset of all cart items.
     """
+    if isinstance(cart, GuestCart):
+        quantity = cart.get_quantity(product.id)
+        return CartItem(product=product, quantity=quantity) if quantity else None
     return cart.items.filter(product=product).first()
 
 
@@ -169,8 +308,10 @@ def get_cart_items(cart: Cart) -> QuerySet[CartItem]:
         cart (Cart): The cart from which to retrieve the items.
 
     Returns:
-        QuerySet[CartItem]: A queryset of all cart items.
+        QuerySet[CartItem]: A queryset of all cart items, a list of unsaved items for a `GuestCart`.
     """
+    if isinstance(cart, GuestCart):
+        return cart.get_items()
     return cart.items.all()
 
 
@@ -179,8 +320,14 @@ def update_cart_items_quantities(cart: Cart) -> None:
     Updates the quantity of each item in the cart based on the current stock.
     Returns: None
     """
+    if isinstance(cart, GuestCart):
+        quantities = cart.get_quantities()
+        stocks = Product.objects.filter(id__in=quantities).values_list("id", "stock")
+        cart.set_quantities({product_id: stock for product_id, stock in stocks if stock < quantities[product_id]})
+        return
+
     updated_items = []
-    for item in cart.items.all():
+    for item in cart.items.select_related("product").only("id", "quantity", "product__stock"):
         if item.product.stock >= item.quantity:
             continue
         else:
@@ -199,54 +346,187 @@ def get_cart_item_count(cart) -> int:
     Returns:
         int: The total quantity of all items in the cart.
     """
+    if isinstance(cart, GuestCart):
+        return sum(cart.get_quantities().values())
     return sum(item.quantity for item in cart.items.all())
 
 
-def get_cart_items_total_price(cart: Cart, coupon: Coupon | None = None) -> dict[str, float]:
+def get_cart_summary(cart: Cart, coupon: Coupon | None = None) -> dict:
     """
-    Calculates the total price of items in the cart, optionally applying a discount from a coupon.
+    Loads the cart items with their products, images, offers and discounts once and calculates
+    everything the cart, checkout and order pages need in memory.
+    Quantities above the product stock are clamped to it and saved in a single bulk update.
 
     Args:
         cart (Cart): The user's cart containing the items.
-        coupon (str | None): The coupon code to apply (if any), or None for no discount.
+        coupon (Coupon | None): The coupon to apply (if any), it is validated against the cart total.
 
     Returns:
-        dict: A dictionary containing the total price breakdown:
+        dict: The cart summary:
+            - cart: The cart itself.
+            - items: Cart items, each product has its pricing for the item quantity attached and every item
+              has `line_price` (before discounts) and `line_final_price` (after product discounts).
+            - item_count: Total quantity of all items.
             - product_total_price: Total price of products before any discounts.
-            - coupon_total_discount: Total discount applied by the coupon (if any).
             - product_total_discount: Total discount applied to the products.
+            - coupon_total_discount: Total discount applied by the coupon (if any).
             - total_price: Final total price after applying all discounts.
+            - coupon: The validated coupon, None when not given or not valid.
+            - coupon_id: Id of the validated coupon.
     """
-    # Retrieve cart items and calculate individual product discounts
-    items = get_cart_items(cart).select_related("product").prefetch_related("product__discounts", "product__offers")
+    if isinstance(cart, GuestCart):
+        items = cart.get_items()
+    else:
+        items = list(get_cart_items(cart).select_related("product").prefetch_related("product__product_images").order_by("id"))
 
-    # Calculate original product prices and discounts
-    product_total_price: float = sum(item.product.price * item.quantity for item in items)
-    product_total_discount: float = sum(
-        ((item.product.price * item.quantity) - calculate_product_discount(item.product, item.quantity)[1]) for item in items
+    # Clamp the quantities to the current stock
+    clamped_items = []
+    for item in items:
+        if item.quantity > item.product.stock:
+            item.quantity = item.product.stock
+            clamped_items.append(item)
+    if isinstance(cart, GuestCart):
+        cart.set_quantities({item.product_id: item.quantity for item in clamped_items})
+    elif clamped_items:
+        CartItem.objects.bulk_update(clamped_items, ["quantity"])
+
+    attach_products_pricing(
+        [item.product for item in items],
+        quantities={item.product_id: item.quantity for item in items},
     )
-    final_price_of_products: list[float] = [calculate_product_discount(item.product, item.quantity)[1] for item in items]
-    sum_final_price_of_products: float = sum(final_price_of_products)
 
-    # Initialize coupon discount and validated coupon
+    product_total_price: float = 0.0
+    product_final_price: float = 0.0
+    for item in items:
+        pricing = getattr(item.product, "pricing", None)
+        item.line_price = item.product.price * item.quantity
+        item.line_final_price = pricing["total_price"] if pricing else 0.0
+        product_total_price += item.line_price
+        product_final_price += item.line_final_price
+
+    # Validate and apply the coupon on the discounted total
+    total_price: float = product_final_price
     coupon_total_discount: float = 0.0
     validated_coupon = None
-
-    if not coupon:
-        ...
-    else:
+    if coupon:
         with contextlib.suppress(ValidationError):
-            validated_coupon = coupon_validate(cart.user, coupon, sum_final_price_of_products)
+            validated_coupon = coupon_validate(cart.user, coupon, product_final_price)
         if validated_coupon:
-            coupon_total_discount = sum_final_price_of_products - calculate_cart_discount(
-                sum_final_price_of_products, validated_coupon
-            )
-            sum_final_price_of_products = calculate_cart_discount(sum_final_price_of_products, validated_coupon)
+            total_price = calculate_cart_discount(product_final_price, validated_coupon)
+            coupon_total_discount = product_final_price - total_price
 
     return {
+        "cart": cart,
+        "items": items,
+        "item_count": sum(item.quantity for item in items),
         "product_total_price": product_total_price,
+        "product_total_discount": product_total_price - product_final_price,
         "coupon_total_discount": coupon_total_discount,
-        "product_total_discount": product_total_discount,
-        "total_price": sum_final_price_of_products,
+        "total_price": total_price,
+        "coupon": validated_coupon,
         "coupon_id": validated_coupon.id if validated_coupon else None,
     }
+
+
+def get_request_cart(request, create: bool = True) -> Cart | GuestCart:
+    """
+    Returns the cart of the request.
+    Anonymous visitors get a `GuestCart` kept in Redis when `CARTS_GUEST_CART_STORE` is "redis", its token
+    (and so the session) is only created when `create` is set, i.e. when the cart is about to be written.
+    Otherwise the database cart of the user or session is returned, created when missing.
+    """
+    if request.user.is_authenticated or not guest_carts_in_redis():
+        return get_cart(request.user, get_session_key(request))
+
+    token = request.session.get(GUEST_CART_SESSION_KEY)
+    if token is None and create:
+        token = request.session[GUEST_CART_SESSION_KEY] = uuid.uuid4().hex
+    return GuestCart(token)
+
+
+def promote_guest_cart(request) -> Cart | None:
+    """
+    Moves the Redis guest cart of the session into the database cart of the logged in user, called at login
+    and checkout. Products already in the user's cart get the larger of both quantities, clamped to the stock.
+    The guest cart is taken atomically, so it is merged only once, and is put back when the merge fails.
+
+    Returns:
+        Cart | None: The user's cart, or None if there was no guest cart to promote.
+    """
+    token = request.session.get(GUEST_CART_SESSION_KEY)
+    if not token or not request.user.is_authenticated:
+        return None
+
+    del request.session[GUEST_CART_SESSION_KEY]
+    guest_cart = GuestCart(token)
+    quantities = guest_cart.pop_quantities()
+    if not quantities:
+        return None
+
+    try:
+        with transaction.atomic():
+            cart = get_cart(request.user, get_session_key(request))
+            # Lock the cart, concurrent merges into it run one after the other
+            Cart.objects.select_for_update().filter(id=cart.id).first()
+
+            stocks = dict(Product.objects.filter(id__in=quantities).values_list("id", "stock"))
+            items = {item.product_id: item for item in cart.items.filter(product_id__in=stocks)}
+            updated_items, new_items = [], []
+            for product_id, stock in stocks.items():
+                quantity = min(quantities[product_id], stock)
+                item = items.get(product_id)
+                if item is None:
+                    if quantity:
+                        new_items.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+                elif quantity > item.quantity:
+                    item.quantity = quantity
+                    updated_items.append(item)
+
+            CartItem.objects.bulk_create(new_items)
+            CartItem.objects.bulk_update(updated_items, ["quantity"])
+    except Exception:
+        guest_cart.set_quantities(quantities)
+        request.session[GUEST_CART_SESSION_KEY] = token
+        raise
+
+    return cart
+
+
+def get_request_cart_summary(request) -> dict:
+    """
+    Returns the cart summary of the request's cart with the session coupon applied.
+    It is computed once per request and shared by every caller.
+    """
+    summary = getattr(request, "_cart_summary", None)
+    if summary is None:
+        cart = get_request_cart(request, create=False)
+        coupon_code = request.session.get("coupon_code")
+        coupon = get_coupon_by_code(coupon_code) if coupon_code else None
+        summary = request._cart_summary = get_cart_summary(cart, coupon)
+    return summary
+
+
+def get_cart_items_total_price(cart: Cart, coupon: Coupon | None = None) -> dict[str, float]:
+    """
+    Calculates the total price of items in the cart, optionally applying a discount from a coupon.
+    A shortcut of `get_cart_summary` for callers that only need the totals.
+
+    Args:
+        cart (Cart): The user's cart containing the items.
+        coupon (str | None): The coupon code to apply (if any), or None for no discount.
+
+    Returns:
+        dict: A dictionary containing the total price breakdown:
+            - product_total_price: Total price of products before any discounts.
+            - coupon_total_discount: Total discount applied by the coupon (if any).
+            - product_total_discount: Total discount applied to the products.
+            - total_price: Final total price after applying all discounts.
+    """
+    summary = get_cart_summary(cart, coupon)
+    return {
+        "product_total_price": summary["product_total_price"],
+        "coupon_total_discount": summary["coupon_total_discount"],
+        "product_total_discount": summary["product_total_discount"],
+        "total_price": summary["total_price"],
+        "coupon_id": summary["coupon_id"],
+    }
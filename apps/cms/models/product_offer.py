@@ -1,6 +1,7 @@
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, hook
 
 from core.models import BaseModel, CreatedByMixin, UpdatedByMixin
 
@@ -40,6 +41,14 @@ class ProductOffer(BaseModel, CreatedByMixin, UpdatedByMixin):
     def __str__(self):
         return self.title
 
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_active_offer_index(self):
+        """Drops the cached active-offer index once the change is committed."""
+        from apps.cms.queries import invalidate_active_offer_index
+
+        transaction.on_commit(invalidate_active_offer_index)
+
 
 class ProductOfferItem(BaseModel, CreatedByMixin, UpdatedByMixin):
     """
@@ -93,6 +102,14 @@ class ProductOfferItem(BaseModel, CreatedByMixin, UpdatedByMixin):
     def __str__(self):
         return self.product.title
 
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_active_offer_index(self):
+        """Drops the cached active-offer index once the change is committed."""
+        from apps.cms.queries import invalidate_active_offer_index
+
+        transaction.on_commit(invalidate_active_offer_index)
+
     class Meta:
         verbose_name = _("Product Offer Item")
         verbose_name_plural = _("Product Offer Items")
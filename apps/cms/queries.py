@@ -1,8 +1,16 @@
+from datetime import timedelta
 from typing import List
 
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
 from apps.products.models import Product
 
-from .models import Banner, ProductOfferItem, Slider
+from .models import Banner, ProductOffer, ProductOfferItem, Slider
+
+ACTIVE_OFFER_INDEX_KEY = "cms:active_offer_index"
+ACTIVE_OFFER_INDEX_TIMEOUT = 60 * 60  # Upper bound in seconds, the next offer window boundary usually comes first
 
 
 def get_sliders() -> List[Slider]:
@@ -29,3 +37,66 @@ def get_second_banner() -> Banner | None:
 def get_best_offer_product(product: Product) -> ProductOfferItem | None:
     """Returns the best offer product for a given product."""
     product.offer_items.filter().order_by("-discount").first()
+
+
+def build_active_offer_index() -> tuple[list[tuple[ProductOffer, dict[int, int]]], int]:
+    """
+    Builds the active-offer index in a single query.
+
+    Every open offer is paired with its eligible items as {product_id: remaining stock}, offers ending
+    soonest first and the newest items first. Offers that have not started yet are only used to find the
+    next window boundary.
+
+    Returns:
+        tuple: (index, seconds until the next offer window opens or closes)
+    """
+    now = timezone.now()
+    offer_items = (
+        ProductOfferItem.objects.filter(
+            product_offer__is_active=True,
+            product_offer__active_until__gte=now,
+            stock__gt=F("sold_stock"),
+        )
+        .select_related("product_offer")
+        .only(
+            "id",
+            "product_id",
+            "stock",
+            "sold_stock",
+            "product_offer__title",
+            "product_offer__active_from",
+            "product_offer__active_until",
+        )
+        .order_by("product_offer__active_until", "product_offer_id", "-id")
+    )
+
+    index: dict[int, tuple[ProductOffer, dict[int, int]]] = {}
+    next_boundary = now + timedelta(seconds=ACTIVE_OFFER_INDEX_TIMEOUT)
+    for offer_item in offer_items:
+        offer = offer_item.product_offer
+        if offer.active_from > now:
+            next_boundary = min(next_boundary, offer.active_from)
+            continue
+        next_boundary = min(next_boundary, offer.active_until)
+        _, products = index.setdefault(offer.id, (offer, {}))
+        products[offer_item.product_id] = offer_item.stock - offer_item.sold_stock
+
+    timeout = max(int((next_boundary - now).total_seconds()) + 1, 1)
+    return list(index.values()), timeout
+
+
+def get_active_offer_index() -> list[tuple[ProductOffer, dict[int, int]]]:
+    """
+    Returns the cached active-offer index, rebuilding it when missing.
+    The cache entry expires on the next offer window boundary and is dropped whenever an offer or offer item changes.
+    """
+    index = cache.get(ACTIVE_OFFER_INDEX_KEY)
+    if index is None:
+        index, timeout = build_active_offer_index()
+        cache.set(ACTIVE_OFFER_INDEX_KEY, index, timeout)
+    return index
+
+
+def invalidate_active_offer_index() -> None:
+    """Drops the cached active-offer index, the next read rebuilds it."""
+    cache.delete(ACTIVE_OFFER_INDEX_KEY)
@@ -0,0 +1,314 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.account.models import Address, User
+from apps.carts.models import Cart, CartItem
+from apps.cms.models import ProductOffer, ProductOfferItem
+from apps.cms.queries import invalidate_active_offer_index
+from apps.info.models import City, State
+from apps.order.queries import place_order
+from apps.products.category_tree import invalidate_category_tree
+from apps.products.models import Product, ProductCategory, ProductDiscount, ProductReview
+from apps.products.queries import invalidate_product_facets, rebuild_products_rating
+from apps.products.search import get_search_backend
+from apps.shipments.models import ShipmentType
+from core import choice
+
+DEFAULT_BASELINE = Path(__file__).resolve().parents[2] / "benchmarks" / "views_baseline.json"
+
+WORDS = [
+    "گوشی", "لپ‌تاپ", "هدفون", "کیف", "کفش", "ساعت", "دوربین", "کتاب", "میز", "صندلی",
+    "phone", "laptop", "headphone", "wireless", "bluetooth", "leather", "sport", "smart", "gaming", "classic",
+]  # fmt: skip
+
+# Absolute slack added to the timing budgets, so sub-millisecond timings do not fail on jitter
+TIMING_NOISE_MS = 1.0
+
+DATASET_OPTIONS = ("products", "categories", "offers", "discounts", "reviews", "cart_items", "orders")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure query count, SQL time and wall time of the front shop views on a generated dataset and compare "
+        "them against a stored baseline. Fails when a view runs more queries than its budget or gets slower than "
+        "the tolerance allows. The dataset is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=2000, help="Number of generated products.")
+        parser.add_argument("--categories", type=int, default=20, help="Number of generated categories.")
+        parser.add_argument("--offers", type=int, default=50, help="Number of products in the active flash offer.")
+        parser.add_argument("--discounts", type=int, default=200, help="Number of products with an active discount.")
+        parser.add_argument("--reviews", type=int, default=3, help="Number of accepted reviews per product.")
+        parser.add_argument("--cart-items", type=int, default=5, help="Number of items in the user's cart.")
+        parser.add_argument("--orders", type=int, default=20, help="Number of orders placed by the user.")
+        parser.add_argument("--repeat", type=int, default=10, help="Number of measured runs per view.")
+        parser.add_argument("--warmup", type=int, default=1, help="Number of unmeasured runs per view, fills the caches.")
+        parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Path of the baseline JSON file.")
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store the measured values as the new baseline instead of comparing against it.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed relative slowdown of the median SQL and wall time, 0.25 is 25%%.",
+        )
+        parser.add_argument(
+            "--query-slack",
+            type=int,
+            default=0,
+            help="Number of queries a view may run above its baseline count.",
+        )
+        parser.add_argument(
+            "--queries-only",
+            action="store_true",
+            help="Compare only the query counts, for machines other than the one the baseline timings come from.",
+        )
+
+    def handle(self, *args, **options):
+        dataset = {name: options[name] for name in DATASET_OPTIONS}
+
+        setup_test_environment()
+        try:
+            with transaction.atomic():
+                client, views = self.create_dataset(**dataset)
+                results = {
+                    name: self.measure(client, method, path, prepare, options["repeat"], options["warmup"])
+                    for name, (method, path, prepare) in views.items()
+                }
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+            self.invalidate_caches()
+
+        self.report(results)
+        if options["update_baseline"]:
+            self.write_baseline(options["baseline"], dataset, results)
+            return
+        self.compare(
+            options["baseline"], dataset, results, options["tolerance"], options["query_slack"], options["queries_only"]
+        )
+
+    def create_dataset(
+        self, products, categories, offers, discounts, reviews, cart_items, orders, batch_size: int = 1000
+    ) -> tuple[Client, dict]:
+        self.stdout.write(f"Creating {products} products in {categories} categories ...")
+        rng = random.Random(0)  # noqa: S311
+        now = timezone.now()
+
+        roots = [
+            ProductCategory.objects.create(title=f"benchmark {index}", description="benchmark", logo="benchmark.png")
+            for index in range(max(1, categories // 4))
+        ]
+        leaves = [
+            ProductCategory.objects.create(
+                title=f"benchmark {index}", description="benchmark", logo="benchmark.png", parent=roots[index % len(roots)]
+            )
+            for index in range(len(roots), max(len(roots) + 1, categories))
+        ]
+
+        for start in range(0, products, batch_size):
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        title=" ".join(rng.sample(WORDS, 3)),
+                        description=" ".join(rng.choices(WORDS, k=30)),
+                        category=rng.choice(leaves),
+                        stock=rng.randint(1, 100),
+                        price=rng.randint(1, 1000) * 10_000,
+                    )
+                    for _ in range(start, min(start + batch_size, products))
+                ]
+            )
+        product_list = list(Product.objects.filter(category__in=leaves).order_by("id"))
+
+        offer = ProductOffer.objects.create(
+            title="benchmark", active_from=now - timedelta(days=1), active_until=now + timedelta(days=1)
+        )
+        ProductOfferItem.objects.bulk_create(
+            [
+                ProductOfferItem(product_offer=offer, product=product, stock=50, discount=rng.randint(5, 50))
+                for product in rng.sample(product_list, min(offers, len(product_list)))
+            ]
+        )
+        ProductDiscount.objects.bulk_create(
+            [
+                ProductDiscount(
+                    product=product,
+                    title="benchmark",
+                    type=choice.DISCOUNT_TYPE_PERCENT,
+                    amount=rng.randint(5, 30),
+                    active_from=now - timedelta(days=1),
+                    active_until=now + timedelta(days=1),
+                )
+                for product in rng.sample(product_list, min(discounts, len(product_list)))
+            ]
+        )
+
+        reviewers = User.objects.bulk_create([User(username=f"benchmark_reviewer_{index}") for index in range(reviews)])
+        for start in range(0, len(product_list), batch_size):
+            ProductReview.objects.bulk_create(
+                [
+                    ProductReview(product=product, user=reviewer, text="benchmark", rating=rng.randint(1, 5), is_accepted=True)
+                    for product in product_list[start : start + batch_size]
+                    for reviewer in reviewers
+                ]
+            )
+
+        user = User.objects.create(
+            username="benchmark_user",
+            first_name="benchmark",
+            last_name="benchmark",
+            email="benchmark@example.com",
+            phone_number="09000000000",
+        )
+        city = City.objects.create(title="benchmark", state=State.objects.create(title="benchmark"))
+        address = Address.objects.create(user=user, title="benchmark", city=city)
+        shipment_type = ShipmentType.objects.create(
+            title="benchmark", service_type=choice.SHIPMENT_SERVICE_TYPES[0][0], logo="benchmark.png", price=100_000
+        )
+        cart = Cart.objects.create(user=user)
+
+        def fill_cart():
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, product=product, quantity=1)
+                    for product in rng.sample(product_list, min(cart_items, len(product_list)))
+                ],
+                ignore_conflicts=True,
+            )
+
+        self.stdout.write(f"Placing {orders} orders ...")
+        for _ in range(orders):
+            fill_cart()
+            items = list(cart.items.select_related("product"))
+            total = sum(item.product.price * item.quantity for item in items)
+            place_order(
+                user=user,
+                address=address,
+                coupon=None,
+                note=None,
+                product_total_price=total,
+                coupon_total_discount=0,
+                product_total_discount=0,
+                total_price=total,
+                cart_items=items,
+                shipment_id=shipment_type.id,
+            )
+            cart.items.all().delete()
+        fill_cart()
+
+        # `bulk_create` skips the hooks, refresh the derived data and caches explicitly
+        rebuild_products_rating([product.id for product in product_list])
+        get_search_backend().update_products([product.id for product in product_list])
+        self.invalidate_caches()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        client = Client()
+        client.force_login(user)
+        session = client.session
+        session["selected_shipment_id"] = str(shipment_type.id)
+        session.save()
+
+        product = product_list[len(product_list) // 2]
+        views = {
+            "home": ("get", reverse("home"), None),
+            "category": ("get", reverse("category", args=[roots[0].id]), None),
+            "shopgrid": ("get", reverse("shop-grid"), None),
+            "single_product": ("get", reverse("single_product", args=[product.id]), None),
+            "cart": ("get", reverse("cart"), None),
+            "checkout": ("get", reverse("checkout"), None),
+            # The order clears the cart, it is filled again before every run
+            "create_order": ("post", reverse("create-order"), fill_cart),
+            "search": ("get", f"{reverse('search')}?query={WORDS[10]}", None),
+            "my_orders": ("get", reverse("my-orders"), None),
+        }
+        return client, views
+
+    def measure(self, client: Client, method: str, path: str, prepare, repeat: int, warmup: int) -> dict:
+        queries, sql_timings, wall_timings = [], [], []
+        for run in range(warmup + repeat):
+            if prepare:
+                prepare()
+            # The query log keeps only the last 9000 queries, a full log would capture none
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = getattr(client, method)(path)
+                wall = (time.perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {path} returned {response.status_code}.")
+            if run < warmup:
+                continue
+            queries.append(len(context.captured_queries))
+            sql_timings.append(sum(float(query["time"]) for query in context.captured_queries) * 1000)
+            wall_timings.append(wall)
+
+        return {
+            "queries": max(queries),
+            "sql_ms": round(statistics.median(sql_timings), 2),
+            "wall_ms": round(statistics.median(wall_timings), 2),
+        }
+
+    @staticmethod
+    def invalidate_caches() -> None:
+        invalidate_category_tree()
+        invalidate_active_offer_index()
+        invalidate_product_facets()
+
+    def report(self, results: dict) -> None:
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{'view':16} {'queries':>8} {'sql (ms)':>10} {'wall (ms)':>10}"))
+        for name, result in results.items():
+            self.stdout.write(f"{name:16} {result['queries']:8} {result['sql_ms']:10.2f} {result['wall_ms']:10.2f}")
+
+    def write_baseline(self, path: Path, dataset: dict, results: dict) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"dataset": dataset, "views": results}, indent=2) + "\n")
+        self.stdout.write(self.style.SUCCESS(f"Baseline written to {path}."))
+
+    def compare(
+        self, path: Path, dataset: dict, results: dict, tolerance: float, query_slack: int, queries_only: bool
+    ) -> None:
+        if not path.exists():
+            raise CommandError(f"No baseline at {path}, run with --update-baseline to store one.")
+
+        baseline = json.loads(path.read_text())
+        if baseline.get("dataset") != dataset:
+            self.stdout.write(
+                self.style.WARNING(f"The baseline was measured on a different dataset: {baseline.get('dataset')}.")
+            )
+
+        failures = []
+        for name, result in results.items():
+            budget = baseline["views"].get(name)
+            if budget is None:
+                failures.append(f"{name}: not in the baseline")
+                continue
+            if result["queries"] > budget["queries"] + query_slack:
+                failures.append(f"{name}: {result['queries']} queries, budget {budget['queries']}")
+            if queries_only:
+                continue
+            for metric in ("sql_ms", "wall_ms"):
+                limit = budget[metric] * (1 + tolerance) + TIMING_NOISE_MS
+                if result[metric] > limit:
+                    failures.append(f"{name}: {metric} {result[metric]:.2f}, budget {limit:.2f}")
+
+        if failures:
+            raise CommandError("Budgets exceeded:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All views are within their budgets."))
@@ -0,0 +1,232 @@
+import math
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from apps.account.models import Address, User
+from apps.carts.models import Cart, CartItem
+from apps.info.models import City, State
+from apps.order.models import Order, OrderItem, OrderShipment, OrderStatus
+from apps.products.models import Product, ProductCategory
+from apps.shipments.models import ShipmentType
+from core import choice
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of the values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def run_user(index: int, user: User, shipment_type_id: int, product_ids: list[int], options: dict, barrier, results):
+    """
+    Places the orders of one user through the checkout view, every order is re-submitted concurrently
+    with the same idempotency key. Runs in its own process, puts the latencies and errors on `results`.
+    """
+    rng = random.Random(options["seed"] * 1000 + index)  # noqa: S311
+    latencies = {"order": [], "retry": []}
+    errors = []
+    lock = threading.Lock()
+
+    def submit(client: Client, key: str, kind: str):
+        try:
+            start = time.perf_counter()
+            response = client.post(reverse("create-order"), {"idempotency_key": key})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if response.status_code != 302 or response.url != reverse("payment-success"):
+                    errors.append(f"{kind} returned {response.status_code}")
+                latencies[kind].append(elapsed)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+        finally:
+            if kind == "retry":
+                connections.close_all()
+
+    try:
+        client = Client()
+        client.force_login(user)
+        session = client.session
+        session["selected_shipment_id"] = str(shipment_type_id)
+        session.save()
+        barrier.wait()
+
+        for _ in range(options["orders"]):
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=user.cart, product_id=product_id, quantity=1)
+                    for product_id in rng.sample(product_ids, min(options["items"], len(product_ids)))
+                ]
+            )
+            key = uuid.uuid4().hex
+            # The re-submits race the first submit, like a double click or a retry after a timeout
+            retries = [threading.Thread(target=submit, args=(client, key, "retry")) for _ in range(options["retries"])]
+            for thread in retries:
+                thread.start()
+            submit(client, key, "order")
+            for thread in retries:
+                thread.join()
+            CartItem.objects.filter(cart=user.cart).delete()
+    except Exception as e:
+        errors.append(repr(e))
+    finally:
+        connections.close_all()
+        results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Place orders through the checkout view from many concurrent users and report the latency percentiles. "
+        "Every order is submitted again with the same idempotency key, the command fails when a retry places a "
+        "second order, when the stock does not match the ordered quantities or when the p99 latency is over "
+        "its budget. Needs a database with row locks (PostgreSQL), the generated data is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20, help="Number of concurrent users.")
+        parser.add_argument("--orders", type=int, default=5, help="Number of orders placed by every user.")
+        parser.add_argument("--items", type=int, default=3, help="Number of cart items per order.")
+        parser.add_argument("--products", type=int, default=50, help="Number of products the carts are filled from.")
+        parser.add_argument("--retries", type=int, default=1, help="Number of concurrent re-submits of every order.")
+        parser.add_argument("--p99-budget", type=float, default=500.0, help="Allowed p99 latency of an order in ms.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random carts.")
+
+    def handle(self, *args, **options):
+        if not connection.features.has_select_for_update:
+            raise CommandError(f"The {connection.vendor} backend has no row locks, run this against PostgreSQL.")
+
+        setup_test_environment()
+        dataset = self.create_dataset(options["users"], options["products"], options["orders"] * options["items"])
+        try:
+            latencies, errors, elapsed = self.run_users(dataset, options)
+            self.verify(dataset, options, latencies, errors, elapsed)
+        finally:
+            self.delete_dataset(dataset)
+            teardown_test_environment()
+
+    def create_dataset(self, users: int, products: int, stock: int) -> dict:
+        self.stdout.write(f"Creating {users} users and {products} products ...")
+        category = ProductCategory.objects.create(title="load test", description="load test", logo="load.png")
+        # Enough stock for every user ordering the same product in every order
+        product_list = Product.objects.bulk_create(
+            [
+                Product(
+                    title=f"load test {index}", description="load test", category=category, stock=users * stock, price=100_000
+                )
+                for index in range(products)
+            ]
+        )
+        state = State.objects.create(title="load test")
+        city = City.objects.create(title="load test", state=state)
+        shipment_type = ShipmentType.objects.create(
+            title="load test", service_type=choice.SHIPMENT_SERVICE_TYPES[0][0], logo="load.png", price=100_000
+        )
+        user_list = []
+        for index in range(users):
+            user = User.objects.create(username=f"load_test_{index}", phone_number=f"0900{index:07d}")
+            Address.objects.create(user=user, title="load test", city=city)
+            user.cart = Cart.objects.create(user=user)
+            user_list.append(user)
+        return {
+            "category": category,
+            "products": product_list,
+            "state": state,
+            "city": city,
+            "shipment_type": shipment_type,
+            "users": user_list,
+        }
+
+    def run_users(self, dataset: dict, options: dict):
+        users = dataset["users"]
+        self.stdout.write(
+            f"Running {len(users)} users x {options['orders']} orders x {options['items']} items, "
+            f"{options['retries']} re-submits per order ..."
+        )
+        # One process per user, threads of a single process would mostly measure the GIL
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(len(users) + 1)
+        results = context.Queue()
+        product_ids = [product.id for product in dataset["products"]]
+        connections.close_all()
+        processes = [
+            context.Process(
+                target=run_user,
+                args=(index, user, dataset["shipment_type"].id, product_ids, options, barrier, results),
+            )
+            for index, user in enumerate(users)
+        ]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start = time.perf_counter()
+
+        latencies = {"order": [], "retry": []}
+        errors = []
+        for _ in processes:
+            user_latencies, user_errors = results.get()
+            for kind, values in user_latencies.items():
+                latencies[kind].extend(values)
+            errors.extend(user_errors)
+        elapsed = time.perf_counter() - start
+        for process in processes:
+            process.join()
+        return latencies, errors, elapsed
+
+    def verify(self, dataset: dict, options: dict, latencies: dict, errors: list, elapsed: float) -> None:
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(f"{'request':8} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        )
+        for kind, values in latencies.items():
+            if values:
+                self.stdout.write(
+                    f"{kind:8} {len(values):6} {statistics.median(values):9.1f} {percentile(values, 95):9.1f} "
+                    f"{percentile(values, 99):9.1f} {max(values):9.1f}"
+                )
+        orders = Order.objects.filter(user__in=dataset["users"])
+        self.stdout.write(f"{orders.count() / elapsed:.1f} orders/s over {elapsed:.2f}s (ms per request above).")
+
+        failures = [f"error: {error}" for error in errors[:20]]
+        expected = len(dataset["users"]) * options["orders"]
+        if orders.count() != expected:
+            failures.append(f"{orders.count()} orders placed, expected {expected}")
+
+        ordered = OrderItem.objects.filter(order__in=orders).aggregate(total=Sum("quantity"))["total"] or 0
+        initial = len(dataset["users"]) * options["orders"] * options["items"] * len(dataset["products"])
+        left = Product.objects.filter(id__in=[product.id for product in dataset["products"]]).aggregate(total=Sum("stock"))[
+            "total"
+        ]
+        if initial - left != ordered:
+            failures.append(f"{initial - left} taken from the stock, {ordered} ordered")
+
+        if latencies["order"]:
+            p99 = percentile(latencies["order"], 99)
+            if p99 > options["p99_budget"]:
+                failures.append(f"p99 {p99:.1f}ms, budget {options['p99_budget']:.1f}ms")
+
+        if failures:
+            raise CommandError("Checkout load test failed:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Every order was placed once and the p99 latency is within its budget."))
+
+    def delete_dataset(self, dataset: dict) -> None:
+        orders = Order.objects.filter(user__in=dataset["users"])
+        OrderItem.objects.filter(order__in=orders).delete()
+        OrderStatus.objects.filter(order__in=orders).delete()
+        OrderShipment.objects.filter(order__in=orders).delete()
+        orders.delete()
+        User.objects.filter(id__in=[user.id for user in dataset["users"]]).delete()
+        Product.objects.filter(id__in=[product.id for product in dataset["products"]]).delete()
+        dataset["category"].delete()
+        dataset["shipment_type"].delete()
+        dataset["city"].delete()
+        dataset["state"].delete()
@@ -6,3 +6,17 @@ register = template.Library()
 @register.filter
 def get_list(dictionary, key):
     return dictionary.getlist(key, int)
+
+
+@register.filter
+def get_item(dictionary, key):
+    """Dictionary lookup in templates, form choice values are looked up by their raw value."""
+    return dictionary.get(getattr(key, "value", key), 0)
+
+
+@register.simple_tag
+def query_replace(request, key, value):
+    """Returns the query string of the request with one parameter replaced, e.g. the pagination cursor."""
+    params = request.GET.copy()
+    params[key] = value
+    return params.urlencode()
@@ -1,5 +1,5 @@
 import json
-from datetime import datetime, timedelta
+import uuid
 from typing import Any, Dict, Optional
 
 from django.contrib import messages
@@ -8,14 +8,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from django.contrib.auth.views import LoginView
 from django.core.exceptions import ValidationError
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators import csrf
 from django.views.decorators.http import require_POST
-from jalali_date import date2jalali, datetime2jalali
 
 from apps.account.forms import EditAddressForm, EditProfileForm
 
@@ -39,15 +37,15 @@ from apps.blogs.queries import (
 
 # --- Carts App Queries ---
 from apps.carts.queries import (
-    add_or_update_cart_item,
-    get_cart,
     get_cart_item,
     get_cart_item_count,
-    get_cart_items,
     get_cart_items_total_price,
-    get_total_inside_cart,
+    get_request_cart,
+    get_request_cart_summary,
+    move_wishlist_to_cart,
+    promote_guest_cart,
     remove_from_cart_item,
-    update_cart_items_quantities,
+    upsert_cart_item,
 )
 
 # --- Slider App Queries ---
@@ -61,7 +59,10 @@ from apps.info.queries import get_about_us_data, get_faq_groups, get_privacy_pol
 
 # --- Order App Queries ---
 from apps.messaging.queries import get_notification, get_notifications, seen_user_message
-from apps.order.queries import get_orders_by_user, place_order
+from apps.order.errors import InsufficientStock
+from apps.order.history import get_order_history_page
+from apps.order.models.order import IDEMPOTENCY_KEY_MAX_LENGTH
+from apps.order.queries import get_order_by_idempotency_key, place_order
 
 # --- Product App Queries ---
 from apps.products.filters import ProductListFilter
@@ -69,7 +70,6 @@ from apps.products.queries import (
     add_or_remove_product_from_wishlist,
     create_product_review,
     get_all_products,
-    get_best_offer,
     get_product,
     get_product_categories,
     get_product_category,
@@ -88,8 +88,8 @@ from apps.promotions.queries import calculate_cart_discount, coupon_validate, ge
 
 # --- Shipments App Queries ---
 from apps.shipments.queries import get_active_shipment_types
-from core import choice
-from core.http import get_session_key, get_user
+from core.http import get_user
+from core.pagination import InvalidCursor, KeysetPage, get_keyset_page
 
 
 @login_required
@@ -186,6 +186,12 @@ class loginView(LoginView):
     def get_success_url(self) -> str:
         return reverse_lazy("home")
 
+    def form_valid(self, form: AuthenticationForm) -> HttpResponse:
+        response = super().form_valid(form)
+        # Move the guest cart kept in Redis into the user's cart
+        promote_guest_cart(self.request)
+        return response
+
     def form_invalid(self, form: AuthenticationForm) -> HttpResponse:
         messages.error(self.request, _("Invalid username or password"))
         return self.render_to_response(self.get_context_data(form=form))
@@ -267,7 +273,8 @@ def category_view(request: HttpRequest, category_id) -> HttpResponse:
     # print(subcategories)
     context = {
         "categories": subcategories,
-        "products": qs.qs,
+        "products": get_keyset_page(request, qs.qs, 12, estimate_total=True),
+        "facets": qs.get_facets(f"category:{category.id}"),
     }
 
     return render(request, "front_shop/category.html", context)
@@ -293,8 +300,9 @@ def shopgrid_view(request: HttpRequest) -> HttpResponse:
 
     context = {
         "categories": categories,
-        "products": filters.qs,
+        "products": get_keyset_page(request, filters.qs, 12, estimate_total=True),
         "filters": filters,
+        "facets": filters.get_facets("all"),
     }
 
     return render(request, "front_shop/shop-grid.html", context)
@@ -325,7 +333,6 @@ def single_product_review_view(request: HttpRequest, product_id: int) -> HttpRes
 # --- Single Product page View ---
 def single_product_view(request: HttpRequest, product_id: int) -> HttpResponse:
     # Fetch product details using the query function
-    session_key = get_session_key(request)
     user = get_user(request)
     product_details = get_product_details_by_id(product_id, user)
 
@@ -338,9 +345,10 @@ def single_product_view(request: HttpRequest, product_id: int) -> HttpResponse:
     related_products = get_related_products(product_id)
     # Get reviews for the product from queries.py
     product_reviews = get_product_reviews(product)
-    offer = get_best_offer(product)
+    offer = product.best_offer
 
-    total_inside_cart = get_total_inside_cart(product, request.user, session_key)
+    cart_item = get_cart_item(get_request_cart(request, create=False), product)
+    total_inside_cart = cart_item.quantity if cart_item else 0
     # print(product_reviews)
     # Pass the grouped properties to the context instead of ungrouped ones
     context = {
@@ -370,58 +378,43 @@ def single_product_view(request: HttpRequest, product_id: int) -> HttpResponse:
 def add_product_to_cart_ajax(request: HttpRequest, product_id: int) -> HttpResponse:
     """Add or update a product in the user's cart via AJAX."""
     quantity = int(request.POST.get("quantity", 1))
-    session_key = get_session_key(request)
-
-    user = request.user if request.user.is_authenticated else None
-    user_cart = get_cart(user, session_key)
-    product = get_product(product_id)
+    user_cart = get_request_cart(request)
     # print(quantity, request.POST, request.GET, request.content_params)
     if quantity < 1:
-        remove_from_cart_item(product, user_cart)
+        remove_from_cart_item(product_id, user_cart)
+        quantity, cart_item_count = 0, get_cart_item_count(user_cart)
     else:
-        _cart_item = add_or_update_cart_item(
-            product=product,
-            quantity=quantity,
-            cart=user_cart,
-        )
+        # Single upsert clamped to the stock, returns the new quantity and the cart count
+        quantity, cart_item_count = upsert_cart_item(user_cart, product_id, quantity)
     # Clear the coupon if product is removed
     remove_coupon(request)
-    return HttpResponse(quantity)
+    return cart_item_count_response(quantity, cart_item_count)
 
 
 @csrf.csrf_exempt
 def quick_add_product_to_cart_ajax(request: HttpRequest, product_id: int) -> HttpResponse:
     """Add or update a product in the user's cart via AJAX."""
 
-    session_key = get_session_key(request)
+    user_cart = get_request_cart(request)
+    quantity, cart_item_count = upsert_cart_item(user_cart, product_id, 1, increment=True)
 
-    user = request.user if request.user.is_authenticated else None
-    user_cart = get_cart(user, session_key)
-    product = get_product(product_id)
-    item = get_cart_item(user_cart, product)
-    quantity = item.quantity if item else 0
-    new_quantity = quantity + 1
-
-    _cart_item = add_or_update_cart_item(
-        product=product,
-        quantity=new_quantity,
-        cart=user_cart,
-    )
+    return cart_item_count_response(quantity, cart_item_count)
 
-    return HttpResponse(quantity)
+
+def cart_item_count_response(quantity: int, cart_item_count: int) -> HttpResponse:
+    """
+    Response of the cart mutations, the new quantity of the product, and the cart count in the `HX-Trigger`
+    header (a `cartItemCount` event), so the cart badge is updated without another request.
+    """
+    return HttpResponse(quantity, headers={"HX-Trigger": json.dumps({"cartItemCount": cart_item_count})})
 
 
 def get_cart_item_count_view(request: HttpRequest) -> HttpResponse:
     """
     Returns the current cart item count via HTMX request.
     """
-    session_key = get_session_key(request)
-
-    user_cart = get_cart(request.user, session_key)
-    update_cart_items_quantities(user_cart)
-
-    # Get the count of items in the cart
-    cart_item_count = get_cart_item_count(user_cart)
+    # Get the count of items in the cart, quantities are clamped to the stock
+    cart_item_count = get_request_cart_summary(request)["item_count"]
 
     return HttpResponse(cart_item_count)
 
@@ -429,11 +422,8 @@ def get_cart_item_count_view(request: HttpRequest) -> HttpResponse:
 @csrf.csrf_exempt
 def remove_product_from_cart_ajax(request: HttpRequest, product_id: int) -> HttpResponse:
     """Remove a product from the user's cart via AJAX."""
-    session_key = get_session_key(request)
-
-    user_cart = get_cart(request.user, session_key)
-    product = get_product(product_id)
-    remove_from_cart_item(product, user_cart)
+    user_cart = get_request_cart(request)
+    remove_from_cart_item(product_id, user_cart)
     # Clear the coupon if product is removed
     remove_coupon(request)
     return HttpResponse()
@@ -441,24 +431,16 @@ def remove_product_from_cart_ajax(request: HttpRequest, product_id: int) -> Http
 
 def cart_view(request: HttpRequest) -> HttpResponse:
     """Render the cart page with items, total price, and apply coupon logic."""
-    # Fetch cart items
-    session_key = get_session_key(request)
-    cart = get_cart(request.user, session_key)
-    update_cart_items_quantities(cart)
-    items = get_cart_items(cart)
+    # Fetch cart items and the total price (after applying coupon if available)
+    summary = get_request_cart_summary(request)
     coupon_code = request.session.get("coupon_code")
-    coupon_obj = get_coupon_by_code(coupon_code) if coupon_code else None
+    total_price = summary["total_price"]
 
-    # Fetch the total price of the items in the cart (after applying coupon if available)
-    result = get_cart_items_total_price(cart, coupon_obj)
-    # Access individual variables
-    total_price = result["total_price"]
-
-    has_coupon = result["coupon_id"]
+    has_coupon = summary["coupon_id"]
 
     # Prepare context
     context = {
-        "items": items,
+        "items": summary["items"],
         "total_price": total_price,
         "has_coupon": has_coupon,
         "coupon_code": coupon_code or "",
@@ -469,15 +451,7 @@ def cart_view(request: HttpRequest) -> HttpResponse:
 
 def cart_total_price_ajax(request: HttpRequest) -> HttpResponse:
     """Returns the total price of items in the user's cart as a formatted string."""
-    session_key = get_session_key(request)
-
-    cart = get_cart(request.user, session_key)
-    update_cart_items_quantities(cart)
-
-    coupon_code = request.session.get("coupon_code")
-    coupon_obj = get_coupon_by_code(coupon_code) if coupon_code else None
-
-    total_price = int(get_cart_items_total_price(cart, coupon_obj)["total_price"])
+    total_price = int(get_request_cart_summary(request)["total_price"])
     p = f"{total_price:,}"
     return HttpResponse(p)
 
@@ -489,18 +463,14 @@ def checkout_view(request: HttpRequest) -> HttpResponse:
     Ensures user profile is complete before proceeding.
     """
     user = request.user
+    # Move a guest cart that was not promoted at login, e.g. when the user logged in elsewhere
+    promote_guest_cart(request)
 
     # Fetch user details
     address = get_user_address(user)
     shipment_types = get_active_shipment_types()
-    coupon_code = request.session.get("coupon_code")
-    session_key = get_session_key(request)
-    cart = get_cart(user, session_key)
-    coupon_obj = get_coupon_by_code(coupon_code) if coupon_code else None
     # Fetch the total price of the items in the cart (after applying coupon if available)
-    result = get_cart_items_total_price(cart, coupon_obj)
-    # Access individual variables
-    total_price = result["total_price"]
+    total_price = get_request_cart_summary(request)["total_price"]
 
     # Check if the profile is complete
     profile_incomplete = not all((user.get_full_name(), user.email, user.phone_number, address))
@@ -537,8 +507,9 @@ def payment_method_cash(request: HttpRequest) -> HttpResponse:
     Handles the cash on delivery payment method selection during checkout.
     Renders the checkout-cash.html page.
     """
-    # You can add any context or logic here if needed
-    return render(request, "front_shop/checkout-cash.html")
+    # A fresh key per rendered form, a double submit or a retry of this form places the order only once
+    context = {"idempotency_key": uuid.uuid4().hex}
+    return render(request, "front_shop/checkout-cash.html", context)
 
 
 @login_required
@@ -559,13 +530,11 @@ def payment_failed(request: HttpRequest) -> HttpResponse:
 
 def apply_coupon(request: HttpRequest) -> JsonResponse:
     """Apply coupon and update the total price of the cart."""
-    session_key = get_session_key(request)
-
     if request.method == "POST":
         data = json.loads(request.body)  # Parse JSON data from the request
         coupon_code = data.get("coupon_code", "").strip()
         # Get the user's cart
-        cart = get_cart(request.user, session_key)
+        cart = get_request_cart(request, create=False)
         # print(f"{coupon_code=:}")
         try:
             # Get the total price with the coupon applied
@@ -706,51 +675,14 @@ def edit_profile_view(request: HttpRequest) -> HttpResponse:
 @login_required
 def my_orders_view(request: HttpRequest) -> HttpResponse:
     user = request.user
-    orders = get_orders_by_user(user)
-    # Map order status type to display data
-    ORDER_STATUS_MAP = {
-        0: {"icon": "ti ti-basket"},
-        1: {"icon": "ti ti-box"},
-        2: {"icon": "ti ti-box"},
-        3: {"icon": "ti ti-trolley"},
-        4: {"icon": "ti ti-truck-delivery"},
-        5: {"icon": "ti ti-building-store"},
-        6: {"icon": "ti ti-heart-check"},
-        7: {"icon": "ti ti-alert-circle"},
-    }
-
-    orders_data = []
-
-    for order in orders:
-        statuses = order.order_statuses.all().exclude(type=choice.ORDER_STATUS_PAYMENT_WAITING).order_by("type")
-        status_data = []
-        for status in statuses:
-            status_info = ORDER_STATUS_MAP.get(status.type, {})
-            estimated_time = status.estimated_time
-            if not estimated_time:
-                estimated_time = datetime.now() + timedelta(days=status.type)
-            estimated_time = date2jalali(estimated_time).strftime("%d %b %Y")
-            timestamp = datetime2jalali(status.timestamp).strftime("%d %b %Y - %I:%M %p") if status.timestamp else None
-
-            data = {
-                "icon": status_info.get("icon"),
-                "label": status.get_type_display(),
-                "timestamp": timestamp,
-                "estimated_time": estimated_time,
-                "active": order.current_status >= status.type,  # Mark the most recent status as active
-            }
-            status_data.append(data)
-
-        orders_data.append(
-            {
-                "order": order,
-                "current_status": order.current_status,
-                "statuses": status_data,
-            }
-        )
+    # The timelines come prefetched, sorted and formatted from the per user order history cache
+    try:
+        history = get_order_history_page(user, request.GET.get("cursor"))
+    except InvalidCursor:
+        history = get_order_history_page(user)
 
     context = {
-        "orders": orders_data,
+        "orders": KeysetPage(history["orders"], None, history["next_cursor"], history["previous_cursor"]),
         "user": user,
     }
     return render(request, "front_shop/my-orders.html", context)
@@ -761,51 +693,38 @@ def create_order_view(request):
     """
     View to create an order by reading variables from the session and returning an HTTP response.
     """
-    session_key = get_session_key(request)
     # Read required variables from the session
     user = request.user
+    idempotency_key: Optional[str] = request.POST.get("idempotency_key") or None
+    if idempotency_key and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return HttpResponseBadRequest(_("Invalid idempotency key."))
+    if idempotency_key and get_order_by_idempotency_key(user, idempotency_key):
+        # Already placed by an earlier submit of the same form
+        return redirect("payment-success")
+
     address = get_user_address(user)
-    coupon_code = request.session.get("coupon_code")
-    cart = get_cart(user, session_key)
-    coupon_obj = get_coupon_by_code(coupon_code) if coupon_code else None
-    cart_info = get_cart_items_total_price(cart, coupon_obj)
+    cart_info = get_request_cart_summary(request)
+    cart = cart_info["cart"]
 
-    cart_items: list[dict] = get_cart_items(cart)
+    cart_items: list = cart_info["items"]
+    if not cart_items:
+        return redirect("cart")
     shipment_id: Optional[str] = request.session.get("selected_shipment_id")
-    status_type: Optional[int] = 0  #  '0' payment waiting - need to change later
-
-    # estimated_delivery_time: Optional[str] = request.session.get("estimated_delivery_time")
-    # print(
-    #     dict(
-    #         user=user,
-    #         address=address,
-    #         coupon=coupon_obj,
-    #         product_total_price=cart_info["product_total_price"],
-    #         coupon_total_discount=cart_info["coupon_total_discount"],
-    #         product_total_discount=cart_info["product_total_discount"],
-    #         total_price=cart_info["total_price"],
-    #         cart_items=cart_items,
-    #         shipment_id=shipment_id,
-    #         status_type=status_type,
-    #         estimated_delivery_time=None,  # Optional, can be None
-    #         note=None,
-    #     )
-    # )
+
     # Place the order
     try:
         place_order(
             user=user,
             address=address,
-            coupon=coupon_obj,
+            coupon=cart_info["coupon"],
             product_total_price=cart_info["product_total_price"],
             coupon_total_discount=cart_info["coupon_total_discount"],
             product_total_discount=cart_info["product_total_discount"],
             total_price=cart_info["total_price"],
             cart_items=cart_items,
             shipment_id=shipment_id,
-            status_type=status_type,
-            estimated_delivery_time=None,  # Optional, can be None
             note=None,
+            idempotency_key=idempotency_key,
         )
 
         # Clean UP
@@ -817,6 +736,16 @@ def create_order_view(request):
         # Redirect to the payment success page with the order details
         return redirect("payment-success")
 
+    except ValidationError as e:
+        # The coupon was used up by concurrent orders, nothing was placed, the cart can be ordered without it
+        remove_coupon(request)
+        return render(request, "front_shop/payment-failed.html", {"error": e.message}, status=409)
+
+    except InsufficientStock:
+        # Sold out by concurrent orders, nothing was placed, the message leaves out the product ids
+        error = _("Some items in your cart are out of stock.")
+        return render(request, "front_shop/payment-failed.html", {"error": error}, status=409)
+
     except RuntimeError as e:
         # print(e)
         return render(request, "front_shop/payment-failed.html", {"error": str(e)}, status=500)
@@ -835,7 +764,7 @@ def shoplist_view(request: HttpRequest) -> HttpResponse:
     # Prepare the context data
     context = {
         "categories": categories,
-        "products": products,
+        "products": get_keyset_page(request, products, 12, estimate_total=True),
     }
 
     # Render the template with the products context
@@ -843,7 +772,9 @@ def shoplist_view(request: HttpRequest) -> HttpResponse:
 
 
 def my_notification_view(request: HttpRequest) -> HttpResponse:
-    notifications = get_notifications(request.user).order_by("is_seen", "-created_at") if request.user.is_authenticated else []
+    notifications = []
+    if request.user.is_authenticated:
+        notifications = get_keyset_page(request, get_notifications(request.user).order_by("is_seen", "-created_at"), 20)
     # Prepare the context data
     context = {
         "notifs": notifications,
@@ -879,12 +810,8 @@ def toggle_heart_wishlist_ajax(request: HttpRequest, product_id: int) -> HttpRes
 @login_required
 def check_product_in_wishlist_ajax(request: HttpRequest, product_id: int) -> HttpResponse:
     """Check if a product is in the user's wishlist and return the heart icon HTML."""
-    user = request.user
-    product = get_product(product_id)
-    if not product:
-        return HttpRequest(0)
-
-    product_in_wishlist = is_product_in_wishlist(user=user, product=product)
+    # A lookup in the user's cached wishlist ids, a missing product is never in the wishlist
+    product_in_wishlist = is_product_in_wishlist(user=request.user, product=product_id)
 
     return HttpResponse(product_in_wishlist)
 
@@ -896,7 +823,7 @@ def user_wishlist_list_view(request: HttpRequest) -> HttpResponse:
 
     # Prepare the context data
     context = {
-        "products": products,
+        "products": get_keyset_page(request, products, 12),
     }
 
     return render(request, "front_shop/wishlist-list.html", context)
@@ -904,17 +831,9 @@ def user_wishlist_list_view(request: HttpRequest) -> HttpResponse:
 
 @login_required
 def user_wishlist_list_add_to_cart_view(request: HttpRequest) -> HttpResponse:
-    user = get_user(request)
-    products = get_user_wishlist(user)
-    cart = get_cart(user)
-    [add_or_update_cart_item(p, 1, cart) for p in products]
-
-    # Prepare the context data
-    context = {
-        "products": products,
-    }
-
-    return render(request, "front_shop/wishlist-list.html", context)
+    # Add the whole wishlist in a single statement, then show the (paginated) wishlist again
+    move_wishlist_to_cart(request.user, get_request_cart(request))
+    return redirect("wishlist-list")
 
 
 def blog_list_view(request: HttpRequest) -> HttpResponse:
@@ -980,26 +899,10 @@ def blog_detail_view(request: HttpRequest, post_id: int) -> HttpResponse:
 # Search view that handles the search results
 def search_view(request):
     query = request.GET.get("query", "").strip()  # Get query from GET request
-    page_number = request.GET.get("page", 1)  # Default to page 1
-
-    if not query:
-        # If no query is provided, return empty results
-        products = []
-        total_pages = 1
-    else:
-        # Perform search based on the query
-        products = search_products(query)
-
-        # Paginate results
-        paginator = Paginator(products, 9)  # Show 9 results per page
-        try:
-            page_products = paginator.page(page_number)
-        except PageNotAnInteger:
-            page_products = paginator.page(1)  # Return first page if invalid page number
-        except EmptyPage:
-            page_products = paginator.page(paginator.num_pages)  # Return last page if out of range
 
-        total_pages = paginator.num_pages  # Get total number of pages
+    # Perform search based on the query, paginated by cursor without OFFSET or exact COUNT
+    # If no query is provided, return empty results
+    page_products = get_keyset_page(request, search_products(query), 9, estimate_total=True) if query else []
 
     return render(
         request,
@@ -1007,7 +910,6 @@ def search_view(request):
         {
             "query": query,
             "products": page_products,
-            "total_pages": total_pages,
         },
     )
 
@@ -11,9 +11,11 @@ from core.admin import BaseModelAdmin
 
 from .forms import AddToGroupForm
 from .models import (
+    FailedSms,
     Group,
     GroupMessage,
     GroupUser,
+    OutgoingEmail,
     UserDevice,
     UserMessage,
 )
@@ -43,7 +45,33 @@ class GroupMessageAdmin(BaseModelAdmin):
         "send_notification",
         "send_email",
         "send_sms",
+        "fanout_count",
+        "fanout_completed_at",
     )
+    readonly_fields = ("fanout_cursor", "fanout_delivered_cursor", "fanout_count", "fanout_completed_at")
+
+
+@admin.register(FailedSms)
+class FailedSmsAdmin(BaseModelAdmin):
+    list_display = ("id", "attempts", "retry_at", "error", "created_at")
+    list_filter = ("retry_at",)
+    readonly_fields = ("receptors", "message", "error", "attempts")
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(BaseModelAdmin):
+    list_display = ("id", "to", "subject", "status", "attempts", "send_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to",)
+    # The bodies carry verification and password reset codes, they are never shown
+    exclude = ("body", "html_body")
+    readonly_fields = ("to", "subject", "status", "attempts", "error", "send_at", "sent_at", "is_active")
+
+    def has_add_permission(self, request, *args):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(UserMessage)
@@ -3,3 +3,38 @@ from django.conf import settings
 KAVENEGAR_APIKEY = getattr(settings, "MESSAGING_KAVENEGAR_APIKEY", "not-set")
 NAJVA_APIKEY = getattr(settings, "MESSAGING_NAJVA_APIKEY", "not-set")
 NAJVA_TOKEN = getattr(settings, "MESSAGING_NAJVA_TOKEN", "not-set")
+# Number of group members handled per fan-out step, one insert and one delivery task per channel each
+FANOUT_CHUNK_SIZE = getattr(settings, "MESSAGING_FANOUT_CHUNK_SIZE", 1000)
+# A fan-out without progress for this many seconds is considered crashed and is resumed
+FANOUT_STALLED_AFTER = getattr(settings, "MESSAGING_FANOUT_STALLED_AFTER", 60 * 10)
+
+# Najva push API, the url can point to a local stub (`run_najva_stub` command) for offline benchmarks
+NAJVA_API_URL = getattr(
+    settings, "MESSAGING_NAJVA_API_URL", "https://app.najva.com/api/v2/notification/management/send-direct/"
+)
+# (connect, read) timeouts of a push request in seconds
+NAJVA_TIMEOUT = getattr(settings, "MESSAGING_NAJVA_TIMEOUT", (5, 30))
+NAJVA_RETRIES = getattr(settings, "MESSAGING_NAJVA_RETRIES", 3)
+NAJVA_BACKOFF = getattr(settings, "MESSAGING_NAJVA_BACKOFF", 0.5)
+# Number of push requests sent at the same time, and of subscribers per request
+NAJVA_CONCURRENCY = getattr(settings, "MESSAGING_NAJVA_CONCURRENCY", 8)
+NAJVA_BATCH_SIZE = getattr(settings, "MESSAGING_NAJVA_BATCH_SIZE", 1000)
+# A push is sent by this many dispatches at most, each request already retried `MESSAGING_NAJVA_RETRIES` times
+NAJVA_MAX_ATTEMPTS = getattr(settings, "MESSAGING_NAJVA_MAX_ATTEMPTS", 10)
+
+# SMS provider class, `apps.messaging.sms.FakeSmsProvider` sends nothing and suits tests and benchmarks
+SMS_PROVIDER = getattr(settings, "MESSAGING_SMS_PROVIDER", "apps.messaging.sms.KavenegarSmsProvider")
+# Provider quota shared by all workers: send calls per second and the allowed burst
+SMS_RATE = getattr(settings, "MESSAGING_SMS_RATE", 5)
+SMS_BURST = getattr(settings, "MESSAGING_SMS_BURST", 10)
+# (connect, read) timeouts of a send call in seconds
+SMS_TIMEOUT = getattr(settings, "MESSAGING_SMS_TIMEOUT", (5, 30))
+# Failed sends are retried this many times, the delay doubles from `MESSAGING_SMS_RETRY_DELAY` seconds
+SMS_MAX_ATTEMPTS = getattr(settings, "MESSAGING_SMS_MAX_ATTEMPTS", 5)
+SMS_RETRY_DELAY = getattr(settings, "MESSAGING_SMS_RETRY_DELAY", 60)
+
+# Emails of the outbox sent per database round trip, all of a drain share one SMTP connection
+EMAIL_BATCH_SIZE = getattr(settings, "MESSAGING_EMAIL_BATCH_SIZE", 100)
+# Failed emails are attempted this many times, the delay doubles from `MESSAGING_EMAIL_RETRY_DELAY` seconds
+EMAIL_MAX_ATTEMPTS = getattr(settings, "MESSAGING_EMAIL_MAX_ATTEMPTS", 5)
+EMAIL_RETRY_DELAY = getattr(settings, "MESSAGING_EMAIL_RETRY_DELAY", 60)
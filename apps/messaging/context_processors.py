@@ -1,10 +1,14 @@
 from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
 
-from .queries import get_notifications
+from .unread import get_unread_count
 
 
-def total_notifications(request: HttpRequest) -> int:
-    if request.user.is_anonymous:
-        return {"total_notifs": 0}
-    total_notifs: int = get_notifications(user=request.user).filter(is_seen=False).count()
-    return {"total_notifs": total_notifs}
+def total_notifications(request: HttpRequest) -> dict:
+    def get_total_notifs() -> int:
+        if request.user.is_anonymous:
+            return 0
+        return get_unread_count(request.user.id)
+
+    # Read from the unread counter, and only when a template renders it
+    return {"total_notifs": SimpleLazyObject(get_total_notifs)}
@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .api_setting import FANOUT_CHUNK_SIZE, FANOUT_STALLED_AFTER
+from .models import GroupMessage, GroupUser, UserMessage
+from .tasks import (
+    create_child_messages_for_group,
+    send_email_batch_task,
+    send_notification_batch_task,
+    send_sms_batch_task,
+)
+from .unread import change_unread_counts
+
+
+def fan_out_group_message(group_message_id: int, chunk_size: int = FANOUT_CHUNK_SIZE) -> int:
+    """
+    Creates a `UserMessage` for every member of the group of the message, chunk by chunk.
+    Every chunk reads the next members after the cursor (keyset on user id), inserts their messages with one
+    bulk insert and moves the cursor in one transaction, so a crashed fan-out resumes where it stopped
+    without creating a message twice. The group message row is locked per chunk, concurrent runs of the same
+    fan-out wait for each other.
+
+    The deliveries of a chunk are enqueued in the next transaction, under the same lock, as one task per channel,
+    together with moving the delivered cursor. A chunk whose deliveries were not enqueued (broker outage, worker
+    crash) is enqueued again by the next run before any new chunk, so deliveries are at least once, while two
+    concurrent runs never enqueue the same chunk. The fan-out is completed only once every chunk is delivered.
+
+    Returns:
+        int: Number of messages created by this run.
+    """
+    created = 0
+    while True:
+        with transaction.atomic():
+            group_message = (
+                GroupMessage.objects.select_for_update()
+                .filter(id=group_message_id, fanout_completed_at__isnull=True)
+                .order_by()
+                .first()
+            )
+            if group_message is None:
+                break
+
+            now = timezone.now()
+            if group_message.fanout_delivered_cursor < group_message.fanout_cursor:
+                # The messages of the chunk exist, only the deliveries are missing. A failure rolls back the
+                # delivered cursor, the chunk is enqueued again by the next run
+                user_ids = list(
+                    GroupUser.objects.filter(
+                        group_id=group_message.group_id,
+                        user_id__gt=group_message.fanout_delivered_cursor,
+                        user_id__lte=group_message.fanout_cursor,
+                    )
+                    .order_by("user_id")
+                    .values_list("user_id", flat=True)
+                )
+                if user_ids:
+                    enqueue_group_message_deliveries(group_message, user_ids)
+                GroupMessage.objects.filter(id=group_message.id).update(
+                    fanout_delivered_cursor=group_message.fanout_cursor, updated_at=now
+                )
+                continue
+
+            user_ids = list(
+                GroupUser.objects.filter(group_id=group_message.group_id, user_id__gt=group_message.fanout_cursor)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                GroupMessage.objects.filter(id=group_message.id).update(fanout_completed_at=now, updated_at=now)
+                break
+
+            UserMessage.objects.bulk_create(
+                [
+                    UserMessage(
+                        user_id=user_id,
+                        title=group_message.title,
+                        content=group_message.content,
+                        send_in_app=group_message.send_in_app,
+                        send_notification=group_message.send_notification,
+                        send_email=group_message.send_email,
+                        send_sms=group_message.send_sms,
+                    )
+                    for user_id in user_ids
+                ]
+            )
+            GroupMessage.objects.filter(id=group_message.id).update(
+                fanout_cursor=user_ids[-1], fanout_count=F("fanout_count") + len(user_ids), updated_at=now
+            )
+        created += len(user_ids)
+    return created
+
+
+def enqueue_group_message_deliveries(group_message: GroupMessage, user_ids: list[int]) -> None:
+    """
+    Enqueues one delivery task per enabled channel for the recipients, instead of a task per message.
+    In-app messages are counted in the unread counters of the recipients, bulk inserts skip the model hooks.
+    """
+    if group_message.send_in_app:
+        change_unread_counts(user_ids)
+    if group_message.send_notification:
+        send_notification_batch_task.delay(user_ids, group_message.title, group_message.content)
+    if group_message.send_email:
+        send_email_batch_task.delay(user_ids, group_message.title, group_message.content)
+    if group_message.send_sms:
+        send_sms_batch_task.delay(user_ids, group_message.content)
+
+
+def resume_stalled_fanouts() -> int:
+    """
+    Enqueues the fan-out again for group messages that are not completed and made no progress for
+    `MESSAGING_FANOUT_STALLED_AFTER` seconds, i.e. whose worker died.
+
+    Returns:
+        int: Number of resumed fan-outs.
+    """
+    stalled = GroupMessage.objects.filter(
+        fanout_completed_at__isnull=True,
+        updated_at__lt=timezone.now() - timedelta(seconds=FANOUT_STALLED_AFTER),
+    ).values_list("id", flat=True)
+    resumed = 0
+    for group_message_id in stalled:
+        create_child_messages_for_group.delay(group_message_id)
+        resumed += 1
+    return resumed
@@ -0,0 +1,78 @@
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.messaging.api_setting import NAJVA_API_URL, NAJVA_BATCH_SIZE, NAJVA_CONCURRENCY
+from apps.messaging.najva_stub import NajvaStubServer
+from apps.messaging.push import dispatch_pending_pushes, queue_push
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the batched push dispatcher offline against a local Najva stub started on the host and port "
+        "of MESSAGING_NAJVA_API_URL, which must point at 127.0.0.1 or localhost. Compares it with sending one "
+        "request per push over a new connection. Needs Redis for the pending pushes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pushes", type=int, default=20_000, help="Number of queued pushes (device tokens).")
+        parser.add_argument("--contents", type=int, default=4, help="Number of distinct push contents.")
+        parser.add_argument("--batch-size", type=int, default=NAJVA_BATCH_SIZE, help="Subscribers per request.")
+        parser.add_argument("--concurrency", type=int, default=NAJVA_CONCURRENCY, help="Concurrent requests.")
+        parser.add_argument("--latency", type=float, default=50.0, help="Response time of the stub in ms.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of stub responses that are 503.")
+        parser.add_argument("--baseline", type=int, default=100, help="Number of pushes sent one request at a time.")
+
+    def handle(self, *args, **options):
+        address = urlsplit(NAJVA_API_URL)
+        if address.hostname not in ("127.0.0.1", "localhost"):
+            raise CommandError(
+                f"MESSAGING_NAJVA_API_URL is {NAJVA_API_URL}, point it at a local port (e.g. http://127.0.0.1:8765/) "
+                "so no real push is sent."
+            )
+
+        server = NajvaStubServer((address.hostname, address.port or 80), options["latency"] / 1000, options["error_rate"])
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            if options["baseline"]:
+                self.run_baseline(options["baseline"])
+            self.run_dispatcher(server, options)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def run_baseline(self, pushes: int) -> None:
+        # The previous delivery: one request per push, a new connection every time
+        start = time.perf_counter()
+        for _ in range(pushes):
+            requests.post(NAJVA_API_URL, json={"subscribers": [str(uuid.uuid4())]}, timeout=60)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"one request per push: {pushes} pushes in {elapsed:.2f}s, {pushes / elapsed:.0f} pushes/s")
+
+    def run_dispatcher(self, server: NajvaStubServer, options: dict) -> None:
+        for index in range(options["contents"]):
+            queue_push(
+                [str(uuid.uuid4()) for _ in range(options["pushes"] // options["contents"])],
+                f"benchmark {index}",
+                "benchmark push",
+            )
+        server.requests = server.subscribers = 0
+
+        start = time.perf_counter()
+        runs = retried = 0
+        # Failed batches are queued again, dispatch until everything is accepted
+        while True:
+            result = dispatch_pending_pushes(options["batch_size"], options["concurrency"])
+            if not result["requests"]:
+                break
+            runs += 1
+            retried += result["retried"]
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"batched dispatcher: {server.subscribers} pushes in {server.requests} requests over {runs} runs "
+            f"({retried} retried) in {elapsed:.2f}s, {server.subscribers / elapsed:.0f} pushes/s"
+        )
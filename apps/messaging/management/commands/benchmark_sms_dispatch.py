@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.messaging.api_setting import SMS_BURST, SMS_RATE
+from apps.messaging.sms import FakeSmsProvider, send_bulk_sms
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the bulk SMS dispatcher offline against the fake provider, through the shared rate limiter "
+        "(MESSAGING_SMS_RATE calls/s). Compares it with one provider call per message. Needs Redis for the rate "
+        "limiter, failed calls are recorded as failed sms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--receptors", type=int, default=10_000, help="Number of receptors of the message.")
+        parser.add_argument("--latency", type=float, default=200.0, help="Response time of the fake provider in ms.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of failed provider calls.")
+        parser.add_argument("--baseline", type=int, default=20, help="Number of messages sent one call at a time.")
+
+    def handle(self, *args, **options):
+        provider = FakeSmsProvider(options["latency"] / 1000, options["error_rate"])
+        receptors = [f"0912{index:07d}" for index in range(options["receptors"])]
+
+        if options["baseline"]:
+            # The previous delivery: one blocking call per message
+            start = time.perf_counter()
+            for receptor in receptors[: options["baseline"]]:
+                FakeSmsProvider(provider.latency).send([receptor], "benchmark sms")
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"one call per message: {options['baseline']} messages in {elapsed:.2f}s, "
+                f"{options['baseline'] / elapsed:.1f} messages/s"
+            )
+
+        start = time.perf_counter()
+        result = send_bulk_sms(receptors, "benchmark sms", provider=provider)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"bulk dispatcher: {result['sent']} messages ({result['failed']} failed) in {result['calls']} calls "
+            f"in {elapsed:.2f}s, {len(receptors) / elapsed:.0f} messages/s, limited to {SMS_RATE} calls/s "
+            f"with bursts of {SMS_BURST}"
+        )
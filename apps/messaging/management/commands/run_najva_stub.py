@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from apps.messaging.najva_stub import NajvaStubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stub of the Najva push API for offline benchmarks, point MESSAGING_NAJVA_API_URL at it "
+        "(e.g. http://127.0.0.1:8765/)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+        parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+        parser.add_argument("--latency", type=float, default=50.0, help="Response time of every request in ms.")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503.")
+
+    def handle(self, *args, **options):
+        server = NajvaStubServer((options["host"], options["port"]), options["latency"] / 1000, options["error_rate"])
+        self.stdout.write(f"Najva stub listening on http://{options['host']}:{options['port']}/, Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Accepted {server.requests} requests for {server.subscribers} subscribers.")
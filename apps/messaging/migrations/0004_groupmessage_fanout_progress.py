@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def forwards_func(apps, schema_editor):
+    # Group messages created before were already fanned out one message at a time, they must not be resumed
+    GroupMessage = apps.get_model("messaging", "GroupMessage")
+    db_alias = schema_editor.connection.alias
+    GroupMessage.objects.using(db_alias).update(fanout_completed_at=Coalesce("created_at", Now()))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0003_alter_usermessage_event_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="groupmessage",
+            name="fanout_completed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="fan-out completed at"),
+        ),
+        migrations.AddField(
+            model_name="groupmessage",
+            name="fanout_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="fan-out count"),
+        ),
+        migrations.AddField(
+            model_name="groupmessage",
+            name="fanout_cursor",
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name="fan-out cursor"),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:22
+
+import django_lifecycle.mixins
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0004_groupmessage_fanout_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FailedSms",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True, null=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True, verbose_name="Updated at")),
+                ("is_active", models.BooleanField(db_index=True, default=True, verbose_name="Is active")),
+                ("receptors", models.JSONField(default=list, verbose_name="receptors")),
+                ("message", models.TextField(verbose_name="message")),
+                ("error", models.TextField(blank=True, verbose_name="error")),
+                ("attempts", models.PositiveSmallIntegerField(default=1, verbose_name="attempts")),
+                ("retry_at", models.DateTimeField(blank=True, db_index=True, null=True, verbose_name="retry at")),
+            ],
+            options={
+                "verbose_name": "failed sms",
+                "verbose_name_plural": "failed sms",
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
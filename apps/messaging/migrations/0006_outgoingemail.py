@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:24
+
+import django.utils.timezone
+import django_lifecycle.mixins
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0005_failedsms"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True, null=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True, verbose_name="Updated at")),
+                ("is_active", models.BooleanField(db_index=True, default=True, verbose_name="Is active")),
+                ("to", models.EmailField(max_length=254, verbose_name="to")),
+                ("subject", models.CharField(max_length=255, verbose_name="subject")),
+                ("body", models.TextField(verbose_name="body")),
+                ("html_body", models.TextField(blank=True, verbose_name="html body")),
+                (
+                    "status",
+                    models.PositiveSmallIntegerField(
+                        choices=[(0, "Pending"), (1, "Sent"), (2, "Failed")], default=0, editable=False, verbose_name="status"
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="attempts")),
+                ("error", models.TextField(blank=True, editable=False, verbose_name="error")),
+                ("send_at", models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name="send at")),
+                ("sent_at", models.DateTimeField(blank=True, editable=False, null=True, verbose_name="sent at")),
+            ],
+            options={
+                "verbose_name": "outgoing email",
+                "verbose_name_plural": "outgoing emails",
+                "indexes": [models.Index(fields=["status", "send_at"], name="outgoing_email_status_send_at")],
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
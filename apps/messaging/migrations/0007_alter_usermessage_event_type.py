@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0006_outgoingemail"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="usermessage",
+            name="event_type",
+            field=models.SmallIntegerField(
+                blank=True,
+                choices=[(1, "Not Defined"), (2, "New Answer")],
+                db_index=True,
+                default=1,
+                editable=False,
+                verbose_name="Event Type",
+            ),
+        ),
+    ]
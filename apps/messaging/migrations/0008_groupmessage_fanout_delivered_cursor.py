@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def forwards_func(apps, schema_editor):
+    # The deliveries of the chunks created so far were enqueued after their commit
+    GroupMessage = apps.get_model("messaging", "GroupMessage")
+    db_alias = schema_editor.connection.alias
+    GroupMessage.objects.using(db_alias).update(fanout_delivered_cursor=F("fanout_cursor"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0007_alter_usermessage_event_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="groupmessage",
+            name="fanout_delivered_cursor",
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name="fan-out delivered cursor"),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
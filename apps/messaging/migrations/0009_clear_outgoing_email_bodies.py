@@ -0,0 +1,23 @@
+from django.db import migrations
+
+EMAIL_STATUS_SENT = 1
+EMAIL_STATUS_FAILED = 2
+
+
+def forwards_func(apps, schema_editor):
+    # Sent and given up emails no longer keep their bodies, they carry verification and password reset codes
+    OutgoingEmail = apps.get_model("messaging", "OutgoingEmail")
+    db_alias = schema_editor.connection.alias
+    OutgoingEmail.objects.using(db_alias).filter(status__in=(EMAIL_STATUS_SENT, EMAIL_STATUS_FAILED)).update(
+        body="", html_body=""
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("messaging", "0008_groupmessage_fanout_delivered_cursor"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django_lifecycle import AFTER_CREATE, hook
+from django_lifecycle import AFTER_CREATE, AFTER_DELETE, AFTER_UPDATE, hook
 
 from core import choice
 from core.models import BaseModel
@@ -44,6 +47,13 @@ class GroupMessage(BaseModel):
     send_email = models.BooleanField(_("send email"), default=False)
     send_sms = models.BooleanField(_("send sms"), default=False)
 
+    # Fan-out progress, the members are handled in user id order so a crashed fan-out resumes after the cursor.
+    # The delivered cursor trails it until the deliveries of the created messages are enqueued
+    fanout_cursor = models.PositiveBigIntegerField(_("fan-out cursor"), default=0, editable=False)
+    fanout_delivered_cursor = models.PositiveBigIntegerField(_("fan-out delivered cursor"), default=0, editable=False)
+    fanout_count = models.PositiveIntegerField(_("fan-out count"), default=0, editable=False)
+    fanout_completed_at = models.DateTimeField(_("fan-out completed at"), null=True, blank=True, editable=False)
+
     class Meta:
         verbose_name = _("group message")
         verbose_name_plural = _("group messages")
@@ -53,7 +63,8 @@ class GroupMessage(BaseModel):
 
     @hook(AFTER_CREATE)
     def create_child_messages(self):
-        create_child_messages_for_group.delay(self.id)
+        # The task reads the group message, it must not run before the message is committed
+        transaction.on_commit(lambda: create_child_messages_for_group.delay(self.id))
 
 
 class UserMessage(BaseModel):
@@ -98,6 +109,37 @@ class UserMessage(BaseModel):
     def __str__(self) -> str:
         return str(_("user message")) + f" #{self.id}"
 
+    @property
+    def is_unread(self) -> bool:
+        """Whether the message is counted in the unread counter of the user."""
+        return self.is_active and self.send_in_app and not self.is_seen
+
+    def _change_unread_count(self, delta: int) -> None:
+        from .unread import change_unread_counts
+
+        transaction.on_commit(partial(change_unread_counts, [self.user_id], delta))
+
+    @hook(AFTER_CREATE, when="send_in_app", is_now=True)
+    def count_unread_message(self):
+        """Counts a new unseen in-app message in the unread counter of the user."""
+        if self.is_unread:
+            self._change_unread_count(1)
+
+    @hook(AFTER_UPDATE, when_any=["is_seen", "is_active", "send_in_app"], has_changed=True)
+    def recount_unread_message(self):
+        """Moves a seen, deactivated or reactivated message out of or into the unread counter of the user."""
+        was_unread = (
+            self.initial_value("is_active") and self.initial_value("send_in_app") and not self.initial_value("is_seen")
+        )
+        if was_unread != self.is_unread:
+            self._change_unread_count(1 if self.is_unread else -1)
+
+    @hook(AFTER_DELETE)
+    def uncount_unread_message(self):
+        """Removes a deleted unseen message from the unread counter of the user."""
+        if self.is_unread:
+            self._change_unread_count(-1)
+
     @hook(AFTER_CREATE, when="send_notification", is_now=True)
     def handle_send_notification(self):
         send_notification_task.delay(self.user.id, self.title, self.content, self.event_type, self.event_data)
@@ -147,3 +189,50 @@ class UserDevice(BaseModel):
         db_index=True,
         editable=False,
     )
+
+
+class FailedSms(BaseModel):
+    """
+    An SMS send that failed, kept for `retry_failed_sms_task`.
+    A failure the provider will never accept (e.g. an invalid receptor) has no `retry_at` and is kept for inspection.
+    """
+
+    receptors = models.JSONField(_("receptors"), default=list)
+    message = models.TextField(_("message"))
+    error = models.TextField(_("error"), blank=True)
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=1)
+    retry_at = models.DateTimeField(_("retry at"), null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("failed sms")
+        verbose_name_plural = _("failed sms")
+
+    def __str__(self) -> str:
+        return str(_("failed sms")) + f" #{self.id}"
+
+
+class OutgoingEmail(BaseModel):
+    """
+    An email of the outbox, sent by `drain_email_outbox_task` over one SMTP connection shared with the other
+    pending emails. Its status records the delivery, a failed send is attempted again at `send_at`.
+    """
+
+    to = models.EmailField(_("to"))
+    subject = models.CharField(_("subject"), max_length=255)
+    body = models.TextField(_("body"))
+    html_body = models.TextField(_("html body"), blank=True)
+    status = models.PositiveSmallIntegerField(
+        _("status"), choices=choice.EMAIL_STATUSES, default=choice.EMAIL_STATUS_PENDING, editable=False
+    )
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0, editable=False)
+    error = models.TextField(_("error"), blank=True, editable=False)
+    send_at = models.DateTimeField(_("send at"), default=timezone.now, editable=False)
+    sent_at = models.DateTimeField(_("sent at"), null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = _("outgoing email")
+        verbose_name_plural = _("outgoing emails")
+        indexes = [models.Index(fields=["status", "send_at"], name="outgoing_email_status_send_at")]
+
+    def __str__(self) -> str:
+        return str(_("outgoing email")) + f" #{self.id}"
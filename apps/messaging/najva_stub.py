@@ -0,0 +1,75 @@
+import contextlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class NajvaStubHandler(BaseHTTPRequestHandler):
+    """Accepts send-direct requests like Najva, after the server latency, without sending anything."""
+
+    # Keep-alive, like the real API, so the pooled connections of the client are reused
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:  # noqa: S311
+            self._respond(503, {"detail": "stub failure"})
+            return
+        self.server.record(len(data.get("subscribers", [])))
+        self._respond(200, {"result": "ok"})
+
+    def _respond(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NajvaStubServer(ThreadingHTTPServer):
+    """
+    Local stand-in of the Najva push API for offline benchmarks, see the `run_najva_stub` and
+    `benchmark_push_dispatch` commands. Counts the accepted requests and subscribers.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency: float = 0.0, error_rate: float = 0.0):
+        super().__init__(address, NajvaStubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.subscribers = 0
+        self._lock = threading.Lock()
+        self._connections = set()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self._connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._lock:
+            self._connections.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self):
+        # Also drop the kept-alive connections, their handler threads would otherwise go on answering
+        with self._lock:
+            for connection in self._connections:
+                with contextlib.suppress(OSError):
+                    connection.shutdown(socket.SHUT_RDWR)
+        super().server_close()
+
+    def record(self, subscribers: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.subscribers += subscribers
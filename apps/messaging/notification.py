@@ -1,20 +1,66 @@
 import logging
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from json import dumps as json_dumps
 
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .api_setting import NAJVA_APIKEY, NAJVA_TOKEN
+from .api_setting import (
+    NAJVA_API_URL,
+    NAJVA_APIKEY,
+    NAJVA_BACKOFF,
+    NAJVA_CONCURRENCY,
+    NAJVA_RETRIES,
+    NAJVA_TIMEOUT,
+    NAJVA_TOKEN,
+)
 
 LIMIT_BODY: int = 200
 LIMIT_TITLE: int = 100
 # Iran TimeZone
 TH = pytz.timezone("Asia/Tehran")
+# Statuses worth another try, the request did not reach Najva or it asked to slow down
+RETRY_STATUSES: tuple[int, ...] = (429, 500, 502, 503, 504)
 
 logger = logging.getLogger("notification")
 
 
+@lru_cache
+def get_najva_session() -> requests.Session:
+    """
+    Returns the shared HTTP session of the Najva API, its connections are kept alive and pooled for
+    `MESSAGING_NAJVA_CONCURRENCY` concurrent requests.
+    Refused connections and retryable statuses are retried `MESSAGING_NAJVA_RETRIES` times with exponential
+    backoff. A request that may have reached Najva (read error) is not repeated here, the caller decides.
+    """
+    retry = Retry(
+        total=NAJVA_RETRIES,
+        connect=NAJVA_RETRIES,
+        read=0,
+        status=NAJVA_RETRIES,
+        backoff_factor=NAJVA_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=NAJVA_CONCURRENCY, max_retries=retry))
+    session.mount("http://", HTTPAdapter(pool_maxsize=NAJVA_CONCURRENCY, max_retries=retry))
+    session.headers.update(
+        {
+            "content-type": "application/json",
+            "cache-control": "no-cache",
+            "x-api-key": NAJVA_APIKEY,
+            "authorization": f"Token {NAJVA_TOKEN}",
+        }
+    )
+    return session
+
+
 ## api to send notification for specific users
 def send_to_users_API(
     title: str,
@@ -36,8 +82,6 @@ def send_to_users_API(
     # base on iran timezone
     sent_time: str = utc_dt.astimezone(TH).strftime("%Y-%m-%dT%H:%M:%S")
 
-    api_url: str = "https://app.najva.com/api/v2/notification/management/send-direct/"
-
     data: dict = {
         "title": title,
         "body": body,
@@ -54,20 +98,8 @@ def send_to_users_API(
         "sent_time": sent_time,
     }
 
-    headers: dict = {
-        "content-type": "application/json",
-        "cache-control": "no-cache",
-        "x-api-key": NAJVA_APIKEY,
-        "authorization": f"Token {NAJVA_TOKEN}",
-    }
-
-    response = requests.post(
-        url=api_url,
-        json=data,
-        headers=headers,
-        timeout=60,
-    )
-    logger.debug([headers, data, response.json()])
+    response = get_najva_session().post(url=NAJVA_API_URL, json=data, timeout=NAJVA_TIMEOUT)
+    logger.debug([data, response.status_code, response.text])
 
     return response.status_code
 
@@ -0,0 +1,123 @@
+from collections.abc import Iterable
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core import choice
+
+from .api_setting import EMAIL_BATCH_SIZE, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_DELAY
+from .models import OutgoingEmail
+from .tasks import drain_email_outbox_task
+
+# Claimed emails are left to the claiming drain this long, then a drain that died is taken over
+EMAIL_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def queue_email(to: str, subject: str, body: str, html_body: str = "") -> OutgoingEmail:
+    """
+    Adds an email to the outbox, it is sent by a drain started after the commit. A drain that can not be
+    started (e.g. broker outage) does not fail the commit, the email is sent by the next drain.
+    """
+    email = OutgoingEmail.objects.create(to=to, subject=subject, body=body, html_body=html_body)
+    transaction.on_commit(drain_email_outbox_task.delay, robust=True)
+    return email
+
+
+def queue_emails(recipients: Iterable[str], subject: str, body: str, html_body: str = "") -> int:
+    """
+    Adds the same email for every recipient to the outbox with one bulk insert, see `queue_email`.
+
+    Returns:
+        int: Number of queued emails.
+    """
+    emails = OutgoingEmail.objects.bulk_create(
+        [OutgoingEmail(to=to, subject=subject, body=body, html_body=html_body) for to in recipients],
+        batch_size=EMAIL_BATCH_SIZE,
+    )
+    if emails:
+        transaction.on_commit(drain_email_outbox_task.delay, robust=True)
+    return len(emails)
+
+
+def _claim_batch(batch_size: int) -> list[int]:
+    """
+    Takes the next due emails by moving their `send_at` past the claim timeout, emails locked by a concurrent
+    drain are skipped. The sends then run outside any transaction.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=choice.EMAIL_STATUS_PENDING, send_at__lte=now)
+            .order_by("send_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=ids).update(send_at=now + EMAIL_CLAIM_TIMEOUT)
+    return ids
+
+
+def _record_failure(email: OutgoingEmail, error: Exception) -> None:
+    now = timezone.now()
+    email.attempts += 1
+    email.error = repr(error)
+    if email.attempts >= EMAIL_MAX_ATTEMPTS:
+        email.status = choice.EMAIL_STATUS_FAILED
+        # Given up, the codes in the bodies must not outlive the email
+        email.body = email.html_body = ""
+    else:
+        email.send_at = now + timedelta(seconds=EMAIL_RETRY_DELAY * 2 ** (email.attempts - 1))
+    email.save(update_fields=["attempts", "error", "status", "send_at", "body", "html_body", "updated_at"])
+
+
+def drain_email_outbox(batch_size: int = EMAIL_BATCH_SIZE) -> dict:
+    """
+    Sends the due emails of the outbox with `send_messages` over one SMTP connection kept open for the whole
+    drain, instead of a connection per email. Emails are claimed `batch_size` at a time until none is due,
+    the sent ones of a batch are marked with one update and their bodies cleared. Every email is handed to
+    `send_messages` on its own, SMTP sends one message per transaction anyway, so a failure is recorded against
+    the email that caused it. An email that fails for any reason is attempted again later with a doubled delay until
+    `MESSAGING_EMAIL_MAX_ATTEMPTS`, and the connection is opened again for the rest of the batch.
+
+    Returns:
+        dict: Number of sent and failed emails.
+    """
+    result = {"sent": 0, "failed": 0}
+    with get_connection() as connection:
+        while ids := _claim_batch(batch_size):
+            sent_ids = []
+            try:
+                for email in OutgoingEmail.objects.filter(id__in=ids).order_by("id"):
+                    try:
+                        message = EmailMultiAlternatives(
+                            email.subject, email.body, settings.EMAIL_HOST_USER, [email.to], connection=connection
+                        )
+                        if email.html_body:
+                            message.attach_alternative(email.html_body, "text/html")
+                        connection.send_messages([message])
+                    except Exception as e:  # one bad email must not hold back the rest of the batch
+                        _record_failure(email, e)
+                        result["failed"] += 1
+                        connection.close()
+                        connection.open()
+                    else:
+                        sent_ids.append(email.id)
+            finally:
+                # Recorded even when the connection can not be opened again, the rest of the batch is claimed
+                # until the timeout and then sent by the next drain. The bodies (verification and reset codes)
+                # are not kept once sent
+                now = timezone.now()
+                OutgoingEmail.objects.filter(id__in=sent_ids).update(
+                    status=choice.EMAIL_STATUS_SENT,
+                    sent_at=now,
+                    attempts=F("attempts") + 1,
+                    error="",
+                    body="",
+                    html_body="",
+                    updated_at=now,
+                )
+                result["sent"] += len(sent_ids)
+    return result
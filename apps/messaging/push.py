@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from core.redis_client import get_redis
+
+from .api_setting import NAJVA_BATCH_SIZE, NAJVA_CONCURRENCY, NAJVA_MAX_ATTEMPTS
+from .notification import RETRY_STATUSES, send_notification
+
+# Set of content digests having pending push tokens
+PUSH_PENDING_KEY = "messaging:push:pending"
+# Pending content is kept this long after it was last queued, retries are bounded by `NAJVA_MAX_ATTEMPTS`
+PUSH_CONTENT_TIMEOUT = 60 * 60 * 24
+
+logger = logging.getLogger("notification")
+
+
+def _content_key(digest: str) -> str:
+    """JSON [title, body, url] of the pushes with this digest."""
+    return f"messaging:push:{digest}:content"
+
+
+def _tokens_key(digest: str) -> str:
+    """Set of device tokens waiting for the push with this digest."""
+    return f"messaging:push:{digest}:tokens"
+
+
+def _sending_key(digest: str) -> str:
+    """Tokens taken over by the running dispatch, kept until all of their requests are done."""
+    return f"messaging:push:{digest}:sending"
+
+
+def _attempts_key(digest: str) -> str:
+    """Hash of device token to the number of dispatches that failed to send it the push with this digest."""
+    return f"messaging:push:{digest}:attempts"
+
+
+def queue_push(receivers: list[str], title: str, body: str, url: str = "") -> None:
+    """
+    Adds device tokens to the pending pushes, `dispatch_pending_pushes` sends pushes with identical
+    title, body and url as multi-recipient requests.
+    """
+    if not receivers:
+        return
+    content = json.dumps([title, body, url])
+    digest = hashlib.sha1(content.encode(), usedforsecurity=False).hexdigest()
+    pipeline = get_redis().pipeline()
+    pipeline.set(_content_key(digest), content, ex=PUSH_CONTENT_TIMEOUT)
+    pipeline.sadd(_tokens_key(digest), *receivers)
+    pipeline.expire(_tokens_key(digest), PUSH_CONTENT_TIMEOUT)
+    pipeline.sadd(PUSH_PENDING_KEY, digest)
+    pipeline.execute()
+
+
+def _send_batch(digest: str, title: str, body: str, url: str, tokens: list[str]) -> bool:
+    """
+    Sends one multi-recipient push and logs its outcome.
+
+    Returns:
+        bool: True when the batch is done, False when it failed in a way worth retrying on the next dispatch.
+    """
+    start = time.perf_counter()
+    try:
+        status = send_notification(tokens, title, body, url)
+    except requests.RequestException as e:
+        logger.warning("push %s: %s recipients failed after %.0fms: %r", digest, len(tokens), _elapsed(start), e)
+        return False
+
+    if 200 <= status < 300:
+        logger.info("push %s: %s recipients sent in %.0fms", digest, len(tokens), _elapsed(start))
+        return True
+    retry = status in RETRY_STATUSES
+    logger.error(
+        "push %s: %s recipients rejected with %s in %.0fms%s",
+        digest,
+        len(tokens),
+        status,
+        _elapsed(start),
+        ", will retry" if retry else "",
+    )
+    return not retry
+
+
+def _retry_batch(digest: str, title: str, body: str, url: str, tokens: list[str]) -> int:
+    """
+    Queues the tokens of a failed batch again, tokens that failed `NAJVA_MAX_ATTEMPTS` times are dropped.
+
+    Returns:
+        int: Number of tokens queued again.
+    """
+    pipeline = get_redis().pipeline()
+    for token in tokens:
+        pipeline.hincrby(_attempts_key(digest), token, 1)
+    pipeline.expire(_attempts_key(digest), PUSH_CONTENT_TIMEOUT)
+    attempts = pipeline.execute()[:-1]
+
+    retry = [token for token, attempt in zip(tokens, attempts, strict=True) if attempt < NAJVA_MAX_ATTEMPTS]
+    if len(retry) < len(tokens):
+        logger.error("push %s: %s recipients dropped after %s attempts", digest, len(tokens) - len(retry), NAJVA_MAX_ATTEMPTS)
+    queue_push(retry, title, body, url)
+    return len(retry)
+
+
+def _elapsed(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def dispatch_pending_pushes(batch_size: int = NAJVA_BATCH_SIZE, concurrency: int = NAJVA_CONCURRENCY) -> dict:
+    """
+    Sends the pending pushes, the tokens of each content in requests of `batch_size` subscribers,
+    `concurrency` requests at a time over the pooled Najva session.
+    The tokens of a content are swapped out atomically with RENAME, tokens queued meanwhile wait for the next
+    dispatch. Batches failing with a retryable error are queued again until `MESSAGING_NAJVA_MAX_ATTEMPTS`
+    dispatches failed for a token, a dispatch that died is sent again on the next run, so pushes are sent
+    at least once.
+
+    Returns:
+        dict: Number of requests, of recipients and of recipients queued again for a retry.
+    """
+    client = get_redis()
+    batches = []
+    sending_keys = []
+    for digest in client.smembers(PUSH_PENDING_KEY):
+        digest = digest.decode()
+        sending_key = _sending_key(digest)
+        if not client.exists(sending_key):
+            if not client.exists(_tokens_key(digest)):
+                client.srem(PUSH_PENDING_KEY, digest)
+                # Tokens queued between the check and the removal keep their content pending
+                if client.exists(_tokens_key(digest)):
+                    client.sadd(PUSH_PENDING_KEY, digest)
+                else:
+                    client.delete(_attempts_key(digest))
+                continue
+            client.rename(_tokens_key(digest), sending_key)
+        sending_keys.append(sending_key)
+
+        content = client.get(_content_key(digest))
+        if content is None:
+            logger.error("push %s: content expired, %s recipients dropped", digest, client.scard(sending_key))
+            continue
+        title, body, url = json.loads(content)
+        tokens = sorted(token.decode() for token in client.smembers(sending_key))
+        for index in range(0, len(tokens), batch_size):
+            batches.append((digest, title, body, url, tokens[index : index + batch_size]))
+
+    result = {"requests": len(batches), "recipients": 0, "retried": 0}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = executor.map(lambda batch: _send_batch(*batch), batches)
+        for (digest, title, body, url, tokens), done in zip(batches, outcomes, strict=True):
+            result["recipients"] += len(tokens)
+            if not done:
+                result["retried"] += _retry_batch(digest, title, body, url, tokens)
+
+    if sending_keys:
+        client.delete(*sending_keys)
+    return result
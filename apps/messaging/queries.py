@@ -12,6 +12,8 @@ def get_notifications(user: User) -> list[UserMessage]:
 
 
 def seen_user_message(user_message: UserMessage) -> UserMessage:
-    user_message.is_seen = True
-    user_message.save()
+    """Marks the message as seen, the unread counter of the user is decremented by the model hook."""
+    if not user_message.is_seen:
+        user_message.is_seen = True
+        user_message.save(update_fields=["is_seen", "updated_at"])
     return user_message
@@ -1,9 +1,198 @@
+import logging
+import random
+import time
+from collections.abc import Iterable
+from datetime import timedelta
+from functools import lru_cache
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from kavenegar import APIException, HTTPException, KavenegarAPI
+from requests.adapters import HTTPAdapter
+
+from core.ratelimit import TokenBucket
 
-from .api_setting import KAVENEGAR_APIKEY
+from .api_setting import (
+    KAVENEGAR_APIKEY,
+    SMS_BURST,
+    SMS_MAX_ATTEMPTS,
+    SMS_PROVIDER,
+    SMS_RATE,
+    SMS_RETRY_DELAY,
+    SMS_TIMEOUT,
+)
 
 api = KavenegarAPI(KAVENEGAR_APIKEY)
 
+logger = logging.getLogger("sms")
+
+
+class SmsSendError(Exception):
+    """A provider call that did not send, `retryable` is False when sending it again can not succeed."""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class BaseSmsProvider:
+    """
+    Base class of SMS providers, see `MESSAGING_SMS_PROVIDER` setting.
+    methods:
+        - send: send one message to up to `max_receptors` receptors in one call, raises `SmsSendError`
+    """
+
+    max_receptors: int = 1
+
+    def send(self, receptors: list[str], message: str) -> None:
+        raise NotImplementedError
+
+
+class KavenegarSmsProvider(BaseSmsProvider):
+    """
+    Kavenegar `sms/send` API, up to 200 comma separated receptors per call, over a keep-alive session
+    instead of a new connection per call.
+    """
+
+    max_receptors = 200
+    url = "https://api.kavenegar.com/v1/{apikey}/sms/send.json"
+    # Server busy, credit exhausted and too many calls, the others are errors in the request itself
+    retry_statuses = (409, 418, 451)
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=4))
+
+    def send(self, receptors: list[str], message: str) -> None:
+        try:
+            response = self.session.post(
+                self.url.format(apikey=KAVENEGAR_APIKEY),
+                data={"receptor": ",".join(receptors), "message": message},
+                timeout=SMS_TIMEOUT,
+            )
+            status = response.json()["return"]
+        except (requests.ReadTimeout, requests.exceptions.ChunkedEncodingError) as e:
+            # The call reached the provider and may have been sent, a retry could send the paid SMS twice
+            raise SmsSendError(repr(e), retryable=False) from e
+        except requests.RequestException as e:
+            raise SmsSendError(repr(e)) from e
+        except (ValueError, KeyError) as e:
+            raise SmsSendError(f"Invalid response with HTTP status {response.status_code}") from e
+        if status["status"] != 200:
+            raise SmsSendError(f"{status['status']} {status['message']}", status["status"] in self.retry_statuses)
+
+
+class FakeSmsProvider(BaseSmsProvider):
+    """
+    Local stand-in of a multi-receptor provider that sends nothing, for tests and benchmarks.
+    Every call takes `latency` seconds and fails with a retryable error at `error_rate`, the sent
+    calls are kept in `sent`.
+    """
+
+    max_receptors = 200
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent: list[tuple[list[str], str]] = []
+
+    def send(self, receptors: list[str], message: str) -> None:
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:  # noqa: S311
+            raise SmsSendError("fake failure")
+        self.sent.append((receptors, message))
+
+
+@lru_cache
+def get_sms_provider() -> BaseSmsProvider:
+    """Returns the SMS provider configured by `MESSAGING_SMS_PROVIDER` setting."""
+    return import_string(SMS_PROVIDER)()
+
+
+@lru_cache
+def get_sms_rate_limiter() -> TokenBucket:
+    """Returns the token bucket of provider calls shared by all workers, see `MESSAGING_SMS_RATE` setting."""
+    return TokenBucket("sms", SMS_RATE, SMS_BURST)
+
+
+def send_bulk_sms(receptors: Iterable[str], message: str, provider: BaseSmsProvider | None = None) -> dict:
+    """
+    Sends one message to many receptors in as few calls as the provider allows (`max_receptors` each),
+    every call waits for the shared rate limiter. A failed call is recorded as `FailedSms` to be retried.
+
+    Returns:
+        dict: Number of provider calls, of sent receptors and of failed receptors.
+    """
+    provider = provider or get_sms_provider()
+    receptors = list(dict.fromkeys(receptor for receptor in receptors if receptor))
+    result = {"calls": 0, "sent": 0, "failed": 0}
+    for index in range(0, len(receptors), provider.max_receptors):
+        chunk = receptors[index : index + provider.max_receptors]
+        get_sms_rate_limiter().acquire()
+        result["calls"] += 1
+        try:
+            provider.send(chunk, message)
+        except SmsSendError as e:
+            logger.warning("sms to %s receptors failed: %s", len(chunk), e)
+            record_failed_sms(chunk, message, e)
+            result["failed"] += len(chunk)
+        else:
+            result["sent"] += len(chunk)
+    return result
+
+
+def _next_retry_at(error: SmsSendError, attempts: int):
+    if not error.retryable or attempts >= SMS_MAX_ATTEMPTS:
+        return None
+    return timezone.now() + timedelta(seconds=SMS_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def record_failed_sms(receptors: list[str], message: str, error: SmsSendError) -> None:
+    from .models import FailedSms
+
+    FailedSms.objects.create(receptors=receptors, message=message, error=str(error), retry_at=_next_retry_at(error, 1))
+
+
+def retry_failed_sms(limit: int = 100, provider: BaseSmsProvider | None = None) -> dict:
+    """
+    Sends the failed SMS whose retry is due again. They are claimed first by moving their `retry_at`
+    past the run (skipping rows locked by a concurrent run), so the provider calls run outside any transaction.
+    A send that fails again is retried later with a doubled delay, until `MESSAGING_SMS_MAX_ATTEMPTS`.
+
+    Returns:
+        dict: Number of sent and failed again records.
+    """
+    from .models import FailedSms
+
+    provider = provider or get_sms_provider()
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            FailedSms.objects.select_for_update(skip_locked=True)
+            .filter(is_active=True, retry_at__lte=now)
+            .order_by("retry_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        FailedSms.objects.filter(id__in=ids).update(retry_at=now + timedelta(minutes=10))
+
+    result = {"sent": 0, "failed": 0}
+    for failed in FailedSms.objects.filter(id__in=ids):
+        get_sms_rate_limiter().acquire()
+        try:
+            provider.send(failed.receptors, failed.message)
+        except SmsSendError as e:
+            failed.attempts += 1
+            failed.error = str(e)
+            failed.retry_at = _next_retry_at(e, failed.attempts)
+            failed.save(update_fields=["attempts", "error", "retry_at", "updated_at"])
+            result["failed"] += 1
+        else:
+            failed.delete()
+            result["sent"] += 1
+    return result
+
 
 def sms_character_replace(text: str) -> str:
     """
@@ -17,17 +206,7 @@ def sms_character_replace(text: str) -> str:
 
 
 def send_simple_sms(receptor: str, message: str):
-    try:
-        params = {
-            "receptor": receptor,
-            "message": message,
-        }
-        response = api.sms_send(params)
-        print(response)
-    except APIException as e:
-        print(e)
-    except HTTPException as e:
-        print(e)
+    send_bulk_sms([receptor], message)
 
 
 def send_tokened_sms(receptor: str, template: str, tokens: list):
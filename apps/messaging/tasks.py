@@ -1,27 +1,30 @@
 from celery import shared_task
-from django.conf import settings
-from django.core.mail import send_mail
+from django.core.cache import cache
 
-from .notification import send_notification
-from .sms import send_simple_sms
+from .push import dispatch_pending_pushes, queue_push
+from .sms import retry_failed_sms, send_bulk_sms, send_simple_sms
+
+
+# Acknowledged after the run, a fan-out whose worker died is delivered again and resumes after its cursor
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def create_child_messages_for_group(message_id: int) -> int:
+    from .fanout import fan_out_group_message
+
+    return fan_out_group_message(message_id)
 
 
 @shared_task
-def create_child_messages_for_group(message_id: int):
-    from .models import GroupMessage, GroupUser, UserMessage
+def resume_stalled_fanouts_task() -> int:
+    from .fanout import resume_stalled_fanouts
 
-    group_message = GroupMessage.objects.get(id=message_id)
-    users = GroupUser.objects.filter(group=group_message.group).values_list("user_id", flat=True)
-    for user_id in users:
-        UserMessage.objects.create(
-            user_id=user_id,
-            title=group_message.title,
-            content=group_message.content,
-            send_in_app=group_message.send_in_app,
-            send_notification=group_message.send_notification,
-            send_email=group_message.send_email,
-            send_sms=group_message.send_sms,
-        )
+    return resume_stalled_fanouts()
+
+
+@shared_task
+def reconcile_unread_counts_task() -> int:
+    from .unread import reconcile_unread_counts
+
+    return reconcile_unread_counts()
 
 
 @shared_task
@@ -31,13 +34,22 @@ def send_simple_sms_task(receptor: str, message: str):
 
 @shared_task
 def send_email_task(receiver: str, subject: str, content: str):
-    send_mail(
-        subject,
-        content,
-        settings.EMAIL_HOST_USER,
-        [receiver],
-        fail_silently=True,
-    )
+    from .outbox import queue_email
+
+    queue_email(receiver, subject, content)
+
+
+@shared_task
+def drain_email_outbox_task() -> dict:
+    from .outbox import drain_email_outbox
+
+    # Only one drain at a time, emails queued meanwhile are sent by the running drain or the scheduled one
+    if not cache.add("messaging:email:drain_lock", True, 60 * 10):
+        return {}
+    try:
+        return drain_email_outbox()
+    finally:
+        cache.delete("messaging:email:drain_lock")
 
 
 @shared_task
@@ -47,4 +59,54 @@ def send_notification_task(user_id: int, title: str, content: str, event_type: i
     receiver: list[str] = [str(uuid) for uuid in UserDevice.objects.filter(user=user_id).values_list("token", flat=True)]
     # Front-End Url that user click on this push notif be redirected
     url: str = ""
-    send_notification(receiver, title, content, url)
+    # Sent with the other pushes of the same content by `dispatch_pending_pushes_task`
+    queue_push(receiver, title, content, url)
+
+
+@shared_task
+def send_notification_batch_task(user_ids: list[int], title: str, content: str) -> None:
+    from .models import UserDevice
+
+    receivers: list[str] = [str(uuid) for uuid in UserDevice.objects.filter(user__in=user_ids).values_list("token", flat=True)]
+    queue_push(receivers, title, content, "")
+
+
+@shared_task
+def dispatch_pending_pushes_task() -> dict:
+    # Only one dispatch at a time, a slow run must not overlap with the next scheduled one
+    if not cache.add("messaging:push:dispatch_lock", True, 60 * 5):
+        return {}
+    try:
+        return dispatch_pending_pushes()
+    finally:
+        cache.delete("messaging:push:dispatch_lock")
+
+
+@shared_task
+def send_email_batch_task(user_ids: list[int], subject: str, content: str) -> int:
+    from apps.account.models import User
+
+    from .outbox import queue_emails
+
+    # Sent by the outbox drain over one SMTP connection
+    emails = User.objects.filter(id__in=user_ids).exclude(email__isnull=True).exclude(email="").values_list("email", flat=True)
+    return queue_emails(emails, subject, content)
+
+
+@shared_task
+def send_sms_batch_task(user_ids: list[int], message: str) -> dict:
+    from apps.account.models import User
+
+    phone_numbers = (
+        User.objects.filter(id__in=user_ids)
+        .exclude(phone_number__isnull=True)
+        .exclude(phone_number="")
+        .values_list("phone_number", flat=True)
+    )
+    # As few provider calls as the provider allows, failed calls are kept for `retry_failed_sms_task`
+    return send_bulk_sms(phone_numbers, message)
+
+
+@shared_task
+def retry_failed_sms_task() -> dict:
+    return retry_failed_sms()
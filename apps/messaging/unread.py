@@ -0,0 +1,107 @@
+from collections import Counter
+from collections.abc import Iterable
+from functools import lru_cache
+
+from django.db.models import Count
+
+from core.redis_client import get_redis
+
+from .models import UserMessage
+
+# Hash of user id to the number of unseen in-app messages of the user
+UNREAD_KEY = "messaging:unread"
+
+# Changes the counters of users that have one, a missing counter is counted from the database on its first read
+# instead, so it never starts from a partial count
+CHANGE_SCRIPT = """
+for index = 1, #ARGV, 2 do
+    if redis.call("HEXISTS", KEYS[1], ARGV[index]) == 1 then
+        local count = redis.call("HINCRBY", KEYS[1], ARGV[index], ARGV[index + 1])
+        if count < 0 then
+            redis.call("HSET", KEYS[1], ARGV[index], 0)
+        end
+    end
+end
+"""
+
+# Sets the reconciled counters that did not change since they were read, a counter changed meanwhile is
+# left to the next reconciliation
+RECONCILE_SCRIPT = """
+local fixed = 0
+for index = 1, #ARGV, 3 do
+    if redis.call("HGET", KEYS[1], ARGV[index]) == ARGV[index + 1] then
+        redis.call("HSET", KEYS[1], ARGV[index], ARGV[index + 2])
+        fixed = fixed + 1
+    end
+end
+return fixed
+"""
+
+
+@lru_cache
+def _script(source: str):
+    return get_redis().register_script(source)
+
+
+def _unread_queryset():
+    return UserMessage.objects.filter(is_active=True, send_in_app=True, is_seen=False)
+
+
+def get_unread_count(user_id: int) -> int:
+    """
+    Returns the number of unseen in-app messages of the user from the Redis counter,
+    counted from the database only when the user has no counter yet.
+    """
+    client = get_redis()
+    count = client.hget(UNREAD_KEY, user_id)
+    if count is not None:
+        return int(count)
+    count = _unread_queryset().filter(user_id=user_id).count()
+    client.hsetnx(UNREAD_KEY, user_id, count)
+    return count
+
+
+def change_unread_counts(user_ids: Iterable[int], delta: int = 1) -> None:
+    """
+    Adds `delta` to the counters of the users, once per occurrence of a user, with one round trip.
+    Counters never go below zero.
+    """
+    args = []
+    for user_id, times in Counter(user_ids).items():
+        args += [user_id, delta * times]
+    if args:
+        _script(CHANGE_SCRIPT)(keys=[UNREAD_KEY], args=args)
+
+
+def reconcile_unread_counts(chunk_size: int = 1000) -> int:
+    """
+    Fixes counters that drifted from the database (e.g. messages deactivated or changed in bulk), one
+    grouped count query per chunk of counters. A counter changed between its read and the fix keeps its value.
+
+    Returns:
+        int: Number of fixed counters.
+    """
+    client = get_redis()
+    fixed = 0
+    cursor = 0
+    while True:
+        cursor, counters = client.hscan(UNREAD_KEY, cursor, count=chunk_size)
+        if counters:
+            user_ids = [int(user_id) for user_id in counters]
+            counts = dict(
+                _unread_queryset()
+                .filter(user_id__in=user_ids)
+                .order_by()
+                .values("user_id")
+                .annotate(count=Count("id"))
+                .values_list("user_id", "count")
+            )
+            args = []
+            for user_id, count in counters.items():
+                actual = counts.get(int(user_id), 0)
+                if int(count) != actual:
+                    args += [user_id, count, actual]
+            if args:
+                fixed += _script(RECONCILE_SCRIPT)(keys=[UNREAD_KEY], args=args)
+        if not cursor:
+            return fixed
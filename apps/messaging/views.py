@@ -2,31 +2,35 @@ from collections import OrderedDict
 
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 from rest_framework.viewsets import ModelViewSet
 
+from core.pagination import KeysetPagination
+
 from .models import UserDevice, UserMessage
+from .queries import seen_user_message
 from .serializers import UserDeviceSerializer, UserMessageSerializer
+from .unread import get_unread_count
 
 
 def get_list_inapp_message_queryset(request):
     return UserMessage.objects.filter(user=request.user, send_in_app=True).order_by("-created_at")
 
 
-class MessagetListPagination(PageNumberPagination):
+class MessagetListPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
     def get_unseen_count(self):
-        qs = get_list_inapp_message_queryset(self.request)
-        return qs.filter(is_seen=False).count()
+        return get_unread_count(self.request.user.id)
 
     def get_paginated_response(self, data):
         return Response(
             OrderedDict(
                 [
                     ("unseen_count", self.get_unseen_count()),
-                    ("count", self.page.paginator.count),
+                    ("count", self.paginator.total),
                     ("next", self.get_next_link()),
                     ("previous", self.get_previous_link()),
                     ("results", data),
@@ -46,9 +50,7 @@ class UserMessageView(ModelViewSet):
 
     @swagger_auto_schema(request_body=Serializer)
     def seen(self, request, *args, **kwargs):
-        obj = self.get_object()
-        obj.is_seen = True
-        obj.save()
+        seen_user_message(self.get_object())
 
         return Response({"is_seen": True})
 
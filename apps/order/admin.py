@@ -1,8 +1,13 @@
 from django.contrib import admin
+from django.utils import timezone
+from django.utils.html import format_html_join
+from django.utils.translation import gettext_lazy as _
+from jalali_date import date2jalali, datetime2jalali
 from unfold.admin import StackedInline, TabularInline
 
 from core.admin import BaseModelAdmin
 
+from .history import get_order_timeline
 from .models import Order, OrderItem, OrderShipment, OrderStatus
 
 
@@ -106,10 +111,29 @@ class OrderAdmin(BaseModelAdmin):
                     "shipment_price",
                     "total_price",
                     "current_status",
+                    "timeline",
                 )
             },
         ),
     )
+    readonly_fields = ("timeline",)
+
+    def timeline(self, obj):
+        """
+        The order timeline as the customer sees it, recorded transitions with their time and estimates for the rest.
+        """
+        if not obj.pk:
+            return "-"
+        rows = []
+        for step in get_order_timeline(obj):
+            if step["timestamp"]:
+                when = datetime2jalali(timezone.localtime(step["timestamp"])).strftime("%Y/%m/%d %H:%M")
+            else:
+                when = _("Estimate: {}").format(date2jalali(step["estimated_time"]).strftime("%Y/%m/%d"))
+            rows.append(("✔" if step["active"] else "○", step["label"], when))
+        return format_html_join("", "<div>{} {} — {}</div>", rows)
+
+    timeline.short_description = _("Timeline")
 
 
 # Customizing the admin view for OrderItem
@@ -0,0 +1,13 @@
+class InsufficientStock(RuntimeError):
+    """Raised when a product does not have enough stock left
+    to reserve the ordered quantity.
+
+    Subclassing :class:`RuntimeError` so callers that only expect
+    a failed order still handle it, the surrounding transaction
+    is rolled back and nothing of the order is kept. The checkout
+    view catches it first to answer with a 409.
+    """
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Not enough stock left for products {self.product_ids}.")
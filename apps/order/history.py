@@ -0,0 +1,169 @@
+import time
+from collections.abc import Iterable
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+from django.utils.translation import get_language
+from jalali_date import date2jalali, datetime2jalali
+
+from core import choice
+from core.pagination import KeysetPaginator
+
+from .models import Order, OrderStatus
+
+ORDER_HISTORY_VERSION_KEY = "order:history:{user_id}:version"
+ORDER_HISTORY_TIMEOUT = 60 * 60
+ORDER_HISTORY_PAGE_SIZE = 10
+
+# Timeline icon per order status type
+ORDER_STATUS_ICONS = {
+    choice.ORDER_STATUS_PAYMENT_WAITING: "ti ti-basket",
+    choice.ORDER_STATUS_ORDER_PLACED: "ti ti-box",
+    choice.ORDER_STATUS_PRODUCT_PACKAGING: "ti ti-box",
+    choice.ORDER_STATUS_READY_FOR_SHIPMENT: "ti ti-trolley",
+    choice.ORDER_STATUS_ON_THE_WAY: "ti ti-truck-delivery",
+    choice.ORDER_STATUS_DROPPED_IN_DELIVERY: "ti ti-building-store",
+    choice.ORDER_STATUS_DELIVERED: "ti ti-heart-check",
+    choice.ORDER_STATUS_CANCELED: "ti ti-alert-circle",
+}
+
+
+# Steps every order timeline shows, recorded or not, payment waiting is never shown
+ORDER_TIMELINE_STATUSES = (
+    choice.ORDER_STATUS_ORDER_PLACED,
+    choice.ORDER_STATUS_PRODUCT_PACKAGING,
+    choice.ORDER_STATUS_READY_FOR_SHIPMENT,
+    choice.ORDER_STATUS_ON_THE_WAY,
+    choice.ORDER_STATUS_DROPPED_IN_DELIVERY,
+    choice.ORDER_STATUS_DELIVERED,
+)
+
+
+def get_default_estimated_time(order: Order, status_type: int) -> date:
+    """
+    Estimated date of a status without its own estimate, one day per status step from the order date.
+    """
+    return timezone.localtime(order.created_at).date() + timedelta(days=status_type)
+
+
+def get_order_timeline(order: Order, statuses: Iterable[OrderStatus] | None = None) -> list[dict]:
+    """
+    Timeline of an order, one step per `ORDER_TIMELINE_STATUSES` entry and per other recorded status, sorted by type.
+    Status rows are only written on real transitions (or to override an estimate), a step without a row is estimated.
+
+    Args:
+        order (Order): The order.
+        statuses (Iterable[OrderStatus], optional): Already fetched status rows of the order, queried when missing.
+
+    Returns:
+        list[dict]: Steps with type, label, timestamp (latest transition or None), estimated_time (date) and active.
+    """
+    if statuses is None:
+        statuses = order.order_statuses.all()
+
+    recorded = {}
+    for status in statuses:
+        current = recorded.get(status.type)
+        if current is None or (status.timestamp and (not current.timestamp or status.timestamp > current.timestamp)):
+            recorded[status.type] = status
+
+    labels = dict(choice.ORDER_STATUSES)
+    types = sorted((set(ORDER_TIMELINE_STATUSES) | recorded.keys()) - {choice.ORDER_STATUS_PAYMENT_WAITING})
+    timeline = []
+    for status_type in types:
+        status = recorded.get(status_type)
+        timeline.append(
+            {
+                "type": status_type,
+                "label": str(labels[status_type]),
+                "timestamp": status.timestamp if status else None,
+                "estimated_time": (status and status.estimated_time) or get_default_estimated_time(order, status_type),
+                "active": order.current_status >= status_type,
+            }
+        )
+    return timeline
+
+
+def get_order_history_queryset(user) -> QuerySet:
+    """
+    Orders of the user, newest first, with their recorded statuses (payment waiting excluded)
+    prefetched as `recorded_statuses` in one extra query for the whole page.
+    """
+    statuses = OrderStatus.objects.exclude(type=choice.ORDER_STATUS_PAYMENT_WAITING).only(
+        "id", "order_id", "type", "timestamp", "estimated_time"
+    )
+    return (
+        Order.objects.filter(user=user)
+        .only("id", "user_id", "created_at", "current_status", "total_price")
+        .prefetch_related(Prefetch("order_statuses", queryset=statuses, to_attr="recorded_statuses"))
+        .order_by("-created_at", "-id")
+    )
+
+
+def build_order_history_entry(order: Order) -> dict:
+    """
+    Plain, cacheable representation of an order with its display fields already formatted.
+    """
+    timeline = [
+        {
+            **step,
+            "icon": ORDER_STATUS_ICONS.get(step["type"]),
+            "timestamp": (
+                datetime2jalali(timezone.localtime(step["timestamp"])).strftime("%d %b %Y - %I:%M %p")
+                if step["timestamp"]
+                else None
+            ),
+            "estimated_time": date2jalali(step["estimated_time"]).strftime("%d %b %Y"),
+        }
+        for step in get_order_timeline(order, order.recorded_statuses)
+    ]
+    return {
+        "id": order.id,
+        "created_at": order.created_at,
+        "created_at_display": datetime2jalali(timezone.localtime(order.created_at)).strftime("%d %b %Y - %I:%M %p"),
+        "total_price": order.total_price,
+        "current_status": order.current_status,
+        "current_status_display": str(order.get_current_status_display()),
+        "statuses": timeline,
+    }
+
+
+def get_order_history_page(user, cursor: str | None = None, per_page: int = ORDER_HISTORY_PAGE_SIZE) -> dict:
+    """
+    A keyset page of the user's order history, built in two queries (orders and their statuses) and
+    kept in cache per user, page and language until `invalidate_order_history` is called for the user.
+
+    Example output:
+        {
+            "orders": [{"id": 12, "current_status": 1, "statuses": [{"type": 1, "label": "Order placed", ...}, ...]}, ...],
+            "next_cursor": "eyJ2Ijpb...",
+            "previous_cursor": None,
+        }
+
+    Raises:
+        InvalidCursor: When the cursor can not be decoded.
+    """
+    # A time based first version, so an evicted version key never brings back an older copy
+    version = cache.get_or_set(ORDER_HISTORY_VERSION_KEY.format(user_id=user.id), time.time_ns, None)
+    key = f"order:history:{user.id}:{version}:{get_language()}:{per_page}:{cursor or ''}"
+    page = cache.get(key)
+    if page is None:
+        keyset_page = KeysetPaginator(get_order_history_queryset(user), per_page).page(cursor)
+        page = {
+            "orders": [build_order_history_entry(order) for order in keyset_page],
+            "next_cursor": keyset_page.next_cursor,
+            "previous_cursor": keyset_page.previous_cursor,
+        }
+        cache.set(key, page, ORDER_HISTORY_TIMEOUT)
+    return page
+
+
+def invalidate_order_history(user_id: int) -> None:
+    """Drops every cached order history page of the user by moving to a new cache version."""
+    key = ORDER_HISTORY_VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
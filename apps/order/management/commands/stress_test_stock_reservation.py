@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from apps.cms.models import ProductOffer, ProductOfferItem
+from apps.cms.queries import invalidate_active_offer_index
+from apps.order.errors import InsufficientStock
+from apps.order.stock import reserve_stock
+from apps.products.models import Product, ProductCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Reserve the stock of a few products from many threads at once and check that nothing is oversold: "
+        "the stock never goes below zero, the reserved quantities add up to the stock that was taken and the "
+        "offers never sell more than their stock. Needs a database with row locks (PostgreSQL), the generated "
+        "products are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=5, help="Number of contended products.")
+        parser.add_argument("--stock", type=int, default=100, help="Initial stock of every product.")
+        parser.add_argument("--offer-stock", type=int, default=30, help="Stock of the flash offer on every product.")
+        parser.add_argument("--workers", type=int, default=16, help="Number of concurrent threads.")
+        parser.add_argument("--attempts", type=int, default=50, help="Number of reservations per thread.")
+        parser.add_argument("--max-quantity", type=int, default=3, help="Maximum quantity per product and reservation.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random reservations.")
+
+    def handle(self, *args, **options):
+        if not connection.features.has_select_for_update:
+            raise CommandError(f"The {connection.vendor} backend has no row locks, run this against PostgreSQL.")
+
+        category, offer, products = self.create_dataset(options["products"], options["stock"], options["offer_stock"])
+        try:
+            reserved, failures, errors, elapsed = self.run_workers(
+                [product.id for product in products],
+                options["workers"],
+                options["attempts"],
+                options["max_quantity"],
+                options["seed"],
+            )
+            self.verify(products, offer, options["stock"], options["offer_stock"], reserved, failures, errors, elapsed)
+        finally:
+            offer.delete()
+            Product.objects.filter(id__in=[product.id for product in products]).delete()
+            category.delete()
+
+    def create_dataset(self, products: int, stock: int, offer_stock: int):
+        now = timezone.now()
+        category = ProductCategory.objects.create(title="stress test", description="stress test", logo="stress.png")
+        product_list = Product.objects.bulk_create(
+            [
+                Product(title=f"stress test {index}", description="stress test", category=category, stock=stock, price=100_000)
+                for index in range(products)
+            ]
+        )
+        offer = ProductOffer.objects.create(
+            title="stress test", active_from=now - timedelta(days=1), active_until=now + timedelta(days=1)
+        )
+        ProductOfferItem.objects.bulk_create(
+            [
+                ProductOfferItem(product_offer=offer, product=product, stock=offer_stock, discount=20)
+                for product in product_list
+            ]
+        )
+        # bulk_create skips the offer item hooks
+        invalidate_active_offer_index()
+        return category, offer, product_list
+
+    def run_workers(self, product_ids: list[int], workers: int, attempts: int, max_quantity: int, seed: int):
+        reserved = Counter()
+        counts = Counter()
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(workers)
+
+        def work(index: int):
+            rng = random.Random(seed * 1000 + index)  # noqa: S311
+            try:
+                barrier.wait()
+                for _ in range(attempts):
+                    # Random products in random order, the reservation has to lock them in a fixed order
+                    chosen = rng.sample(product_ids, rng.randint(1, len(product_ids)))
+                    quantities = {product_id: rng.randint(1, max_quantity) for product_id in chosen}
+                    try:
+                        with transaction.atomic():
+                            reserve_stock(quantities)
+                    except InsufficientStock:
+                        with lock:
+                            counts["rejected"] += 1
+                        continue
+                    with lock:
+                        counts["reserved"] += 1
+                        reserved.update(quantities)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        self.stdout.write(f"Running {workers} threads x {attempts} reservations on {len(product_ids)} products ...")
+        threads = [threading.Thread(target=work, args=(index,)) for index in range(workers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return reserved, counts, errors, elapsed
+
+    def verify(self, products, offer, stock, offer_stock, reserved, counts, errors, elapsed) -> None:
+        self.stdout.write(
+            f"{counts['reserved']} reservations succeeded, {counts['rejected']} were rejected for lack of stock "
+            f"in {elapsed:.2f}s."
+        )
+        failures = [f"worker error: {error}" for error in errors]
+
+        current = dict(Product.objects.filter(id__in=[product.id for product in products]).values_list("id", "stock"))
+        sold = dict(ProductOfferItem.objects.filter(product_offer=offer).values_list("product_id", "sold_stock"))
+        for product in products:
+            left = current[product.id]
+            self.stdout.write(
+                f"product {product.id}: reserved {reserved[product.id]}, stock left {left}, offer sold {sold[product.id]}"
+            )
+            if left < 0:
+                failures.append(f"product {product.id}: stock is negative ({left})")
+            if stock - left != reserved[product.id]:
+                failures.append(f"product {product.id}: {stock - left} taken from the stock, {reserved[product.id]} reserved")
+            if sold[product.id] > offer_stock:
+                failures.append(f"product {product.id}: offer sold {sold[product.id]} of {offer_stock}")
+            if sold[product.id] != min(offer_stock, reserved[product.id]):
+                failures.append(
+                    f"product {product.id}: offer sold {sold[product.id]}, expected {min(offer_stock, reserved[product.id])}"
+                )
+
+        if failures:
+            raise CommandError("Stock reservation is not safe:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("No product or offer was oversold."))
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0007_alter_user_managers"),
+        ("order", "0008_alter_orderstatus_timestamp"),
+        ("promotions", "0004_coupon_amount"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="idempotency_key",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Key of the request that placed the order, a retry with the same key does not place it again",
+                max_length=64,
+                null=True,
+                verbose_name="Idempotency Key",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="order",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("idempotency_key__isnull", False)),
+                fields=("user", "idempotency_key"),
+                name="order_user_idempotency_key_unique",
+            ),
+        ),
+    ]
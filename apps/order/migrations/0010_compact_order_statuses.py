@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+# Statuses the old code wrote up front for every order, payment waiting (0) up to delivered (6)
+PLACEHOLDER_TYPES = range(7)
+BATCH_SIZE = 2000
+
+
+def default_estimated_time(created_at, status_type):
+    return timezone.localtime(created_at).date() + timedelta(days=status_type)
+
+
+def forwards_func(apps, schema_editor):
+    # Keep only real transitions (rows with a timestamp) and estimates that differ from the computed one,
+    # the timeline estimates every other step from the order date. Deleted batch by batch as they fill
+    OrderStatus = apps.get_model("order", "OrderStatus")
+    db_alias = schema_editor.connection.alias
+
+    rows = (
+        OrderStatus.objects.using(db_alias)
+        .filter(timestamp__isnull=True, type__in=PLACEHOLDER_TYPES)
+        .values_list("id", "type", "estimated_time", "order__created_at")
+        .order_by("id")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    placeholder_ids = []
+    for status_id, status_type, estimated_time, created_at in rows:
+        if estimated_time in (None, default_estimated_time(created_at, status_type)):
+            placeholder_ids.append(status_id)
+        if len(placeholder_ids) >= BATCH_SIZE:
+            OrderStatus.objects.using(db_alias).filter(id__in=placeholder_ids).delete()
+            placeholder_ids = []
+    if placeholder_ids:
+        OrderStatus.objects.using(db_alias).filter(id__in=placeholder_ids).delete()
+
+
+def reverse_func(apps, schema_editor):
+    # Write the placeholder rows back for every step an order has no row for, one batch of orders at a time
+    Order = apps.get_model("order", "Order")
+    OrderStatus = apps.get_model("order", "OrderStatus")
+    db_alias = schema_editor.connection.alias
+
+    last_id = 0
+    while orders := list(
+        Order.objects.using(db_alias).filter(id__gt=last_id).order_by("id").values_list("id", "created_at")[:BATCH_SIZE]
+    ):
+        last_id = orders[-1][0]
+        existing = set(
+            OrderStatus.objects.using(db_alias)
+            .filter(order_id__in=[order_id for order_id, _ in orders])
+            .values_list("order_id", "type")
+        )
+        OrderStatus.objects.using(db_alias).bulk_create(
+            [
+                OrderStatus(
+                    order_id=order_id,
+                    type=status_type,
+                    estimated_time=default_estimated_time(created_at, status_type),
+                )
+                for order_id, created_at in orders
+                for status_type in PLACEHOLDER_TYPES
+                if (order_id, status_type) not in existing
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0009_order_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards_func, reverse_func),
+    ]
@@ -1,10 +1,13 @@
 from django.core.validators import MaxLengthValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, AFTER_UPDATE, hook
 
 from core import choice
 from core.models import BaseModel, CreatedByMixin, UpdatedByMixin
 
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
 
 class Order(BaseModel, CreatedByMixin, UpdatedByMixin):
     """
@@ -21,6 +24,8 @@ class Order(BaseModel, CreatedByMixin, UpdatedByMixin):
         coupon_total_discount (FloatField): The discount applied via a coupon.
         product_total_discount (FloatField): The total discount applied to products.
         total_price (FloatField): The final total price after applying all discounts.
+        idempotency_key (CharField): Key sent by the client with the order request, a retried request
+            with the same key returns the existing order instead of placing a new one.
         created_at (datetime): The timestamp when the record was created.
         updated_at (datetime): The timestamp when the record was last updated.
         updated_by (int): ID of the user who last updated the record.
@@ -88,6 +93,14 @@ class Order(BaseModel, CreatedByMixin, UpdatedByMixin):
         verbose_name=_("Current Order Status"),
         help_text=_("The Current Order Status"),
     )
+    idempotency_key = models.CharField(
+        max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_("Idempotency Key"),
+        help_text=_("Key of the request that placed the order, a retry with the same key does not place it again"),
+    )
 
     def __str__(self):
         return _("Order #{} for {}").format(self.id, self.user)
@@ -96,9 +109,32 @@ class Order(BaseModel, CreatedByMixin, UpdatedByMixin):
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="order_user_idempotency_key_unique",
+            ),
+        ]
 
     def calculate_total_price(self):
         """Calculates the total price of the order."""
         total_price = (self.product_total_discount - self.coupon_total_discount) + self.shipment_price
         total_price = max(total_price, 0)
         return total_price
+
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_order_history(self):
+        # The order is part of the cached order history of its user
+        from apps.order.history import invalidate_order_history
+
+        user_id = self.user_id
+        transaction.on_commit(lambda: invalidate_order_history(user_id))
+
+    @hook(AFTER_UPDATE, when="current_status", has_changed=True)
+    def record_status_transition(self):
+        # Status rows are written on real transitions only, the other timeline steps are estimated
+        from apps.order.queries import record_order_status
+
+        record_order_status(self, self.current_status)
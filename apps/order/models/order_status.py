@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, hook
 
 from core import choice
 from core.models import BaseModel, CreatedByMixin, UpdatedByMixin
@@ -59,6 +60,15 @@ class OrderStatus(BaseModel, CreatedByMixin, UpdatedByMixin):
     def __str__(self):
         return _("Order #{} Status {}").format(self.order.id, self.get_type_display())
 
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_order_history(self):
+        # The timeline is part of the cached order history of the order's user
+        from apps.order.history import invalidate_order_history
+
+        user_id = self.order.user_id
+        transaction.on_commit(lambda: invalidate_order_history(user_id))
+
     class Meta:
         verbose_name = _("Order Status")
         verbose_name_plural = _("Order Statuses")
@@ -1,21 +1,19 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Optional
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from apps.account.models import Address, User
-from apps.carts.models import CartItem
-from apps.cms.models import ProductOfferItem
 from apps.products.models.product import Product
-from apps.products.queries import calculate_product_discount
+from apps.products.queries import calculate_product_discount, get_products_pricing
 from apps.promotions.models import Coupon
-from apps.promotions.queries import consume_coupon
+from apps.promotions.queries import consume_coupon, coupon_validate
 from apps.shipments.models import ShipmentType
-from core import choice
 
 # from core import choice
 from .models import Order, OrderItem, OrderShipment, OrderStatus
+from .stock import reserve_stock
 
 
 def place_order(
@@ -29,47 +27,81 @@ def place_order(
     total_price: float,
     cart_items: list,
     shipment_id: str,
-    status_type: int,
-    estimated_delivery_time: Optional[str],
+    idempotency_key: Optional[str] = None,
 ) -> Order:
     """
     High-level function to place an order, its items, shipment, and status.
-    Ensures that all parts of the order are created in a transaction.
-    """
-    with transaction.atomic():
-        shipment_type = ShipmentType.objects.get(
-            id=shipment_id,
-        )
-        shipment_price = shipment_type.price
-
-        try:
-            consume_coupon(user=user, total_price_order=total_price, coupon=coupon)
-        except Exception:
-            # reset discount coupon if there is an error during coupon consumption
-            coupon = None
-            total_price += coupon_total_discount
-            coupon_total_discount = 0
-
-        # Create the order
-        order = _create_order(
-            user=user,
-            address=address,
-            coupon=coupon,
-            note=note,
-            product_total_price=product_total_price,
-            coupon_total_discount=coupon_total_discount,
-            product_total_discount=product_total_discount,
-            total_price=total_price,
-            shipment_price=shipment_price,
-        )
-
-        # Create the order items
-        _create_order_items(order, cart_items)
-        # Create the shipment
-        _create_order_shipment(order, shipment_type)
-        # Create the order status
-        _create_order_status(order, status_type, estimated_delivery_time)
-        return order
+    The shipment, coupon and item prices are checked before the transaction, all parts of the order are then
+    created with bulk inserts in one short transaction. Under the stock locks the prices are only re-checked,
+    a product is priced again there only when its price or offer changed meanwhile, see `reserve_stock`.
+    A request retried with the same `idempotency_key` gets the order of the first request back,
+    nothing is placed twice.
+
+    Raises:
+        InsufficientStock: When a product does not have enough stock left.
+        ValidationError: When the coupon was used up by concurrent orders.
+    """
+    if idempotency_key:
+        order = get_order_by_idempotency_key(user, idempotency_key)
+        if order:
+            return order
+
+    shipment_type = ShipmentType.objects.get(
+        id=shipment_id,
+    )
+    shipment_price = shipment_type.price
+
+    try:
+        coupon_validate(user=user, coupon=coupon, cart_total_price=total_price)
+    except Exception:
+        # reset discount coupon if it can not be used
+        coupon = None
+        total_price += coupon_total_discount
+        coupon_total_discount = 0
+
+    quantities = {}
+    for item in cart_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    pricing = get_products_pricing(list(quantities), quantities)
+
+    try:
+        with transaction.atomic():
+            # Create the order
+            order = _create_order(
+                user=user,
+                address=address,
+                coupon=coupon,
+                note=note,
+                product_total_price=product_total_price,
+                coupon_total_discount=coupon_total_discount,
+                product_total_discount=product_total_discount,
+                total_price=total_price,
+                shipment_price=shipment_price,
+                idempotency_key=idempotency_key,
+            )
+
+            # Create the shipment
+            _create_order_shipment(order, shipment_type)
+            # Create the order status
+            _create_order_status(order)
+            # Reserve the stock and create the order items last, the product rows stay locked until the commit
+            _create_order_items(order, quantities, pricing)
+            # Take the coupon use last, its row is locked by the conditional update until the commit
+            if coupon:
+                consume_coupon(user=user, total_price_order=total_price, coupon=coupon, validate=False)
+    except IntegrityError:
+        # A concurrent request with the same key placed the order first
+        order = get_order_by_idempotency_key(user, idempotency_key) if idempotency_key else None
+        if order is None:
+            raise
+    return order
+
+
+def get_order_by_idempotency_key(user: User, idempotency_key: str) -> Optional[Order]:
+    """
+    Fetches the order the user placed with the given idempotency key, if any.
+    """
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
 
 
 def _create_order(
@@ -82,6 +114,7 @@ def _create_order(
     product_total_discount: float,
     total_price: float,
     shipment_price: float,
+    idempotency_key: Optional[str] = None,
 ) -> Order:
     """
     Creates and saves an order record.
@@ -100,72 +133,46 @@ def _create_order(
         product_total_discount=product_total_discount,
         total_price=total_price,
         shipment_price=shipment_price,
+        idempotency_key=idempotency_key,
     )
     order.save()
     return order
 
 
-def _create_order_items(order: Order, cart_items: list[CartItem]) -> list[OrderItem]:
+def _create_order_items(order: Order, quantities: dict[int, int], pricing: dict[int, dict]) -> list[OrderItem]:
     """
-    Creates order items based on the provided data.
+    Reserves the stock of the ordered quantities and creates their order items at the quoted prices.
+    Raises `InsufficientStock` when any product can not be ordered in full, see `reserve_stock`.
     """
-    order_items = []
-    updated_products = []
-    updated_offers = []
-    for item_data in cart_items:
-        obj, product, offers = _create_order_item(order, item_data, commit=False)
-        if not obj:
-            continue
-        order_items.append(obj)
-        updated_products.append(product)
-        updated_offers.extend(offers)
-
-    OrderItem.objects.bulk_create(order_items)
-    Product.objects.bulk_update(updated_products, fields=["stock"])
-    ProductOfferItem.objects.bulk_update(updated_offers, ["sold_stock"])
+    products = reserve_stock(quantities, pricing)
+    order_items = [
+        _create_order_item(order, product, quantities[product_id], commit=False) for product_id, product in products.items()
+    ]
+    return OrderItem.objects.bulk_create(order_items)
 
 
-def _create_order_item(order: Order, item: CartItem, commit: bool = True) -> tuple[OrderItem, Product, list[ProductOfferItem]]:
+def _create_order_item(order: Order, product: Product, quantity: int, commit: bool = True) -> OrderItem:
     """
-    Creates a single order item for the given order.
+    Creates a single order item for the given order, the stock of the product must already be reserved.
     """
-    available_quantity = min(item.quantity, item.product.stock)
-    if not available_quantity:
-        return None, item.product
-
-    _, total_price, product_price_with_discount = calculate_product_discount(item.product, available_quantity)
+    _, total_price, product_price_with_discount = calculate_product_discount(product, quantity)
 
     # Ensure accurate discount per unit
-    unit_discount = total_price / available_quantity
+    unit_discount = total_price / quantity
 
     obj = OrderItem(
         order=order,
         user=order.user,
-        product=item.product,
-        product_title=item.product.title,
-        product_price=item.product.price,
+        product=product,
+        product_title=product.title,
+        product_price=product.price,
         product_discount=unit_discount,
-        quantity=available_quantity,
+        quantity=quantity,
         price=total_price,
     )
-    # Update Stock and Save the Product
-    # TODO: Update Offer Sold Stock Quantity in Offer Table
-    product = item.product
-    product.stock -= available_quantity
-    active_offers = product.offers.filter(is_active=True, product_offer__is_active=True)
-    updated_offers = []
-
-    # Calculate the offer updates, but do not commit yet
-    for offer in active_offers:
-        available_quantity_offer = offer.stock - offer.sold_stock
-        offer.sold_stock += min(available_quantity_offer, available_quantity)
-        updated_offers.append(offer)
-
     if commit:
         obj.save()
-        product.save()
-        ProductOfferItem.objects.bulk_update(updated_offers, ["sold_stock"])
-    return obj, product, updated_offers
+    return obj
 
 
 def _create_order_shipment(order: Order, shipment_type: ShipmentType) -> None:
@@ -182,33 +189,33 @@ def _create_order_shipment(order: Order, shipment_type: ShipmentType) -> None:
     )
 
 
-def _create_order_status(order: Order, status_type: int, estimated_delivery_time: Optional[str], commit: bool = True) -> None:
+def _create_order_status(order: Order, commit: bool = True) -> OrderStatus:
     """
-    Creates an initial status for the given order.
+    Records the initial status of the given order (its `current_status`). The later steps of the timeline
+    are not stored up front, they are estimated until the order reaches them, see `record_order_status`
+    and `get_order_timeline`.
     """
-    statues = []
-    valid_statues = (
-        choice.ORDER_STATUS_PAYMENT_WAITING,
-        choice.ORDER_STATUS_ORDER_PLACED,
-        choice.ORDER_STATUS_PRODUCT_PACKAGING,
-        choice.ORDER_STATUS_READY_FOR_SHIPMENT,
-        choice.ORDER_STATUS_ON_THE_WAY,
-        choice.ORDER_STATUS_DROPPED_IN_DELIVERY,
-        choice.ORDER_STATUS_DELIVERED,
+    obj = OrderStatus(
+        order=order,
+        type=order.current_status,
+        timestamp=timezone.now(),
     )
+    if commit:
+        obj.save()
+    return obj
 
-    for status in valid_statues:
-        estimated_time = datetime.now() + timedelta(days=status)
-        obj = OrderStatus(
-            order=order,
-            type=status,
-            estimated_time=estimated_time,
-        )
-        statues.append(obj)
 
-    if commit:
-        statues = OrderStatus.objects.bulk_create(statues)
-    return statues
+def record_order_status(order: Order, status_type: int) -> OrderStatus:
+    """
+    Records a transition of the order to the given status. A row that only overrides the estimate
+    of that status gets the timestamp, otherwise a new row is written.
+    """
+    status = order.order_statuses.filter(type=status_type, timestamp__isnull=True).first()
+    if status is None:
+        status = OrderStatus(order=order, type=status_type)
+    status.timestamp = timezone.now()
+    status.save()
+    return status
 
 
 def get_order_by_id(order_id: int) -> Order:
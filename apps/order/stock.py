@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from apps.cms.models import ProductOfferItem
+from apps.cms.queries import invalidate_active_offer_index
+from apps.products.models import Product
+from apps.products.queries import attach_products_pricing
+
+from .errors import InsufficientStock
+
+
+def _is_quote_valid(product: Product, quote: dict, offer_item: ProductOfferItem | None, now) -> bool:
+    """
+    Whether a price quoted before the locks still holds for the locked product: same price, and the offer
+    used for it is still open with its discount and enough remaining stock for the offer quantity.
+    """
+    if quote["price"] != product.price:
+        return False
+    offer = quote["offer"]
+    if offer is None:
+        return True
+    return (
+        offer_item is not None
+        and offer_item.id == offer.id
+        and offer_item.is_active
+        and offer_item.product_offer.is_active
+        and offer_item.product_offer.active_from <= now <= offer_item.product_offer.active_until
+        and offer_item.discount == offer.discount
+        and (offer_item.stock is None or offer_item.stock - offer_item.sold_stock >= quote["offer_quantity"])
+    )
+
+
+def _lock_offer_items(condition: Q) -> dict[int, ProductOfferItem]:
+    """Locks the matching offer items in id order, returned per offer item id."""
+    return {
+        offer_item.id: offer_item
+        for offer_item in ProductOfferItem.objects.select_for_update(of=("self",), no_key=True)
+        .filter(condition)
+        .select_related("product_offer")
+        .order_by("id")
+    }
+
+
+def reserve_stock(quantities: dict[int, int], pricing: dict[int, dict] | None = None) -> dict[int, Product]:
+    """
+    Takes the ordered quantities out of the product stock, all or nothing, inside the caller's transaction.
+
+    The product rows and the offer items used for their prices are locked in id order, so concurrent checkouts
+    of the same products wait for each other instead of overselling, and always lock in the same order so
+    they can not deadlock. The locks are held until the caller's transaction ends, reserve as late as possible.
+    They are NO KEY UPDATE locks, inserts that only reference the products (cart and order items) do not
+    wait for them, nor deadlock with them.
+    The stock is decreased with a single conditional UPDATE (`stock >= quantity`), the sold stock of the
+    offers used for the price with another one, and the cached active-offer index is dropped on commit.
+
+    Prices are best quoted before the transaction (`get_products_pricing` for the same quantities). Under the
+    locks the quotes are only re-checked against the locked rows, products whose quote no longer holds are
+    priced again there.
+
+    Args:
+        quantities (dict[int, int]): Quantity per product id.
+        pricing (dict[int, dict], optional): Prices quoted before the transaction, per product id.
+
+    Returns:
+        dict[int, Product]: The locked products per id, with their stock after the reservation and
+            `pricing` attached for the reserved quantity (offers as they were before the reservation).
+
+    Raises:
+        InsufficientStock: A product is inactive, missing or has less stock than its quantity.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return {}
+    if not transaction.get_connection().in_atomic_block:
+        raise transaction.TransactionManagementError("reserve_stock must run inside a transaction.")
+
+    products = {
+        product.id: product
+        for product in Product.objects.select_for_update(of=("self",), no_key=True)
+        .filter(id__in=quantities, is_active=True)
+        .only("id", "title", "price", "stock")
+        .order_by("id")
+    }
+    short = [
+        product_id
+        for product_id, quantity in quantities.items()
+        if product_id not in products or products[product_id].stock < quantity
+    ]
+    if short:
+        raise InsufficientStock(short)
+
+    # The offer prices depend on the remaining offer stock, lock the offer items the quotes used before checking
+    # them. A product can have several offer items (past and future offers), only the quoted one matters
+    pricing = pricing or {}
+    quoted_offer_ids = [
+        quote["offer"].id for product_id, quote in pricing.items() if product_id in products and quote["offer"] is not None
+    ]
+    offer_items = _lock_offer_items(Q(id__in=quoted_offer_ids, product_id__in=list(products))) if quoted_offer_ids else {}
+    now = timezone.now()
+    stale = []
+    for product_id, product in products.items():
+        quote = pricing.get(product_id)
+        if (
+            quote
+            and quote["quantity"] == quantities[product_id]
+            and _is_quote_valid(product, quote, offer_items.get(quote["offer"].id) if quote["offer"] else None, now)
+        ):
+            product.pricing = quote
+        else:
+            stale.append(product)
+    if stale:
+        # Any offer item of these products may be used for the new price. The product rows are locked already,
+        # so no other reservation waits for these offer items in another order
+        _lock_offer_items(Q(product_id__in=[product.id for product in stale]) & ~Q(id__in=list(offer_items)))
+        attach_products_pricing(stale, quantities)
+
+    condition = Q(pk__in=[])
+    for product_id, quantity in quantities.items():
+        condition |= Q(id=product_id, stock__gte=quantity)
+    updated = Product.objects.filter(condition).update(
+        stock=Case(
+            *(When(id=product_id, then=F("stock") - Value(quantity)) for product_id, quantity in quantities.items()),
+            output_field=IntegerField(),
+        )
+    )
+    if updated != len(quantities):
+        # Can not happen while the rows are locked, guards against callers that bypass the locks
+        raise InsufficientStock(quantities)
+
+    offer_quantities = {}
+    for product_id, product in products.items():
+        product.stock -= quantities[product_id]
+        if product.pricing["offer_quantity"]:
+            offer_quantities[product.pricing["offer"].id] = product.pricing["offer_quantity"]
+
+    if offer_quantities:
+        ProductOfferItem.objects.filter(id__in=offer_quantities).update(
+            sold_stock=Case(
+                *(
+                    When(id=offer_id, then=F("sold_stock") + Value(quantity))
+                    for offer_id, quantity in offer_quantities.items()
+                ),
+                output_field=IntegerField(),
+            )
+        )
+        # The queryset update skips the offer item hooks, the cached index holds the remaining offer stock
+        transaction.on_commit(invalidate_active_offer_index)
+    return products
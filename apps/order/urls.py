@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("history/", views.OrderHistoryView.as_view()),
+]
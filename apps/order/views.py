@@ -1 +1,45 @@
-# Create your views here.
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.pagination import InvalidCursor
+
+from .history import ORDER_HISTORY_PAGE_SIZE, get_order_history_page
+
+
+class OrderHistoryView(GenericAPIView):
+    """
+    Order history of the user, newest first, with the status timeline of every order.
+    Paginated by the `cursor` query parameter, pages come from the per user order history cache.
+    """
+
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+    cursor_query_param = "cursor"
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            page = get_order_history_page(
+                request.user, request.query_params.get(self.cursor_query_param), ORDER_HISTORY_PAGE_SIZE
+            )
+        except InvalidCursor as e:
+            raise NotFound(str(e)) from e
+
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_link(page["next_cursor"])),
+                    ("previous", self.get_link(page["previous_cursor"])),
+                    ("results", page["orders"]),
+                ]
+            )
+        )
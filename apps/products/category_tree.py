@@ -0,0 +1,103 @@
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import ProductCategory
+
+CATEGORY_TREE_VERSION_KEY = "products:category_tree:version"
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+# In-process copy of the tree, reused until the version in cache moves on
+_local_tree = {"version": None, "tree": None}
+
+
+class CategoryTree:
+    """
+    Materialized tree of the product categories, answers tree lookups without the database.
+    Built from a single query, the category instances are shared between requests and must be treated as read only.
+    Like the queries it replaces, single lookups, `all` and `roots` only return active categories, while
+    children and descendants include inactive ones, as `get_descendants` does.
+    methods:
+        - get: category by id, None when missing or inactive
+        - all: active categories
+        - roots: active top level categories ordered by priority
+        - children: direct children ordered by priority
+        - descendants: all descendants ordered by priority
+        - ancestors: ancestors from the root down to the parent
+        - descendant_ids: ids of the category and all its descendants
+    """
+
+    def __init__(self, categories):
+        self.nodes = {category.id: category for category in categories}
+        self.children_ids = defaultdict(list)
+        for category in self.nodes.values():
+            self.children_ids[category.parent_id].append(category.id)
+        for ids in self.children_ids.values():
+            ids.sort(key=lambda category_id: -self.nodes[category_id].priority)
+        self.children_ids = dict(self.children_ids)
+
+    def get(self, category_id) -> ProductCategory | None:
+        try:
+            category = self.nodes.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+        return category if category and category.is_active else None
+
+    def all(self) -> list[ProductCategory]:
+        return [category for category in self.nodes.values() if category.is_active]
+
+    def roots(self) -> list[ProductCategory]:
+        return [category for category in self.children(None) if category.is_active]
+
+    def children(self, category_id) -> list[ProductCategory]:
+        return [self.nodes[child_id] for child_id in self.children_ids.get(category_id, [])]
+
+    def descendant_ids(self, category_id, include_self: bool = True) -> list[int]:
+        ids = [category_id] if include_self and category_id in self.nodes else []
+        stack = list(reversed(self.children_ids.get(category_id, [])))
+        while stack:
+            child_id = stack.pop()
+            ids.append(child_id)
+            stack.extend(reversed(self.children_ids.get(child_id, [])))
+        return ids
+
+    def descendants(self, category_id, include_self: bool = False) -> list[ProductCategory]:
+        categories = [self.nodes[descendant_id] for descendant_id in self.descendant_ids(category_id, include_self)]
+        return sorted(categories, key=lambda category: -category.priority)
+
+    def ancestors(self, category_id, include_self: bool = False) -> list[ProductCategory]:
+        category = self.nodes.get(category_id)
+        ancestors = [category] if include_self and category else []
+        while category and category.parent_id in self.nodes:
+            category = self.nodes[category.parent_id]
+            ancestors.append(category)
+        return ancestors[::-1]
+
+
+def get_category_tree() -> CategoryTree:
+    """
+    Returns the category tree. The in-process copy is used while its version matches the one in cache,
+    then the tree is loaded from cache, and only built from the database when the cache is empty too.
+    """
+    # A time based first version, so an evicted version key never brings back an older copy
+    version = cache.get_or_set(CATEGORY_TREE_VERSION_KEY, time.time_ns, None)
+    if _local_tree["version"] == version:
+        return _local_tree["tree"]
+
+    key = f"products:category_tree:{version}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = CategoryTree(ProductCategory.objects.order_by("tree_id", "lft"))
+        cache.set(key, tree, CATEGORY_TREE_TIMEOUT)
+
+    _local_tree.update(version=version, tree=tree)
+    return tree
+
+
+def invalidate_category_tree() -> None:
+    """Moves the category tree to a new version, every process reloads it on the next lookup."""
+    try:
+        cache.incr(CATEGORY_TREE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORY_TREE_VERSION_KEY, time.time_ns(), None)
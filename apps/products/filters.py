@@ -1,9 +1,11 @@
-from django.db.models import Avg, Count, Q
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from django_filters import ChoiceFilter, FilterSet, ModelMultipleChoiceFilter, MultipleChoiceFilter, NumberFilter
 
-from apps.products.models import ProductBrand, ProductCategory
+from apps.products.category_tree import get_category_tree
+from apps.products.models import ProductBrand
 from apps.products.models.product import Product
+from apps.products.queries import get_base_product_facets, get_product_facets
 from core import choice
 
 SORT_CHOICES = [
@@ -20,11 +22,9 @@ class ProductListFilter(FilterSet):
         null_label=_("Other"),
         queryset=ProductBrand.objects.filter(is_active=True),
     )
-    category = ModelMultipleChoiceFilter(
+    category = MultipleChoiceFilter(
         field_name="category",
         lookup_expr="exact",
-        null_label=_("Other"),
-        queryset=ProductCategory.objects.filter(is_active=True),
     )
     sort = ChoiceFilter(
         choices=SORT_CHOICES,
@@ -49,6 +49,30 @@ class ProductListFilter(FilterSet):
         model = Product
         fields = ["title", "brand", "category", "min_price", "max_price"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Category choices come from the cached category tree instead of a query per instantiation
+        self.filters["category"].extra["choices"] = [(category.id, category.title) for category in get_category_tree().all()]
+
+    def is_filtered(self) -> bool:
+        """Whether any filter narrows down the products, sorting does not count."""
+        for name in self.filters:
+            if name == "sort":
+                continue
+            values = self.data.getlist(name) if hasattr(self.data, "getlist") else [self.data.get(name)]
+            if any(value not in (None, "") for value in values):
+                return True
+        return False
+
+    def get_facets(self, scope: str) -> dict:
+        """
+        Facet counts (brands, categories, price buckets and ratings) of the filtered products.
+        Without an active filter the cached base counts of the listing scope are returned.
+        """
+        if self.is_filtered():
+            return get_product_facets(self.qs)
+        return get_base_product_facets(self.queryset, scope)
+
     def filter_by_ratings(self, queryset, name, values):
         """
         Filters products based on multiple selected ratings.
@@ -58,15 +82,15 @@ class ProductListFilter(FilterSet):
             for value in values:
                 try:
                     value = int(value)
-                    rating_queries |= Q(avg_rating__gte=value, avg_rating__lt=value + 1)
+                    rating_queries |= Q(rating_avg__gte=value, rating_avg__lt=value + 1)
                     # include products without rating when user select 1 star
                     if value == 1:
-                        rating_queries |= Q(avg_rating__isnull=True)
+                        rating_queries |= Q(rating_count=0)
 
                 except ValueError:
                     pass
-            # Annotate average rating and filter
-            return queryset.annotate(avg_rating=Avg("product_reviews__rating")).filter(rating_queries).order_by("avg_rating")
+            # Filter on the stored average rating
+            return queryset.filter(rating_queries).order_by("rating_avg")
 
         return queryset
 
@@ -79,5 +103,5 @@ class ProductListFilter(FilterSet):
         elif value == "popular":
             return queryset.annotate(order_count=Count("order_items")).order_by("-order_count")
         elif value == "rating":
-            return queryset.annotate(avg_rating=Avg("product_reviews__rating")).order_by("-avg_rating")
+            return queryset.order_by("-rating_avg", "-rating_count")
         return queryset
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.products.models import Product, ProductCategory
+from apps.products.search import SimpleSearchBackend, get_search_backend
+
+WORDS = [
+    "گوشی", "لپ‌تاپ", "هدفون", "کیف", "کفش", "ساعت", "دوربین", "کتاب", "میز", "صندلی",
+    "phone", "laptop", "headphone", "wireless", "bluetooth", "leather", "sport", "smart", "gaming", "classic",
+]  # fmt: skip
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of the configured product search backend against the `icontains` path "
+        "on a generated product fixture. The fixture is created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=100_000, help="Number of generated products.")
+        parser.add_argument("--repeat", type=int, default=20, help="Number of runs per query.")
+        parser.add_argument("--limit", type=int, default=9, help="Number of results fetched per run, a result page.")
+        parser.add_argument(
+            "--query",
+            action="append",
+            dest="queries",
+            help="Search query, can be repeated. Defaults to a few exact, multi word and misspelled queries.",
+        )
+
+    def handle(self, *args, **options):
+        queries = options["queries"] or ["laptop", "smart phone", "گوشی", "wirelss", "leathr sport"]
+        backends = {"icontains": SimpleSearchBackend(), "configured": get_search_backend()}
+
+        with transaction.atomic():
+            self.create_fixture(options["products"])
+            for name, backend in backends.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{name} ({backend.__class__.__name__})"))
+                for query in queries:
+                    timings = self.measure(backend, query, options["repeat"], options["limit"])
+                    self.stdout.write(
+                        f"  {query!r:20} median {statistics.median(timings):8.2f} ms"
+                        f"  p95 {self.percentile(timings, 95):8.2f} ms"
+                    )
+            transaction.set_rollback(True)
+
+    def create_fixture(self, count: int, batch_size: int = 5000) -> None:
+        self.stdout.write(f"Creating {count} products ...")
+        rng = random.Random(0)  # noqa: S311
+        category = ProductCategory.objects.create(title="benchmark", description="benchmark")
+        for start in range(0, count, batch_size):
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        title=" ".join(rng.sample(WORDS, 3)),
+                        description=" ".join(rng.choices(WORDS, k=30)),
+                        category=category,
+                        stock=rng.randint(0, 100),
+                        price=rng.randint(1, 1000) * 1000,
+                    )
+                    for _ in range(start, min(start + batch_size, count))
+                ]
+            )
+        # `bulk_create` skips the hooks, index the fixture explicitly
+        get_search_backend().update_products(category.products.values("id"))
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {Product._meta.db_table}")
+
+    def measure(self, backend, query: str, repeat: int, limit: int) -> list[float]:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(backend.search(Product.objects.all(), query)[:limit])
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    @staticmethod
+    def percentile(values: list[float], percent: int) -> float:
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, round(len(ordered) * percent / 100))]
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.queries import rebuild_products_rating
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored rating aggregates (average, count and star histogram) of products from accepted reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only rebuild the given product id, can be repeated.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of products updated per bulk update.",
+        )
+
+    def handle(self, *args, **options):
+        updated = rebuild_products_rating(options["product_ids"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating of {updated} products."))
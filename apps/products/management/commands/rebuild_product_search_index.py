@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index of the configured search backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only rebuild the given product id, can be repeated.",
+        )
+
+    def handle(self, *args, **options):
+        updated = get_search_backend().update_products(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index of {updated} products."))
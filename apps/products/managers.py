@@ -0,0 +1,67 @@
+from django.db.models.query import ModelIterable, QuerySet
+
+from core.models import DefaultManager
+
+
+class ProductQuerySet(QuerySet):
+    """
+    Product QuerySet
+    Adds batch helpers that are applied once, right after the queryset is evaluated.
+    methods:
+        - with_pricing: attach the batch pricing result to every fetched product
+        - with_wishlist: mark every fetched product that is in the user's wishlist
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._with_pricing = False
+        self._wishlist_user = None
+        self._batch_done = False
+
+    def with_pricing(self):
+        """
+        Mark the queryset so that the best offer, best discount and prices of all fetched
+        products are loaded in a fixed number of queries instead of per product.
+        """
+        clone = self._chain()
+        clone._with_pricing = True
+        return clone
+
+    def with_wishlist(self, user):
+        """
+        Mark the queryset so that `in_wishlist` of every fetched product is set from the user's
+        cached wishlist ids, instead of a subquery per product.
+        """
+        clone = self._chain()
+        clone._wishlist_user = user
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_pricing = self._with_pricing
+        clone._wishlist_user = self._wishlist_user
+        return clone
+
+    def _fetch_all(self):
+        super()._fetch_all()
+        if self._batch_done or not issubclass(self._iterable_class, ModelIterable):
+            return
+
+        self._batch_done = True
+        if self._with_pricing:
+            from apps.products.queries import attach_products_pricing
+
+            attach_products_pricing(self._result_cache)
+        if self._wishlist_user is not None:
+            from apps.products.queries import get_user_wishlist_ids
+
+            wishlist_ids = get_user_wishlist_ids(self._wishlist_user)
+            for product in self._result_cache:
+                product.in_wishlist = product.id in wishlist_ids
+
+
+class ProductManager(DefaultManager.from_queryset(ProductQuerySet)):
+    """
+    Product Manager
+    Default manager of products, exposes the `ProductQuerySet` helpers.
+    """
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+import apps.products.models.product
+
+
+def forwards_func(apps, schema_editor):
+    # Fill the new rating aggregates from the already accepted reviews
+    Product = apps.get_model("products", "Product")
+    ProductReview = apps.get_model("products", "ProductReview")
+    db_alias = schema_editor.connection.alias
+
+    histograms = {}
+    rows = (
+        ProductReview.objects.using(db_alias)
+        .filter(is_accepted=True)
+        .values("product_id", "rating")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        histogram = histograms.setdefault(row["product_id"], {str(rating): 0 for rating in range(1, 6)})
+        histogram[str(row["rating"])] = row["total"]
+
+    products = []
+    for product in Product.objects.using(db_alias).filter(id__in=histograms.keys()).only("id"):
+        histogram = histograms[product.id]
+        product.rating_count = sum(histogram.values())
+        product.rating_avg = sum(int(rating) * count for rating, count in histogram.items()) / product.rating_count
+        product.rating_histogram = histogram
+        products.append(product)
+
+    Product.objects.using(db_alias).bulk_update(products, ["rating_avg", "rating_count", "rating_histogram"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0016_alter_productcategory_managers_productcategory_level_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_avg",
+            field=models.FloatField(db_index=True, default=0.0, editable=False, verbose_name="Average Rating"),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name="Rating Count"),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_histogram",
+            field=models.JSONField(
+                default=apps.products.models.product.default_rating_histogram, editable=False, verbose_name="Rating Histogram"
+            ),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
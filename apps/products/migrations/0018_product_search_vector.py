@@ -0,0 +1,52 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:28
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Value
+
+
+def forwards_func(apps, schema_editor):
+    # Fill the search vector of existing products, one UPDATE per category
+    Product = apps.get_model("products", "Product")
+    ProductCategory = apps.get_model("products", "ProductCategory")
+    db_alias = schema_editor.connection.alias
+    config = getattr(settings, "PRODUCTS_SEARCH_CONFIG", "simple")
+
+    for category_id, category_title in ProductCategory._default_manager.using(db_alias).values_list("id", "title"):
+        Product.objects.using(db_alias).filter(category_id=category_id).update(
+            search_vector=(
+                SearchVector("title", weight="A", config=config)
+                + SearchVector(Value(category_title or ""), weight="B", config=config)
+                + SearchVector("description", weight="C", config=config)
+            )
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0017_product_rating_aggregates"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name="Search Vector"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["title"], name="product_title_trgm_idx", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
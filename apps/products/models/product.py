@@ -1,15 +1,23 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (
     MaxLengthValidator,
     MaxValueValidator,
     MinValueValidator,
 )
-from django.db import models
-from django.db.models import Avg
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_CREATE, AFTER_DELETE, AFTER_UPDATE, hook
 
 from core.models import AnalyticsBaseModel, BaseModel, CreatedByMixin, UpdatedByMixin
 
+from ..managers import ProductManager
+
+
+def default_rating_histogram() -> dict:
+    """Returns an empty star histogram, number of accepted reviews per rating (1-5)."""
+    return {str(rating): 0 for rating in range(1, 6)}
+
 
 class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
     """
@@ -27,8 +35,14 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
         updated_at (datetime): The date and time when the product was last updated.
         updated_by (int): ID of the user who last updated the product.
         created_by (int): ID of the user who created the product.
+        rating_avg (float): Denormalized average rating of the accepted reviews.
+        rating_count (int): Denormalized count of the accepted reviews.
+        rating_histogram (dict): Denormalized count of the accepted reviews per star, e.g. {"1": 0, ..., "5": 3}.
+        search_vector (SearchVector): Stored weighted full-text vector of title, category title and description.
     """
 
+    objects = ProductManager()
+
     title = models.CharField(
         max_length=100,
         verbose_name=_("Title"),
@@ -69,14 +83,59 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
         blank=True,
         verbose_name=_("Variants"),
     )
+    # Rating aggregates, maintained by `ProductReview` hooks and `rebuild_product_ratings` command
+    rating_avg = models.FloatField(
+        verbose_name=_("Average Rating"),
+        default=0.0,
+        editable=False,
+        db_index=True,
+    )
+    rating_count = models.PositiveIntegerField(
+        verbose_name=_("Rating Count"),
+        default=0,
+        editable=False,
+        db_index=True,
+    )
+    rating_histogram = models.JSONField(
+        verbose_name=_("Rating Histogram"),
+        default=default_rating_histogram,
+        editable=False,
+    )
+    # Full-text index, maintained by `update_search_vector` hook and `rebuild_product_search_index` command
+    search_vector = SearchVectorField(
+        verbose_name=_("Search Vector"),
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+            GinIndex(fields=["title"], name="product_title_trgm_idx", opclasses=["gin_trgm_ops"]),
+        ]
 
     def __str__(self):
         return f"{self.title} - ({self.id})"
 
+    @hook(AFTER_CREATE)
+    @hook(AFTER_UPDATE, when_any=["title", "description", "category"], has_changed=True)
+    def update_search_vector(self):
+        """Refreshes the stored search vector when a searchable field changes."""
+        from apps.products.search import get_search_backend
+
+        get_search_backend().update_products([self.pk])
+
+    @hook(AFTER_CREATE)
+    @hook(AFTER_DELETE)
+    @hook(AFTER_UPDATE, when_any=["is_active", "brand", "category", "price"], has_changed=True)
+    def invalidate_facets(self):
+        """Drops the cached facet counts once a change of a faceted field is committed."""
+        from apps.products.queries import invalidate_product_facets
+
+        transaction.on_commit(invalidate_product_facets)
+
     def get_rating(self) -> dict:
         """
         Returns a dictionary containing the product's rating information, including
@@ -88,22 +147,20 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
             an empty star, based on the  average rating (e.g., [1, 1, 1, 1, 0] for 4 stars).
             - "review_count": The total number of accepted reviews for the product.
             - "avg_rating": The  average rating value as an integer (1-5).
+            - "histogram": Count of accepted reviews per star.
 
         Example output:
             {
                 "stars": [1, 1, 1, 1, 0],  # 4 filled stars and 1 empty star
                 "review_count": 15,         # 15 accepted reviews
-                "avg_rating": 4             # Average rating  to 4
+                "avg_rating": 4,            # Average rating  to 4
+                "histogram": {"1": 0, "2": 0, "3": 2, "4": 7, "5": 6},
             }
         """
 
-        # Aggregate the average rating of accepted reviews
-        avg_rating = self.product_reviews.filter(is_accepted=True).aggregate(
-            avg_rating=Coalesce(Avg("rating"), 0.0),
-        )["avg_rating"]
-
-        # Count the total number of accepted reviews
-        review_count = self.product_reviews.filter(is_accepted=True).count()
+        # Aggregates are stored on the product, no query is needed
+        avg_rating = self.rating_avg or 0.0
+        review_count = self.rating_count
 
         # Round the average rating to 2 decimal places
         avg_rating_value = round(avg_rating, 2)
@@ -114,15 +171,20 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
         # Create the merged list of stars (1s for filled, 0s for empty)
         stars = [1] * avg_rating_rounded + [0] * (5 - avg_rating_rounded)
 
-        # Return a dictionary with the merged list of stars, average rating, review count.
+        # Return a dictionary with the merged list of stars, average rating, review count and histogram.
         return {
             "stars": stars,
             "review_count": review_count,  # Count of accepted reviews
             "avg_rating": avg_rating_value,
+            "histogram": self.rating_histogram,
         }
 
     @property
     def discount_info(self):
+        """
+        Discount info of one unit of the product, uses the batch pricing result
+        (`pricing`) when it is attached by `ProductQuerySet.with_pricing`.
+        """
         from apps.products.queries import calculate_product_discount
 
         discount = calculate_product_discount(self, 1)
@@ -146,6 +208,10 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
 
     @property
     def best_offer(self):
+        pricing = getattr(self, "pricing", None)
+        if pricing is not None:
+            return pricing["offer"]
+
         from apps.products.queries import get_best_offer
 
         best_offer = get_best_offer(self)
@@ -162,6 +228,12 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
 
         return in_wishlist
 
+    @property
+    def first_image(self):
+        """First product image, served from the prefetched `product_images` when available."""
+        images = self.product_images.all()
+        return images[0] if images else None
+
     def calculate_remaining_stock(self) -> int:
         """
         Calculate the total remaining stock for the product across all offers.
@@ -169,6 +241,10 @@ class Product(BaseModel, CreatedByMixin, UpdatedByMixin, AnalyticsBaseModel):
         Returns:
             int: The total remaining stock for the product.
         """
+        offer_remaining_stock = getattr(self, "offer_remaining_stock", None)
+        if offer_remaining_stock is not None:
+            return offer_remaining_stock
+
         total_remaining_stock = 0
 
         for offer_item in self.offers.all():
@@ -1,6 +1,7 @@
 from django.core.validators import MaxLengthValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, AFTER_UPDATE, hook
 from mptt.models import MPTTModel, TreeForeignKey
 
 from core.models import BaseModel, CreatedByMixin, PriorityMixin, UpdatedByMixin
@@ -52,3 +53,18 @@ class ProductCategory(BaseModel, CreatedByMixin, PriorityMixin, UpdatedByMixin,
 
     def __str__(self):
         return self.title
+
+    @hook(AFTER_UPDATE, when="title", has_changed=True)
+    def update_products_search_vector(self):
+        """The category title is part of the products search vector, refresh them on rename."""
+        from apps.products.search import get_search_backend
+
+        get_search_backend().update_products(self.products.values("id"))
+
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_category_tree(self):
+        """Moves the cached category tree to a new version once the change is committed."""
+        from apps.products.category_tree import invalidate_category_tree
+
+        transaction.on_commit(invalidate_category_tree)
@@ -1,6 +1,7 @@
 from django.core.validators import MaxLengthValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_CREATE, AFTER_DELETE, AFTER_UPDATE, hook
 
 from core import choice
 from core.models import BaseModel, CreatedByMixin, UpdatedByMixin
@@ -83,3 +84,32 @@ class ProductReview(BaseModel, CreatedByMixin, UpdatedByMixin):
             - If the review rating is 2, the output will be [1, 1, 0, 0, 0].
         """
         return [1] * self.rating + [0] * (5 - self.rating)
+
+    @hook(AFTER_CREATE, when="is_accepted", is_now=True)
+    def add_rating_to_product(self):
+        """Counts the rating of a new accepted review in the product rating aggregates."""
+        from apps.products.queries import apply_product_rating_change
+
+        apply_product_rating_change(self.product_id, added_rating=self.rating)
+
+    @hook(AFTER_UPDATE, when_any=["is_accepted", "rating", "product"], has_changed=True)
+    def update_product_rating(self):
+        """Moves the rating of an accepted, rejected, edited or re-assigned review in the product rating aggregates."""
+        from apps.products.queries import apply_product_rating_change
+
+        initial_product_id = self.initial_value("product")
+        initial_rating = self.initial_value("rating") if self.initial_value("is_accepted") else None
+        rating = self.rating if self.is_accepted else None
+
+        if initial_product_id != self.product_id:
+            apply_product_rating_change(initial_product_id, removed_rating=initial_rating)
+            apply_product_rating_change(self.product_id, added_rating=rating)
+        else:
+            apply_product_rating_change(self.product_id, removed_rating=initial_rating, added_rating=rating)
+
+    @hook(AFTER_DELETE, when="is_accepted", is_now=True)
+    def remove_rating_from_product(self):
+        """Removes the rating of a deleted accepted review from the product rating aggregates."""
+        from apps.products.queries import apply_product_rating_change
+
+        apply_product_rating_change(self.product_id, removed_rating=self.rating)
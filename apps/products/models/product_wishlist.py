@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, hook
 
 from core.models import BaseModel
 
@@ -37,3 +38,11 @@ class ProductWishlist(BaseModel):
 
     def __str__(self):
         return f"Wishlist - {self.user} - {self.product}"
+
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_user_wishlist_ids(self):
+        """Drops the cached wishlist ids of the user once the change is committed."""
+        from apps.products.queries import invalidate_user_wishlist_ids
+
+        transaction.on_commit(lambda: invalidate_user_wishlist_ids(self.user_id))
@@ -1,15 +1,31 @@
 # queries.py
+import copy
+import time
 from collections import defaultdict
-from typing import List
+from typing import Iterable, List
 
-from django.db.models import BooleanField, Exists, F, OuterRef, Q, QuerySet, Value
-from django.utils import timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, QuerySet, Value, When
+from django.db.models.functions import Cast, Floor
 from django.utils.timezone import now
 
 from apps.account.models import User
+from apps.cms.models import ProductOfferItem
+from apps.cms.queries import get_active_offer_index
 from core import choice
 
-from .models import Product, ProductCategory, ProductReview, ProductWishlist
+from .category_tree import get_category_tree
+from .models import Product, ProductCategory, ProductDiscount, ProductReview, ProductWishlist
+from .models.product import default_rating_histogram
+from .search import get_search_backend
+
+# Lower bounds of the price facet buckets, the last bucket has no upper bound
+PRODUCT_FACETS_PRICE_BUCKETS = (0, 1_000_000, 5_000_000, 20_000_000, 100_000_000)
+PRODUCT_FACETS_CACHE_TIMEOUT = 60 * 60
+PRODUCT_FACETS_VERSION_KEY = "products:facets:version"
+PRODUCT_WISHLIST_CACHE_KEY = "products:wishlist:{user_id}"
+PRODUCT_WISHLIST_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 def get_all_products(user: User = None) -> list[Product]:
@@ -26,36 +42,57 @@ def get_all_products(user: User = None) -> list[Product]:
             "discounts",
             "product_images",
         )
+        .with_pricing()
     )
 
-    # Annotate in_wishlist on DB side to improve performance
+    # in_wishlist is set from the cached wishlist ids once evaluated, no subquery is added
     qs = annotate_in_wishlist(qs, user)
     return qs
 
 
 def annotate_in_wishlist(product_qs: QuerySet, user: User = None) -> QuerySet:
     """
-    Annotate the product queryset with 'in_wishlist' to check if each product
-    is in the given user's wishlist. Optimized for performance by handling it
-    at the database level.
+    Mark each product of the queryset with 'in_wishlist', whether it is in the given user's wishlist.
+    The flag is set in Python from the user's cached wishlist ids once the queryset is evaluated,
+    so no subquery is added to the listing.
 
     Args:
         product_qs (QuerySet): The queryset of products to annotate.
         user (User, optional): The current user. Defaults to None.
 
     Returns:
-        QuerySet: The product queryset annotated with 'in_wishlist' as a boolean.
+        QuerySet: The product queryset, its products get 'in_wishlist' as a boolean.
     """
-
-    wishlist_subquery = ProductWishlist.objects.filter(user=user, product=OuterRef("pk"))
     if user and user.is_authenticated:
-        product_qs = product_qs.annotate(in_wishlist=Exists(wishlist_subquery))
-    else:
-        product_qs = product_qs.annotate(in_wishlist=Value(False, BooleanField()))
+        return product_qs.with_wishlist(user)
 
+    # Anonymous users have no wishlist, `Product.is_in_wishlist` defaults to False
     return product_qs
 
 
+def get_user_wishlist_ids(user: User) -> set[int]:
+    """
+    Returns the ids of the products in the user's active wishlist.
+    Kept in cache per user and memoized on the user object, so it is loaded at most once per request.
+    """
+    wishlist_ids = getattr(user, "_wishlist_ids", None)
+    if wishlist_ids is None:
+        key = PRODUCT_WISHLIST_CACHE_KEY.format(user_id=user.id)
+        wishlist_ids = cache.get(key)
+        if wishlist_ids is None:
+            wishlist_ids = set(
+                ProductWishlist.objects.filter(user_id=user.id, is_active=True).values_list("product_id", flat=True)
+            )
+            cache.set(key, wishlist_ids, PRODUCT_WISHLIST_CACHE_TIMEOUT)
+        user._wishlist_ids = wishlist_ids
+    return wishlist_ids
+
+
+def invalidate_user_wishlist_ids(user_id: int) -> None:
+    """Drops the cached wishlist ids of the user, the next lookup reloads them."""
+    cache.delete(PRODUCT_WISHLIST_CACHE_KEY.format(user_id=user_id))
+
+
 def get_best_offer(product: Product):
     offer = (
         product.offers.filter(
@@ -130,31 +167,38 @@ def calculate_product_discount(product: Product, quantity: int = 1) -> list[floa
     Notes:
         - If the product has no valid price, offer, or discount, no discount is applied.
         - Handles zero or negative input for quantity gracefully by returning zeros.
+        - If a batch pricing result is attached to the product (see `attach_products_pricing`),
+          its offer and discount are reused and no query is made.
     """
 
     if product.price <= 0 or quantity <= 0:
         return 0.0, 0.0, 0.0
 
-    # Get the best available offer and discount for the product
-    offer = get_best_offer(product)
-    discount = get_best_discount(product)
+    pricing = getattr(product, "pricing", None)
+    if pricing is not None:
+        offer, discount = pricing["offer"], pricing["discount"]
+    else:
+        # Get the best available offer and discount for the product
+        offer = get_best_offer(product)
+        discount = get_best_discount(product)
+
+    return _calculate_discount(product.price, quantity, offer, discount)
 
-    product_price = product.price
-    offer_discount_percent = offer.discount if offer else 0.0
-    discount_percent = 0.0
 
-    if discount:
-        if discount.type == choice.DISCOUNT_TYPE_AMOUNT:
-            discount_percent = (discount.amount / product_price) * 100
-        elif discount.type == choice.DISCOUNT_TYPE_PERCENT:
-            discount_percent = discount.amount
+def _calculate_discount(
+    product_price: int, quantity: int, offer: ProductOfferItem | None, discount: ProductDiscount | None
+) -> tuple[float, float, float]:
+    """
+    Pure part of `calculate_product_discount`, works on an already fetched offer and discount.
+    """
+    if product_price <= 0 or quantity <= 0:
+        return 0.0, 0.0, 0.0
 
-    # Determine which discount is better
-    is_offer_better = offer_discount_percent > discount_percent
-    remaining_offer_quantity = max(0, (offer.stock - offer.sold_stock)) if offer else 0
+    offer_discount_percent = offer.discount if offer else 0.0
+    discount_percent = _discount_percent(product_price, discount)
 
     # Calculate quantities for offer and discount
-    quantity_on_offer = min(remaining_offer_quantity, quantity) if is_offer_better else 0
+    quantity_on_offer = _offer_quantity(product_price, quantity, offer, discount)
     quantity_on_discount = quantity - quantity_on_offer
 
     # Calculate price per unit for both offer and discount
@@ -176,34 +220,188 @@ def calculate_product_discount(product: Product, quantity: int = 1) -> list[floa
     return maximum_discount, total_with_discount, final_price_per_unit
 
 
+def _discount_percent(product_price: int, discount: ProductDiscount | None) -> float:
+    """
+    Percentage of the product price taken off by a general discount.
+    """
+    if not discount:
+        return 0.0
+    if discount.type == choice.DISCOUNT_TYPE_AMOUNT:
+        return (discount.amount / product_price) * 100
+    if discount.type == choice.DISCOUNT_TYPE_PERCENT:
+        return discount.amount
+    return 0.0
+
+
+def _offer_quantity(
+    product_price: int, quantity: int, offer: ProductOfferItem | None, discount: ProductDiscount | None
+) -> int:
+    """
+    Number of units sold at the offer price, the offer is used only when it beats the general discount
+    and only for its remaining stock (an offer without stock is not limited).
+    """
+    if not offer or product_price <= 0 or quantity <= 0:
+        return 0
+    if offer.discount <= _discount_percent(product_price, discount):
+        return 0
+    if offer.stock is None:
+        return quantity
+    return min(max(0, offer.stock - offer.sold_stock), quantity)
+
+
+def get_best_offers(product_ids: Iterable[int]) -> dict[int, ProductOfferItem]:
+    """
+    Batch version of `get_best_offer`: returns the best active offer item of every given product
+    in a single query, keyed by product id. Products without an offer are missing from the result.
+    """
+    current_time = now()
+    offers = (
+        ProductOfferItem.objects.filter(
+            product_id__in=product_ids,
+            # Active Check
+            is_active=True,
+            product_offer__is_active=True,
+        )
+        .filter(
+            # Stock Checks
+            Q(stock__isnull=True)  # Without Stock Limit
+            | (  # Stock Limit
+                Q(stock__isnull=False)
+                & Q(
+                    stock__gt=F("sold_stock"),
+                )
+            )
+        )
+        .filter(
+            # Active And End Times
+            Q(product_offer__active_from__lte=current_time)
+            & Q(
+                product_offer__active_until__gte=current_time,
+            )
+        )
+        .select_related("product_offer")
+        .order_by("product_id", "-discount")  # Maximum Discount Per Product
+        .distinct("product_id")
+    )
+    return {offer.product_id: offer for offer in offers}
+
+
+def get_best_discounts(product_ids: Iterable[int]) -> dict[int, ProductDiscount]:
+    """
+    Batch version of `get_best_discount`: returns the active discount of every given product
+    in a single query, keyed by product id. Products without a discount are missing from the result.
+    """
+    current_time = now()
+    discounts = (
+        ProductDiscount.objects.filter(
+            product_id__in=product_ids,
+            is_active=True,
+        )
+        .filter(
+            # Active And End Times
+            (Q(active_from__isnull=True) | Q(active_from__lte=current_time))
+            & (Q(active_until__isnull=True) | Q(active_until__gte=current_time))
+        )
+        .order_by("product_id", "pk")  # Same pick as `.first()` on a single product
+        .distinct("product_id")
+    )
+    return {discount.product_id: discount for discount in discounts}
+
+
+def get_products_pricing(
+    products: QuerySet | Iterable[Product] | Iterable[int], quantities: dict[int, int] | None = None
+) -> dict[int, dict]:
+    """
+    Batch pricing engine. Calculates the same result as `calculate_product_discount` for many products
+    in a fixed number of queries (one for offers, one for discounts and one for prices when ids are given).
+
+    Args:
+        products (QuerySet | list[Product] | list[int]): Products or product ids to price.
+        quantities (dict[int, int], optional): Quantity per product id, defaults to 1 for every product.
+
+    Returns:
+        dict[int, dict]: Pricing per product id, each one containing:
+            - offer: Best active offer item (ProductOfferItem | None).
+            - discount: Best active discount (ProductDiscount | None).
+            - price: The product price the totals are based on.
+            - quantity: The quantity used for the totals.
+            - offer_quantity: Units of the quantity sold at the offer price.
+            - discount_percent: Maximum discount percentage applied.
+            - unit_price: Final price per unit after applying the best discount.
+            - total_price: Total with discount for the given quantity.
+    """
+    quantities = quantities or {}
+    products = list(products)
+    if products and not isinstance(products[0], Product):
+        products = list(Product.objects.filter(id__in=products).only("id", "price"))
+
+    product_ids = [product.id for product in products]
+    if not product_ids:
+        return {}
+
+    offers = get_best_offers(product_ids)
+    discounts = get_best_discounts(product_ids)
+
+    result = {}
+    for product in products:
+        offer = offers.get(product.id)
+        discount = discounts.get(product.id)
+        quantity = quantities.get(product.id, 1)
+        discount_percent, total_price, unit_price = _calculate_discount(product.price, quantity, offer, discount)
+        result[product.id] = {
+            "offer": offer,
+            "discount": discount,
+            "price": product.price,
+            "quantity": quantity,
+            "offer_quantity": _offer_quantity(product.price, quantity, offer, discount),
+            "discount_percent": discount_percent,
+            "unit_price": unit_price,
+            "total_price": total_price,
+        }
+    return result
+
+
+def attach_products_pricing(products: Iterable[Product], quantities: dict[int, int] | None = None) -> list[Product]:
+    """
+    Runs `get_products_pricing` for the given products and attaches each result as `product.pricing`,
+    so `Product` properties and `calculate_product_discount` can use it without extra queries.
+    """
+    products = list(products)
+    pricing = get_products_pricing(products, quantities)
+    for product in products:
+        if product.id in pricing:
+            product.pricing = pricing[product.id]
+    return products
+
+
 def get_product_categories() -> list[ProductCategory]:
     """
-    Fetches all active product categories.
+    Fetches all active top level product categories, from the cached category tree.
     """
-    return ProductCategory.objects.active().filter(parent__isnull=True).distinct("id")
+    return get_category_tree().roots()
 
 
 def get_subcategories_for_category(parent_category: ProductCategory) -> list[ProductCategory]:
     """
-    Fetches subcategories for a given parent category.
+    Fetches subcategories for a given parent category, from the cached category tree.
     """
-    return parent_category.get_descendants().order_by("-priority")
+    return get_category_tree().descendants(parent_category.id)
 
 
 def get_product_category(id: int) -> ProductCategory | None:
-    return ProductCategory.objects.filter(is_active=True, pk=id).first()
+    return get_category_tree().get(id)
 
 
 def get_products_by_category(category: ProductCategory, user: User = None) -> list[Product]:
     """Fetch products for a specific category and its subcategories without duplicates."""
-    sub_cats = category.get_descendants(True)
-    qs = get_all_products(user).filter(category__in=sub_cats).distinct().order_by("-created_at")
+    category_ids = get_category_tree().descendant_ids(category.id)
+    qs = get_all_products(user).filter(category_id__in=category_ids).order_by("-created_at")
     return qs
 
 
 def get_products_by_subcategory(category_id: int) -> list[Product]:
     """Fetch products for a specific subcategory."""
-    return Product.objects.active().filter(category_id=category_id).order_by("-created_at")
+    return Product.objects.active().filter(category_id=category_id).with_pricing().order_by("-created_at")
 
 
 def get_product(product_id: int, user: User = None) -> Product | None:
@@ -243,7 +441,8 @@ def get_product_details_by_id(product_id: int, user: User = None):
     grouped_properties = defaultdict(list)
     for property in product.product_properties.all():
         grouped_properties[property.title].append(property)
-    # Fetch related variants
+    # Price the product once, the attached result is reused by `Product` properties
+    attach_products_pricing([product])
     product_discount = calculate_product_discount(product, 1)
     return {
         "product": product,
@@ -261,7 +460,7 @@ def get_related_products(product_id: int) -> list[Product]:
     """
     try:
         product = Product.objects.active().get(id=product_id)
-        return product.variants.all()
+        return product.variants.with_pricing()
     except Product.DoesNotExist:
         # Return an empty list if the product does not exist
         return []
@@ -328,9 +527,10 @@ def get_user_wishlist(user: User) -> List[Product]:
     return products
 
 
-def is_product_in_wishlist(user: User, product: Product):
-    """Check if a product is in the user's wishlist."""
-    return product.product_wish_list.filter(user=user).exists()
+def is_product_in_wishlist(user: User, product: Product | int):
+    """Check if a product (or product id) is in the user's wishlist."""
+    product_id = product.id if isinstance(product, Product) else int(product)
+    return product_id in get_user_wishlist_ids(user)
 
 
 def add_or_remove_product_from_wishlist(user_id: int, product_id: int) -> int:
@@ -361,6 +561,8 @@ def add_or_remove_product_from_wishlist(user_id: int, product_id: int) -> int:
 def clear_user_wishlist(user_id: int) -> None:
     """Delete all wishlist items for a user."""
     ProductWishlist.objects.filter(user_id=user_id).delete()
+    # Bulk delete skips the model hooks
+    transaction.on_commit(lambda: invalidate_user_wishlist_ids(user_id))
 
 
 def get_wishlist_count(user_id: int) -> int:
@@ -387,47 +589,195 @@ def create_product_review(product: Product, user: User, star: int, comment: str)
     return obj
 
 
+def apply_product_rating_change(product_id: int, removed_rating: int | None = None, added_rating: int | None = None) -> None:
+    """
+    Incrementally update the stored rating aggregates of a product when an accepted review is added,
+    removed or changed. The product row is locked while its star histogram is updated, the average
+    and count are derived from the histogram so they never drift from each other.
+
+    Args:
+        product_id (int): The ID of the reviewed product.
+        removed_rating (int, optional): Rating that no longer counts (deleted, rejected or edited review).
+        added_rating (int, optional): Rating that now counts (new, accepted or edited review).
+    """
+    if removed_rating == added_rating:
+        return
+
+    with transaction.atomic():
+        product = Product.objects.select_for_update().only("id", "rating_histogram").filter(id=product_id).first()
+        if not product:
+            return
+
+        histogram = {**default_rating_histogram(), **(product.rating_histogram or {})}
+        if removed_rating:
+            histogram[str(removed_rating)] = max(0, histogram[str(removed_rating)] - 1)
+        if added_rating:
+            histogram[str(added_rating)] += 1
+
+        Product.objects.filter(id=product_id).update(**_rating_aggregates(histogram))
+        transaction.on_commit(invalidate_product_facets)
+
+
+def rebuild_products_rating(product_ids: Iterable[int] | None = None, batch_size: int = 1000) -> int:
+    """
+    Rebuild the stored rating aggregates from the accepted reviews, for the given products or for
+    all of them. Uses one grouped query over the reviews and batched bulk updates.
+
+    Returns:
+        int: Number of updated products.
+    """
+    products = Product.objects.all()
+    reviews = ProductReview.objects.filter(is_accepted=True)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        reviews = reviews.filter(product_id__in=product_ids)
+
+    histograms = defaultdict(default_rating_histogram)
+    for row in reviews.values("product_id", "rating").annotate(total=Count("id")).order_by():
+        histograms[row["product_id"]][str(row["rating"])] = row["total"]
+
+    fields = ["rating_avg", "rating_count", "rating_histogram"]
+    batch = []
+    updated = 0
+    with transaction.atomic():
+        for product in products.only("id").iterator(chunk_size=batch_size):
+            for field, value in _rating_aggregates(histograms.get(product.id, default_rating_histogram())).items():
+                setattr(product, field, value)
+            batch.append(product)
+            if len(batch) >= batch_size:
+                updated += Product.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, fields)
+        transaction.on_commit(invalidate_product_facets)
+
+    return updated
+
+
+def _rating_aggregates(histogram: dict) -> dict:
+    """Derive the stored rating fields of a product from its star histogram."""
+    rating_count = sum(histogram.values())
+    rating_sum = sum(int(rating) * count for rating, count in histogram.items())
+    return {
+        "rating_avg": rating_sum / rating_count if rating_count else 0.0,
+        "rating_count": rating_count,
+        "rating_histogram": histogram,
+    }
+
+
 def search_products(query: str, user: User = None) -> list[Product]:
-    """Search products based on a query string."""
-    qs = (
-        get_all_products(user)
-        .filter(
-            Q(title__icontains=query) | Q(description__icontains=query) | Q(category__title__icontains=query),
-        )
-        .distinct()
-        .order_by("-created_at")
-    )
-    return qs
+    """Search products based on a query string, using the configured search backend."""
+    return get_search_backend().search(get_all_products(user), query)
 
 
-def get_products_with_offers(products: list[Product]) -> dict:
+def get_products_with_offers(products: QuerySet) -> dict:
     """
     Fetch all active products that have offers, grouped by product offer,
     excluding expired offers and offers that have not yet started.
-    Optimized for efficient database queries.
+    Rendered from the cached active-offer index, so the number of queries
+    does not depend on the number of products or offers.
     """
-    # Get the current time
-    now = timezone.now()
+    offer_index = get_active_offer_index()
+    product_ids = {product_id for _, remaining_stocks in offer_index for product_id in remaining_stocks}
+    if not product_ids:
+        return {}
+
+    products_by_id = {product.id: product for product in products.filter(id__in=product_ids)}
+
+    products_by_offer = {}
+    for offer, remaining_stocks in offer_index:
+        offer_products = []
+        for product_id, remaining_stock in remaining_stocks.items():
+            product = products_by_id.get(product_id)
+            if product is None:
+                continue
+            # Every card gets its own copy, the stock of one offer can not leak onto the card of another
+            product = copy.copy(product)
+            product.offer_remaining_stock = remaining_stock
+            offer_products.append(product)
+        if offer_products:
+            products_by_offer[offer] = offer_products
 
-    # Retrieve products and offers in one optimized query
-    products_with_offers = products.filter(offers__isnull=False).prefetch_related("offers__product_offer").distinct()
+    return products_by_offer
 
-    # Create a defaultdict to group products by their associated product offer
-    products_by_offer = defaultdict(list)
 
-    # Iterate through the products and group them by their associated product offer
-    for product in products_with_offers:
-        active_offer_items = product.offers.filter(
-            product_offer__is_active=True,
-            product_offer__active_from__lte=now,
-            product_offer__active_until__gte=now,
-            stock__gt=F("sold_stock"),  # Ensure stock is greater than sold stock
-        )
+def get_product_facets(products: QuerySet) -> dict:
+    """
+    Count the products of a queryset per brand, category, price bucket and rating in a single grouped query.
+    The buckets match `ProductListFilter` lookups, products without brand are counted under "null" and
+    products without reviews under rating 1.
+
+    Example output:
+        {
+            "total": 12,
+            "brands": {3: 7, "null": 5},
+            "categories": {1: 4, 2: 8},
+            "prices": [{"min_price": 0, "max_price": 999999, "count": 9}, ..., {"min_price": 100000000, "max_price": None, "count": 0}],
+            "ratings": {1: 5, 2: 0, 3: 1, 4: 4, 5: 2},
+        }
+    """
+    buckets = PRODUCT_FACETS_PRICE_BUCKETS
+    price_bucket = Case(
+        *[When(price__lt=upper_bound, then=Value(index)) for index, upper_bound in enumerate(buckets[1:])],
+        default=Value(len(buckets) - 1),
+        output_field=IntegerField(),
+    )
+    rating_bucket = Case(
+        When(rating_count=0, then=Value(1)),
+        default=Cast(Floor("rating_avg"), IntegerField()),
+        output_field=IntegerField(),
+    )
+    rows = (
+        products.order_by()
+        .annotate(price_bucket=price_bucket, rating_bucket=rating_bucket)
+        .values("brand_id", "category_id", "price_bucket", "rating_bucket")
+        .annotate(total=Count("id"))
+    )
 
-        for offer_item in active_offer_items:
-            products_by_offer[offer_item.product_offer].append(product)
+    facets = {
+        "total": 0,
+        "brands": defaultdict(int),
+        "categories": defaultdict(int),
+        "prices": [0] * len(buckets),
+        "ratings": dict.fromkeys(range(1, 6), 0),
+    }
+    for row in rows:
+        facets["total"] += row["total"]
+        facets["brands"][row["brand_id"] or "null"] += row["total"]
+        facets["categories"][row["category_id"]] += row["total"]
+        facets["prices"][row["price_bucket"]] += row["total"]
+        facets["ratings"][row["rating_bucket"]] += row["total"]
+
+    facets["brands"] = dict(facets["brands"])
+    facets["categories"] = dict(facets["categories"])
+    facets["prices"] = [
+        {
+            "min_price": lower_bound,
+            "max_price": buckets[index + 1] - 1 if index + 1 < len(buckets) else None,
+            "count": facets["prices"][index],
+        }
+        for index, lower_bound in enumerate(buckets)
+    ]
+    return facets
+
+
+def get_base_product_facets(products: QuerySet, scope: str) -> dict:
+    """
+    Cached `get_product_facets` of an unfiltered product listing, e.g. scope "all" or "category:3".
+    Entries are dropped all at once by `invalidate_product_facets`.
+    """
+    version = cache.get_or_set(PRODUCT_FACETS_VERSION_KEY, time.time_ns, None)
+    key = f"products:facets:{version}:{scope}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = get_product_facets(products)
+        cache.set(key, facets, PRODUCT_FACETS_CACHE_TIMEOUT)
+    return facets
 
-    # Reverse the order of products (if needed, reverse after processing)
-    products_by_offer = {key: value[::-1] for key, value in products_by_offer.items()}
 
-    return products_by_offer
+def invalidate_product_facets() -> None:
+    """Drops every cached base facet count by moving to a new cache version."""
+    try:
+        cache.incr(PRODUCT_FACETS_VERSION_KEY)
+    except ValueError:
+        cache.set(PRODUCT_FACETS_VERSION_KEY, time.time_ns(), None)
@@ -0,0 +1,106 @@
+from functools import lru_cache
+from typing import Iterable
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db.models import F, FloatField, Q, QuerySet, Value
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductCategory
+
+DEFAULT_SEARCH_BACKEND = "apps.products.search.PostgresSearchBackend"
+
+
+class BaseSearchBackend:
+    """
+    Base class of product search backends.
+    A backend narrows down and orders an already built product queryset, so annotations such as
+    `in_wishlist` and the batch pricing stay untouched.
+    methods:
+        - search: return the products of the queryset matching the query, best match first
+        - update_products: refresh the search index of the given products
+    """
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        raise NotImplementedError
+
+    def update_products(self, product_ids: Iterable[int] | None = None) -> int:
+        """Backends without an index have nothing to refresh."""
+        return 0
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Database agnostic backend, `icontains` on title, description and category title, newest first.
+    Needs no index, but every search is a sequential scan.
+    """
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        return (
+            queryset.filter(
+                Q(title__icontains=query) | Q(description__icontains=query) | Q(category__title__icontains=query),
+            )
+            .distinct()
+            .order_by("-created_at")
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL full-text search backend.
+
+    Products are matched against the stored, weighted `Product.search_vector` (title A, category B, description C)
+    or by trigram word similarity on the title, so small typos still match. Word similarity compares the query with
+    the closest part of the title rather than the whole title, a misspelled word finds long titles too.
+    Results are ordered by relevance.
+    The vector is kept up to date by `Product` and `ProductCategory` hooks, `rebuild_product_search_index`
+    command rebuilds it from scratch.
+    """
+
+    config = getattr(settings, "PRODUCTS_SEARCH_CONFIG", "simple")
+
+    def search_vector(self, category_title) -> SearchVector:
+        """
+        Weighted vector expression of a product. The category title is given as a value, as an UPDATE
+        can not join the category table.
+        """
+        return (
+            SearchVector("title", weight="A", config=self.config)
+            + SearchVector(Value(category_title or ""), weight="B", config=self.config)
+            + SearchVector("description", weight="C", config=self.config)
+        )
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        search_query = SearchQuery(query, search_type="websearch", config=self.config)
+        return (
+            # Cast from `real` to double precision, the keyset cursor keeps them as exact Python floats
+            queryset.annotate(
+                rank=Cast(SearchRank(F("search_vector"), search_query), FloatField()),
+                similarity=Cast(TrigramWordSimilarity(query, "title"), FloatField()),
+            )
+            .filter(Q(search_vector=search_query) | Q(title__trigram_word_similar=query))
+            .order_by("-rank", "-similarity", "-created_at")
+        )
+
+    def update_products(self, product_ids: Iterable[int] | None = None) -> int:
+        """
+        Refresh the stored vector of the given products, or of all products when no ids are given.
+        Runs one UPDATE per category of the products instead of one per product.
+        """
+        products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+
+        categories = ProductCategory.objects.filter(id__in=products.values("category_id")).values_list("id", "title")
+
+        updated = 0
+        for category_id, category_title in categories:
+            updated += products.filter(category_id=category_id).update(search_vector=self.search_vector(category_title))
+        return updated
+
+
+@lru_cache
+def get_search_backend() -> BaseSearchBackend:
+    """Returns the product search backend configured by `PRODUCTS_SEARCH_BACKEND` setting."""
+    return import_string(getattr(settings, "PRODUCTS_SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND))()
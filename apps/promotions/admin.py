@@ -1,9 +1,17 @@
-from django.contrib import admin
+import io
+
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import render
 from django.utils.translation import gettext_lazy as _
 
 from core.admin import BaseModelAdmin
 
+from .bulk import import_coupons, iter_coupons_csv
+from .forms import BulkCouponsForm
 from .models import Coupon, CouponConsume
+from .queries import invalidate_coupon_by_code
+from .tasks import generate_coupons_task
 
 
 class CouponConsumeAdmin(BaseModelAdmin):
@@ -17,6 +25,15 @@ class CouponConsumeAdmin(BaseModelAdmin):
         (_("Timestamps"), {"fields": ("created_at", "updated_at")}),
     )
 
+    def has_add_permission(self, request, *args):
+        # Consumptions are recorded by `consume_coupon` with the coupon usage counter
+        return False
+
+    def delete_queryset(self, request, queryset):
+        # The bulk delete action skips the model hooks, delete one by one so every use is given back
+        for consume in queryset:
+            consume.delete()
+
 
 class CouponAdmin(BaseModelAdmin):
     list_display = (
@@ -25,6 +42,7 @@ class CouponAdmin(BaseModelAdmin):
         "valid_from",
         "valid_until",
         "total",
+        "used",
         "type",
         "min_cart",
         "amount",
@@ -37,8 +55,9 @@ class CouponAdmin(BaseModelAdmin):
     )
     search_fields = ("title", "code")
     list_filter = ("type", "valid_from", "valid_until", "users", "is_active")
-    readonly_fields = ("created_at", "updated_at", "created_by", "updated_by")
+    readonly_fields = ("used", "created_at", "updated_at", "created_by", "updated_by")
     filter_horizontal = ("users",)
+    actions = ("bulk_coupons", "export_coupons_csv")
     fieldsets = (
         (
             None,
@@ -50,6 +69,7 @@ class CouponAdmin(BaseModelAdmin):
                     "valid_from",
                     "valid_until",
                     "total",
+                    "used",
                     "type",
                 ),
             },
@@ -86,6 +106,57 @@ class CouponAdmin(BaseModelAdmin):
         ),
     )
 
+    def delete_queryset(self, request, queryset):
+        # The bulk delete action skips the model hooks, drop the cached lookups here
+        codes = list(queryset.values_list("code", flat=True))
+        super().delete_queryset(request, queryset)
+        invalidate_coupon_by_code(*codes)
+
+    @admin.action(description=_("Generate or import codes like this coupon"))
+    def bulk_coupons(self, request, queryset):
+        if queryset.count() != 1:
+            messages.error(request, _("Select exactly one coupon as the template of the codes."))
+            return None
+        template = queryset.get()
+
+        if "apply" in request.POST:
+            form = BulkCouponsForm(request.POST, request.FILES)
+            if form.is_valid():
+                data = form.cleaned_data
+                if data["count"]:
+                    # Large campaigns take a while, the codes are generated by Celery
+                    generate_coupons_task.delay(
+                        template.id, data["count"], data["prefix"], data["length"], data["uses"], request.user.id
+                    )
+                    messages.success(request, _("%(count)s codes are being generated.") % {"count": data["count"]})
+                else:
+                    created, skipped = import_coupons(
+                        template,
+                        io.TextIOWrapper(data["file"], encoding="utf-8-sig", newline=""),
+                        uses=data["uses"],
+                        created_by_id=request.user.id,
+                    )
+                    messages.success(
+                        request,
+                        _("%(created)s codes imported, %(skipped)s skipped.") % {"created": created, "skipped": skipped},
+                    )
+                return HttpResponseRedirect(request.get_full_path())
+        else:
+            form = BulkCouponsForm(initial={"_selected_action": [template.id]})
+
+        context = {
+            **self.admin_site.each_context(request),
+            "form": form,
+            "template": template,
+        }
+        return render(request, "promotions/bulk_coupons.html", context=context)
+
+    @admin.action(description=_("Export codes as CSV"))
+    def export_coupons_csv(self, request, queryset):
+        response = StreamingHttpResponse(iter_coupons_csv(queryset), content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="coupons.csv"'
+        return response
+
 
 admin.site.register(Coupon, CouponAdmin)
 admin.site.register(CouponConsume, CouponConsumeAdmin)
@@ -0,0 +1,167 @@
+import csv
+import secrets
+from collections.abc import Iterable, Iterator
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet
+
+from .models import Coupon
+
+# Codes are read out and typed by customers, similar looking characters (0/O, 1/I) are left out
+COUPON_CODE_ALPHABET = "23456789ABCDEFGHJKLMNPQRSTUVWXYZ"
+COUPON_CODE_LENGTH = 10
+COUPON_BATCH_SIZE = 1000
+COUPON_CODE_MAX_LENGTH = Coupon._meta.get_field("code").max_length
+
+# Campaign fields copied from the template coupon to every generated or imported code
+COUPON_TEMPLATE_FIELDS = (
+    "title",
+    "valid_from",
+    "valid_until",
+    "type",
+    "min_cart",
+    "amount",
+    "max_discount_total",
+    "is_active",
+)
+COUPON_EXPORT_FIELDS = (
+    "code",
+    "title",
+    "type",
+    "amount",
+    "min_cart",
+    "max_discount_total",
+    "total",
+    "used",
+    "valid_from",
+    "valid_until",
+    "is_active",
+)
+
+
+def generate_coupon_codes(prefix: str = "", length: int = COUPON_CODE_LENGTH) -> Iterator[str]:
+    """
+    Endless random codes of `length` characters after the prefix, from a cryptographically secure source.
+    With the default length there are 32^10 (about 10^15) codes per prefix, so a collision is rare,
+    `bulk_create_coupons` still skips codes that exist and `generate_coupons` replaces them.
+    """
+    if len(prefix) + length > COUPON_CODE_MAX_LENGTH:
+        raise ValueError(f"Coupon codes can not be longer than {COUPON_CODE_MAX_LENGTH} characters.")
+    while True:
+        yield prefix + "".join(secrets.choice(COUPON_CODE_ALPHABET) for _ in range(length))
+
+
+def bulk_create_coupons(
+    template: Coupon,
+    codes: Iterable[str],
+    uses: int = 1,
+    batch_size: int = COUPON_BATCH_SIZE,
+    created_by_id: int | None = None,
+) -> tuple[int, int]:
+    """
+    Creates a coupon per code with the campaign fields of the template, `uses` times usable each.
+    Codes are consumed lazily and inserted with one lookup and one bulk insert per batch, so memory stays
+    flat whatever the number of codes. The model hooks are skipped, the creator is set from `created_by_id` instead.
+    Empty, too long, repeated and already existing codes are skipped, a code inserted concurrently since the lookup
+    makes the batch be inserted again without it, so the counts are exact.
+
+    Returns:
+        tuple[int, int]: Number of created coupons and number of skipped codes.
+    """
+    fields = {field: getattr(template, field) for field in COUPON_TEMPLATE_FIELDS}
+    created = skipped = 0
+    codes = iter(codes)
+    while batch := list(islice(codes, batch_size)):
+        valid = dict.fromkeys(code for code in batch if code and len(code) <= COUPON_CODE_MAX_LENGTH)
+        existing = set(Coupon.objects.filter(code__in=valid).values_list("code", flat=True))
+        while True:
+            coupons = [
+                Coupon(code=code, total=uses, created_by_id=created_by_id, **fields) for code in valid if code not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    Coupon.objects.bulk_create(coupons)
+                break
+            except IntegrityError:
+                # A code inserted concurrently since the lookup, the batch is inserted again without it
+                found = set(Coupon.objects.filter(code__in=valid).values_list("code", flat=True))
+                if found == existing:
+                    raise
+                existing = found
+        created += len(coupons)
+        skipped += len(batch) - len(coupons)
+    return created, skipped
+
+
+def generate_coupons(
+    template: Coupon,
+    count: int,
+    prefix: str = "",
+    length: int = COUPON_CODE_LENGTH,
+    uses: int = 1,
+    batch_size: int = COUPON_BATCH_SIZE,
+    created_by_id: int | None = None,
+) -> int:
+    """
+    Generates `count` new coupons with random codes and the campaign fields of the template, see `bulk_create_coupons`.
+
+    Returns:
+        int: Number of created coupons.
+
+    Raises:
+        RuntimeError: When a whole batch of codes already exists, i.e. the prefix and length are used up.
+    """
+    codes = generate_coupon_codes(prefix, length)
+    created = 0
+    while created < count:
+        batch_created, _ = bulk_create_coupons(
+            template,
+            islice(codes, min(batch_size, count - created)),
+            uses=uses,
+            batch_size=batch_size,
+            created_by_id=created_by_id,
+        )
+        if not batch_created:
+            raise RuntimeError(f"No new codes left with prefix {prefix!r} and length {length}, use a longer code.")
+        created += batch_created
+    return created
+
+
+def import_coupons(
+    template: Coupon, rows: Iterable[str], uses: int = 1, batch_size: int = COUPON_BATCH_SIZE, created_by_id: int | None = None
+) -> tuple[int, int]:
+    """
+    Creates coupons from the first column of CSV lines with the campaign fields of the template.
+    A header line with `code` as first column is skipped, see `bulk_create_coupons`.
+
+    Returns:
+        tuple[int, int]: Number of created coupons and number of skipped codes.
+    """
+    codes = (
+        row[0].strip() for index, row in enumerate(csv.reader(rows)) if row and not (index == 0 and row[0].strip() == "code")
+    )
+    return bulk_create_coupons(
+        template,
+        codes,
+        uses=uses,
+        batch_size=batch_size,
+        created_by_id=created_by_id,
+    )
+
+
+class _Echo:
+    """File-like object that returns what is written, lets `csv.writer` produce lines one by one."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def iter_coupons_csv(queryset: QuerySet, chunk_size: int = COUPON_BATCH_SIZE) -> Iterator[str]:
+    """
+    CSV lines of the coupons, header first, read from the database in chunks so memory stays flat.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COUPON_EXPORT_FIELDS)
+    for row in queryset.order_by("id").values_list(*COUPON_EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
@@ -0,0 +1,36 @@
+from django import forms
+from django.utils.translation import gettext_lazy as _
+from unfold.widgets import UnfoldAdminFileFieldWidget, UnfoldAdminIntegerFieldWidget, UnfoldAdminTextInputWidget
+
+from .bulk import COUPON_CODE_LENGTH
+
+
+class BulkCouponsForm(forms.Form):
+    _selected_action = forms.CharField(widget=forms.MultipleHiddenInput)
+    count = forms.IntegerField(
+        required=False,
+        min_value=1,
+        widget=UnfoldAdminIntegerFieldWidget,
+        label=_("Number of codes to generate"),
+    )
+    prefix = forms.CharField(required=False, max_length=20, widget=UnfoldAdminTextInputWidget, label=_("Code prefix"))
+    length = forms.IntegerField(
+        initial=COUPON_CODE_LENGTH,
+        min_value=6,
+        max_value=30,
+        widget=UnfoldAdminIntegerFieldWidget,
+        label=_("Random characters per code"),
+    )
+    file = forms.FileField(
+        required=False,
+        widget=UnfoldAdminFileFieldWidget,
+        label=_("CSV file of codes to import"),
+        help_text=_("Codes in the first column, an optional `code` header."),
+    )
+    uses = forms.IntegerField(initial=1, min_value=1, widget=UnfoldAdminIntegerFieldWidget, label=_("Uses per code"))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get("count")) == bool(cleaned_data.get("file")):
+            raise forms.ValidationError(_("Enter a number of codes to generate or a file to import, not both."))
+        return cleaned_data
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from apps.promotions.bulk import COUPON_BATCH_SIZE, iter_coupons_csv
+from apps.promotions.models import Coupon
+
+
+class Command(BaseCommand):
+    help = "Export coupons as CSV, read from the database in chunks. Filter by campaign title or code prefix."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--title", help="Only export coupons of this campaign title.")
+        parser.add_argument("--prefix", help="Only export coupons whose code starts with this prefix.")
+        parser.add_argument("--output", help="Path of the CSV file, standard output when missing.")
+        parser.add_argument("--chunk-size", type=int, default=COUPON_BATCH_SIZE, help="Number of coupons read per query.")
+
+    def handle(self, *args, **options):
+        coupons = Coupon.objects.all()
+        if options["title"]:
+            coupons = coupons.filter(title=options["title"])
+        if options["prefix"]:
+            coupons = coupons.filter(code__startswith=options["prefix"])
+
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as file:
+                file.writelines(iter_coupons_csv(coupons, options["chunk_size"]))
+        else:
+            for line in iter_coupons_csv(coupons, options["chunk_size"]):
+                self.stdout.write(line, ending="")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.promotions.bulk import COUPON_BATCH_SIZE, COUPON_CODE_LENGTH, generate_coupons
+from apps.promotions.models import Coupon
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate coupons with unique random codes for a campaign. The campaign fields (title, dates, discount, "
+        "minimum cart) are copied from a template coupon, the codes are inserted in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("template", help="Code of the coupon the campaign fields are copied from.")
+        parser.add_argument("count", type=int, help="Number of coupons to generate.")
+        parser.add_argument("--prefix", default="", help="Prefix of every generated code.")
+        parser.add_argument("--length", type=int, default=COUPON_CODE_LENGTH, help="Number of random characters per code.")
+        parser.add_argument("--uses", type=int, default=1, help="Number of times every coupon can be used.")
+        parser.add_argument("--batch-size", type=int, default=COUPON_BATCH_SIZE, help="Number of coupons per bulk insert.")
+
+    def handle(self, *args, **options):
+        template = Coupon.objects.filter(code=options["template"]).first()
+        if template is None:
+            raise CommandError(f"Coupon {options['template']!r} does not exist.")
+        try:
+            created = generate_coupons(
+                template,
+                options["count"],
+                prefix=options["prefix"],
+                length=options["length"],
+                uses=options["uses"],
+                batch_size=options["batch_size"],
+            )
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e)) from e
+        self.stdout.write(self.style.SUCCESS(f"Generated {created} coupons from {template.code}."))
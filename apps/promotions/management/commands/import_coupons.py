@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.promotions.bulk import COUPON_BATCH_SIZE, import_coupons
+from apps.promotions.models import Coupon
+
+
+class Command(BaseCommand):
+    help = (
+        "Import coupon codes from a CSV file (first column, an optional `code` header) for a campaign. The campaign "
+        "fields are copied from a template coupon, the file is read and inserted in batches. Existing codes are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("template", help="Code of the coupon the campaign fields are copied from.")
+        parser.add_argument("path", help="Path of the CSV file, - reads standard input.")
+        parser.add_argument("--uses", type=int, default=1, help="Number of times every coupon can be used.")
+        parser.add_argument("--batch-size", type=int, default=COUPON_BATCH_SIZE, help="Number of coupons per bulk insert.")
+
+    def handle(self, *args, **options):
+        template = Coupon.objects.filter(code=options["template"]).first()
+        if template is None:
+            raise CommandError(f"Coupon {options['template']!r} does not exist.")
+
+        if options["path"] == "-":
+            created, skipped = import_coupons(template, self.stdin, uses=options["uses"], batch_size=options["batch_size"])
+        else:
+            with open(options["path"], newline="", encoding="utf-8-sig") as file:
+                created, skipped = import_coupons(template, file, uses=options["uses"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} coupons from {template.code}, skipped {skipped} codes."))
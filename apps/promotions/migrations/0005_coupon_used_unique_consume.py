@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-18 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def forwards_func(apps, schema_editor):
+    # Keep the first consumption of every user and coupon, then fill the usage counters from the consumptions
+    Coupon = apps.get_model("promotions", "Coupon")
+    CouponConsume = apps.get_model("promotions", "CouponConsume")
+    db_alias = schema_editor.connection.alias
+
+    consumptions = CouponConsume.objects.using(db_alias)
+    duplicates = (
+        consumptions.values("user_id", "coupon_id").annotate(first_id=Min("id"), total=Count("id")).filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        consumptions.filter(user_id=duplicate["user_id"], coupon_id=duplicate["coupon_id"]).exclude(
+            id=duplicate["first_id"]
+        ).delete()
+
+    counts = dict(consumptions.values("coupon_id").annotate(total=Count("id")).values_list("coupon_id", "total").order_by())
+    coupons = list(Coupon.objects.using(db_alias).filter(id__in=counts).only("id"))
+    for coupon in coupons:
+        coupon.used = counts[coupon.id]
+    Coupon.objects.using(db_alias).bulk_update(coupons, ["used"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("promotions", "0004_coupon_amount"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="coupon",
+            name="used",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, help_text="Number of times this coupon was used.", verbose_name="Used"
+            ),
+        ),
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="couponconsume",
+            constraint=models.UniqueConstraint(fields=("user", "coupon"), name="unique_coupon_consume_user_coupon"),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, AFTER_SAVE, hook
 
 from core import choice
 from core.models import BaseModel, CreatedByMixin, UpdatedByMixin
@@ -22,6 +23,7 @@ class Coupon(BaseModel, CreatedByMixin, UpdatedByMixin):
         valid_from (datetime): The start date and time when the coupon becomes valid.
         valid_until (datetime): The expiration date and time of the coupon.
         total (int): The maximum number of times this coupon can be used across all users.
+        used (int): The number of times this coupon was used, maintained by `consume_coupon`.
         users (ManyToManyField): Users eligible to use the coupon. If empty, the coupon is available to all users.
         type (PositiveSmallIntegerField): The type of discount: either a fixed amount or a percentage.
         min_cart (float): The minimum cart value required to apply this coupon.
@@ -68,6 +70,13 @@ class Coupon(BaseModel, CreatedByMixin, UpdatedByMixin):
         help_text=_("Maximum number of times this coupon can be used."),
         validators=[MinValueValidator(1)],
     )
+    # Usage counter, only changed by the conditional update in `consume_coupon` and when a consumption is deleted
+    used = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("Used"),
+        help_text=_("Number of times this coupon was used."),
+    )
     users = models.ManyToManyField(
         "account.User",
         related_name="coupons",
@@ -126,6 +135,15 @@ class Coupon(BaseModel, CreatedByMixin, UpdatedByMixin):
         if self.type == choice.COUPON_TYPE_PERCENT and (self.amount is None or self.amount < 0 or self.amount > 100):
             raise ValidationError(_("For percentage discounts, the amount must be between 0 and 100."))
 
+    @hook(AFTER_SAVE)
+    @hook(AFTER_DELETE)
+    def invalidate_cached_coupon(self):
+        """Drops the cached lookup of the coupon code (and of its previous code) once the change is committed."""
+        from apps.promotions.queries import invalidate_coupon_by_code
+
+        codes = {self.code, self.initial_value("code")}
+        transaction.on_commit(lambda: invalidate_coupon_by_code(*codes))
+
     class Meta:
         verbose_name = _("Coupon")
         verbose_name_plural = _("Coupons")
@@ -1,12 +1,14 @@
 from django.db import models
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
+from django_lifecycle import AFTER_DELETE, hook
 
 from core.models import BaseModel
 
 
 class CouponConsume(BaseModel):
     """
-    Model representing the usage record of a coupon by a specific user.
+    Model representing the usage record of a coupon by a specific user, a user can use a coupon once.
 
     Attributes:
         user (ForeignKey): The user who used the coupon.
@@ -35,3 +37,13 @@ class CouponConsume(BaseModel):
         verbose_name = _("Coupon Consumption")
         verbose_name_plural = _("Coupon Consumptions")
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "coupon"], name="unique_coupon_consume_user_coupon"),
+        ]
+
+    @hook(AFTER_DELETE)
+    def release_coupon_use(self):
+        """Gives the use back to the coupon usage counter."""
+        from .coupon import Coupon
+
+        Coupon.objects.filter(id=self.coupon_id, used__gt=0).update(used=F("used") - 1)
@@ -1,5 +1,8 @@
 # apps/promotions/queries.py
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Value
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -8,11 +11,15 @@ from core import choice
 
 from .models import Coupon, CouponConsume
 
+COUPON_CACHE_KEY = "promotions:coupon:{code}"
+COUPON_CACHE_TIMEOUT = 60 * 60
+
 
 def coupon_validate(user: User, coupon: Coupon, cart_total_price: float) -> Coupon | None:
     """
     Validate if the given coupon code is usable for the user, considering timezones,
     start date, and expiry date.
+    The coupon fields are checked in memory, its usage and the user's consumption are read in one query.
 
     Args:
         user (User): The user attempting to use the coupon.
@@ -53,14 +60,6 @@ def coupon_validate(user: User, coupon: Coupon, cart_total_price: float) -> Coup
     if coupon.valid_until and current_time > coupon.valid_until:
         raise ValidationError(_("This coupon has expired."))
 
-    # Check if the coupon has reached its usage limit
-    if coupon.total and CouponConsume.objects.filter(coupon=coupon).count() >= coupon.total:
-        raise ValidationError(_("This coupon has reached its usage limit."))
-
-    # Ensure the user hasn't already used this coupon
-    if CouponConsume.objects.filter(user=user, coupon=coupon).exists():
-        raise ValidationError(_("You have already used this coupon."))
-
     # Check if the coupon is active
     if not coupon.is_active:
         raise ValidationError(_("This coupon is no longer active."))
@@ -69,6 +68,30 @@ def coupon_validate(user: User, coupon: Coupon, cart_total_price: float) -> Coup
     if coupon.min_cart is not None and cart_total_price < coupon.min_cart:
         raise ValidationError(_("Your cart total price must be at least {coupon.min_cart} to use this coupon."))
 
+    # Read the current usage and the user's consumption in one query, the coupon itself may come from cache
+    user_id = getattr(user, "id", None)
+    usage = (
+        Coupon.objects.filter(id=coupon.id)
+        .values(
+            "used",
+            used_by_user=Exists(CouponConsume.objects.filter(user_id=user_id, coupon=OuterRef("id")))
+            if user_id
+            else Value(False),
+        )
+        .first()
+    )
+    if usage is None:
+        raise ValidationError(_("Invalid coupon code."))
+    coupon.used = usage["used"]
+
+    # Check if the coupon has reached its usage limit
+    if coupon.used >= coupon.total:
+        raise ValidationError(_("This coupon has reached its usage limit."))
+
+    # Ensure the user hasn't already used this coupon
+    if usage["used_by_user"]:
+        raise ValidationError(_("You have already used this coupon."))
+
     return coupon
 
 
@@ -125,32 +148,63 @@ def get_coupon_by_id(coupon_id: int) -> Coupon | None:
 
 def get_coupon_by_code(coupon_code: str) -> Coupon | None:
     """
-    Retrieve a Coupon instance by its ID.
+    Retrieve a Coupon instance by its code.
+    Found coupons are kept in cache until the coupon is changed, its usage is always read by `coupon_validate`.
 
     Args:
-        coupon_id (int): The ID of the coupon to retrieve.
+        coupon_code (str): The code of the coupon to retrieve.
 
     Returns:
         Coupon | None: The Coupon instance if found, otherwise None.
     """
-    try:
-        return Coupon.objects.get(code=coupon_code)
-    except Coupon.DoesNotExist:
+    if not coupon_code or len(coupon_code) > Coupon._meta.get_field("code").max_length:
         return None
+    key = COUPON_CACHE_KEY.format(code=coupon_code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code=coupon_code).first()
+        if coupon is not None:
+            cache.set(key, coupon, COUPON_CACHE_TIMEOUT)
+    return coupon
 
 
-def consume_coupon(user, total_price_order, coupon: Coupon) -> bool:
+def invalidate_coupon_by_code(*coupon_codes: str) -> None:
+    """Drops the cached lookups of the coupon codes, the next lookup reloads them."""
+    cache.delete_many([COUPON_CACHE_KEY.format(code=code) for code in coupon_codes if code])
+
+
+def consume_coupon(user, total_price_order, coupon: Coupon, validate: bool = True) -> CouponConsume:
     """
-    Consume a coupon by setting its `consumed` field to True.
+    Record the use of a coupon by the user.
+    The usage counter is taken with a conditional update, so concurrent orders can never use the coupon
+    more than its total, and the per-user use is guarded by the unique constraint of `CouponConsume`.
+    Call it late in the order transaction, the coupon row stays locked until the commit.
+
     Args:
-        coupon_id (int): The ID of the coupon to consume.
+        user (User): The user using the coupon.
+        total_price_order (float): The total price of the order.
+        coupon (Coupon): The coupon to consume.
+        validate (bool): Validate the coupon first, pass False when it was already validated by the caller.
+
     Returns:
-        bool: True if the coupon was successfully consumed, False otherwise.
+        CouponConsume: The consumption record.
+
+    Raises:
+        ValidationError: If the coupon is not valid, has reached its usage limit or was already used by the user.
     """
-    coupon_validate(
-        user=user,
-        cart_total_price=total_price_order,
-        coupon=coupon,
-    )
-    obj = CouponConsume.objects.create(user=user, coupon=coupon)
+    if validate:
+        coupon_validate(
+            user=user,
+            cart_total_price=total_price_order,
+            coupon=coupon,
+        )
+    with transaction.atomic():
+        if not Coupon.objects.filter(id=coupon.id, used__lt=F("total")).update(used=F("used") + 1):
+            raise ValidationError(_("This coupon has reached its usage limit."))
+        try:
+            with transaction.atomic():
+                obj = CouponConsume.objects.create(user=user, coupon=coupon)
+        except IntegrityError:
+            raise ValidationError(_("You have already used this coupon.")) from None
+    coupon.used += 1
     return obj
@@ -0,0 +1,12 @@
+from celery import shared_task
+
+
+@shared_task
+def generate_coupons_task(template_id: int, count: int, prefix: str, length: int, uses: int, created_by_id: int | None) -> int:
+    from .bulk import generate_coupons
+    from .models import Coupon
+
+    template = Coupon.objects.filter(id=template_id).first()
+    if template is None:
+        return 0
+    return generate_coupons(template, count, prefix=prefix, length=length, uses=uses, created_by_id=created_by_id)
@@ -4,4 +4,5 @@ urlpatterns = [
     path("account/", include("apps.account.urls")),
     path("base/", include("apps.base.urls")),
     path("messaging/", include("apps.messaging.urls")),
+    path("order/", include("apps.order.urls")),
 ]
@@ -0,0 +1,77 @@
+from collections import defaultdict
+from typing import Iterable
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F
+
+from core.redis_client import get_redis
+
+# Set of "app_label.model_name" labels having buffered views
+VIEWS_BUFFER_MODELS_KEY = "analytics:views:models"
+
+
+def _buffer_key(label: str) -> str:
+    """Hash of object id -> views not yet written to `views_count`."""
+    return f"analytics:views:{label}"
+
+
+def _flushing_key(label: str) -> str:
+    """Hash taken over by the running flush, kept until the database update is done."""
+    return f"analytics:views:{label}:flushing"
+
+
+def buffer_view(obj: models.Model, count: int = 1) -> None:
+    """Adds views to the Redis buffer of the object, `flush_buffered_views` writes them to the database."""
+    label = obj._meta.label_lower
+    pipeline = get_redis().pipeline()
+    pipeline.sadd(VIEWS_BUFFER_MODELS_KEY, label)
+    pipeline.hincrby(_buffer_key(label), obj.pk, count)
+    pipeline.execute()
+
+
+def get_buffered_views(model: type[models.Model], ids: Iterable[int]) -> dict[int, int]:
+    """Returns the views of the given objects that are not written to the database yet, keyed by id."""
+    ids = list(ids)
+    if not ids:
+        return {}
+
+    label = model._meta.label_lower
+    pipeline = get_redis().pipeline()
+    pipeline.hmget(_buffer_key(label), ids)
+    pipeline.hmget(_flushing_key(label), ids)
+    buffered, flushing = pipeline.execute()
+    return {pk: int(live or 0) + int(taken or 0) for pk, live, taken in zip(ids, buffered, flushing, strict=True)}
+
+
+def flush_buffered_views() -> int:
+    """
+    Writes the buffered views to `views_count` with `UPDATE ... SET views_count = views_count + n`, one statement
+    per distinct n and model, so the rows are neither loaded nor saved.
+    The buffer is swapped out atomically with RENAME, views arriving meanwhile go to a fresh buffer. A flush that
+    failed is retried first on the next run, so views are written at least once.
+
+    Returns:
+        int: Number of updated rows.
+    """
+    client = get_redis()
+    updated = 0
+    for label in client.smembers(VIEWS_BUFFER_MODELS_KEY):
+        label = label.decode()
+        model = apps.get_model(label)
+        flushing_key = _flushing_key(label)
+        if not client.exists(flushing_key):
+            if not client.exists(_buffer_key(label)):
+                continue
+            client.rename(_buffer_key(label), flushing_key)
+
+        ids_by_count = defaultdict(list)
+        for pk, count in client.hgetall(flushing_key).items():
+            ids_by_count[int(count)].append(int(pk))
+
+        with transaction.atomic():
+            for count, ids in ids_by_count.items():
+                updated += model._base_manager.filter(pk__in=ids).update(views_count=F("views_count") + count)
+        client.delete(flushing_key)
+
+    return updated
@@ -17,6 +17,15 @@ MESSAGE_EVENTS = (
     (MESSAGE_EVENT_NEW_ANSWER, _("New Answer")),
 )
 
+EMAIL_STATUS_PENDING = 0
+EMAIL_STATUS_SENT = 1
+EMAIL_STATUS_FAILED = 2
+EMAIL_STATUSES = (
+    (EMAIL_STATUS_PENDING, _("Pending")),
+    (EMAIL_STATUS_SENT, _("Sent")),
+    (EMAIL_STATUS_FAILED, _("Failed")),
+)
+
 COUPON_TYPE_PERCENT = 0
 COUPON_TYPE_AMOUNT = 1
 COUPON_TYPES = (
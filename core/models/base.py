@@ -10,6 +10,7 @@ from django.utils.translation import gettext_lazy as _
 from django_lifecycle import LifecycleModelMixin, hook, hooks
 from unfold.widgets import BASE_INPUT_CLASSES, UnfoldAdminDecimalFieldWidget
 
+from core.analytics import buffer_view, get_buffered_views
 from core.http import get_client_ip
 from core.models.managers import DefaultManager
 
@@ -72,7 +73,8 @@ class AnalyticsBaseModel(models.Model):
     """
     Analytics Base Model
     methods:
-        - sey_view: plus view to object and cache ip and object_id with action in redis for 10 minutes
+        - sey_view: plus view to object and cache ip and object_id with action in redis for 10 minutes,
+          the view is buffered in redis and written to views_count by `flush_buffered_views_task`
         - set_like: plus like to object and cache ip and object_id with action in redis for 60 minutes
         - set_dislike: plus dislike in object and cache ip and object_id with action in redis for 60 minutes
     """
@@ -94,14 +96,18 @@ class AnalyticsBaseModel(models.Model):
         ip = get_client_ip(request)
         key = "av_%s_%s" % (self._key, ip)
         if force or not cache.get(key):
-            # its force or cache is not set
-            self.views_count += 1
-            self.save()
+            # its force or cache is not set, the view is buffered in redis and flushed to views_count periodically
+            buffer_view(self)
             cache.set(key, True, 60 * 10)
             return True
 
         return False
 
+    @property
+    def total_views_count(self) -> int:
+        """Stored views count plus the buffered views that are not flushed yet."""
+        return self.views_count + get_buffered_views(type(self), [self.pk]).get(self.pk, 0)
+
 
 def format_number_with_commas(number):
     # Set the locale to the user's default setting (usually used for commas and periods in numbers)
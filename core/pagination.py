@@ -0,0 +1,309 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+from collections.abc import Sequence
+from decimal import Decimal
+from functools import cached_property
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_ORDERING = ("-created_at", "-id")
+# Below this estimate an exact COUNT is cheap enough and is used instead
+ESTIMATE_EXACT_THRESHOLD = 1000
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Returns the planner's row estimate of a queryset, read from `EXPLAIN`, instead of running a COUNT(*).
+    Small results and other database backends fall back to the exact count.
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate < ESTIMATE_EXACT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class KeysetPage(Sequence):
+    """
+    A page of a `KeysetPaginator`. Behaves as the list of its objects and exposes the cursors of
+    the neighbour pages.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor based (keyset) paginator.
+
+    Pages are located by the sort key values of the last (or first) object of the previous page, e.g.
+    `created_at < X OR (created_at = X AND id < Y)`, so every page costs the same as the first one and
+    no OFFSET is used. The ordering is taken from the queryset (or `DEFAULT_ORDERING` when unordered)
+    and `id` is appended as the tie breaker. Nullable fields and annotations may hold NULLs, they are kept where
+    the database sorts them (PostgreSQL after all values, SQLite before), so the ordering can still use an index.
+    Annotations must be exact (e.g. cast `real` to `FloatField`), a rounded cursor value skips or repeats rows.
+
+    Attributes:
+        total: Exact number of objects, or the planner estimate when `estimate_total` is set.
+    """
+
+    def __init__(self, queryset: QuerySet, per_page: int, ordering=None, estimate_total: bool = False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = self._get_ordering(ordering or queryset.query.order_by or DEFAULT_ORDERING)
+        self.estimate_total = estimate_total
+        self.nullable = {field for field, _ in self.ordering if self._is_nullable(field)}
+        self.fields = {field: self._get_field(field) for field, _ in self.ordering}
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    @staticmethod
+    def _get_ordering(ordering) -> list[tuple[str, bool]]:
+        """Parses the ordering into (field, descending) pairs ending with the primary key."""
+        fields = []
+        for field in ordering:
+            if not isinstance(field, str) or field == "?":
+                raise ValueError(f"Keyset pagination supports only field name ordering, got {field!r}.")
+            name = field.lstrip("-")
+            fields.append(("id" if name == "pk" else name, field.startswith("-")))
+
+        if "id" not in dict(fields):
+            fields.append(("id", fields[-1][1]))
+        return fields
+
+    def _is_nullable(self, field: str) -> bool:
+        """Whether the sort key can be NULL, annotations and unknown fields are assumed to be."""
+        if field in self.queryset.query.annotations:
+            return True
+        model = self.queryset.model
+        for name in field.split("__"):
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return True
+            if model_field.null:
+                return True
+            model = model_field.related_model
+        return False
+
+    def _get_field(self, field: str):
+        """The model field (or annotation output field) of the sort key, None when it can not be resolved."""
+        annotation = self.queryset.query.annotations.get(field)
+        if annotation is not None:
+            try:
+                return annotation.output_field
+            except FieldError:
+                return None
+        model, model_field = self.queryset.model, None
+        for name in field.split("__"):
+            if model is None:
+                return None
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            model = model_field.related_model
+        return model_field
+
+    @cached_property
+    def total(self) -> int:
+        if self.estimate_total:
+            return estimate_count(self.queryset)
+        return self.queryset.count()
+
+    def encode_cursor(self, obj, reverse: bool = False) -> str:
+        values = []
+        for field in dict(self.ordering):
+            value = obj
+            for attr in field.split("__"):
+                value = getattr(value, attr)
+            if isinstance(value, datetime.date | datetime.time):
+                value = value.isoformat()
+            elif isinstance(value, Decimal):
+                value = str(value)
+            values.append(value)
+
+        payload = json.dumps({"v": values, "r": reverse}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> tuple[list, bool]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            values, reverse = payload["v"], bool(payload["r"])
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor(_("Invalid cursor")) from e
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor(_("Invalid cursor"))
+
+        # Values of the wrong type would only fail once the query is built or run
+        converted = []
+        for field, value in zip(dict(self.ordering), values, strict=True):
+            if value is None:
+                if field not in self.nullable:
+                    raise InvalidCursor(_("Invalid cursor"))
+            elif self.fields[field] is not None:
+                try:
+                    value = self.fields[field].to_python(value)
+                except (ValidationError, TypeError, ValueError) as e:
+                    raise InvalidCursor(_("Invalid cursor")) from e
+            converted.append(value)
+        return converted, reverse
+
+    def _keyset_filter(self, values: list, reverse: bool) -> Q:
+        """Rows after the given sort key values, or before them when paginating backwards."""
+        condition = Q()
+        equals = Q()
+        for (field, descending), value in zip(self.ordering, values, strict=True):
+            ascending = descending == reverse
+            nullable = field in self.nullable
+            # Whether the database puts the NULLs of this key after its values in the page order
+            nulls_last = nullable and ascending == self.nulls_largest
+            if value is None:
+                after = Q(**{f"{field}__isnull": False}) if nullable and not nulls_last else Q(pk__in=[])
+                same = Q(**{f"{field}__isnull": True})
+            else:
+                after = Q(**{f"{field}__{'gt' if ascending else 'lt'}": value})
+                if nulls_last:
+                    after |= Q(**{f"{field}__isnull": True})
+                same = Q(**{field: value})
+            condition |= equals & after
+            equals &= same
+        return condition
+
+    def page(self, cursor: str | None = None) -> KeysetPage:
+        """
+        Returns the page located by the cursor, the first page when no cursor is given.
+
+        Raises:
+            InvalidCursor: When the cursor can not be decoded or its values do not fit the sort keys.
+        """
+        values, reverse = self.decode_cursor(cursor) if cursor else (None, False)
+
+        order_by = [f"-{field}" if descending != reverse else field for field, descending in self.ordering]
+        queryset = self.queryset.order_by(*order_by)
+        if values is not None:
+            queryset = queryset.filter(self._keyset_filter(values, reverse))
+
+        # One extra row tells if there is a page after this one
+        object_list = list(queryset[: self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+
+        if reverse:
+            object_list.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return KeysetPage(
+            object_list,
+            self,
+            next_cursor=self.encode_cursor(object_list[-1]) if has_next and object_list else None,
+            previous_cursor=self.encode_cursor(object_list[0], reverse=True) if has_previous and object_list else None,
+        )
+
+
+def get_keyset_page(request, queryset: QuerySet, per_page: int, ordering=None, estimate_total: bool = False) -> KeysetPage:
+    """
+    Paginates a queryset by the `cursor` GET parameter of the request, an invalid cursor falls back to the first page.
+    """
+    paginator = KeysetPaginator(queryset, per_page, ordering=ordering, estimate_total=estimate_total)
+    try:
+        return paginator.page(request.GET.get("cursor"))
+    except InvalidCursor:
+        return paginator.page()
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination backed by `KeysetPaginator`, the `count` of the response is estimated when `estimate_total` is set.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+    ordering = None
+    estimate_total = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.paginator = KeysetPaginator(queryset, self.page_size, ordering=self.ordering, estimate_total=self.estimate_total)
+        try:
+            self.page = self.paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor as e:
+            raise NotFound(str(e)) from e
+        return list(self.page)
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.paginator.total),
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["count", "results"],
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
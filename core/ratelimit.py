@@ -0,0 +1,58 @@
+import time
+
+from core.redis_client import get_redis
+
+# Refills the bucket for the time passed since the last call (Redis clock, shared by all workers) and takes
+# the requested tokens when there are enough, returns the seconds to wait otherwise
+RATE_LIMIT_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "time")
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "time", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter kept in Redis, so every worker and process draws from the same quota.
+    The bucket holds up to `capacity` tokens (the allowed burst) and is refilled with `rate` tokens per second.
+    methods:
+        - try_acquire: take tokens if available, returns the seconds to wait otherwise
+        - acquire: take tokens, blocking until they are available
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("The rate and capacity of a token bucket must be positive.")
+        self.key = f"ratelimit:{name}"
+        self.rate = rate
+        self.capacity = capacity
+        self._script = get_redis().register_script(RATE_LIMIT_SCRIPT)
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Takes the tokens if the bucket has them and returns 0, otherwise takes nothing and returns the wait time."""
+        return float(self._script(keys=[self.key], args=[self.rate, self.capacity, tokens]))
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Takes the tokens, sleeping until the bucket has them. Returns the total time waited in seconds."""
+        if tokens > self.capacity:
+            raise ValueError(f"{tokens} tokens never fit in a bucket of {self.capacity}.")
+        waited = 0.0
+        while wait := self.try_acquire(tokens):
+            time.sleep(wait)
+            waited += wait
+        return waited
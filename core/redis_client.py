@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache
+def get_redis() -> redis.Redis:
+    """
+    Returns the shared client of the Redis server behind the default cache, for the data structures
+    the cache API lacks (hashes, sets, sorted sets, scripts).
+    """
+    return redis.Redis(host=settings.REDIS_HOST, port=int(settings.REDIS_PORT))
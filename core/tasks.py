@@ -0,0 +1,15 @@
+from celery import shared_task
+from django.core.cache import cache
+
+from .analytics import flush_buffered_views
+
+
+@shared_task
+def flush_buffered_views_task() -> int:
+    # Only one flush at a time, a slow run must not overlap with the next scheduled one
+    if not cache.add("analytics:views:flush_lock", True, 60 * 5):
+        return 0
+    try:
+        return flush_buffered_views()
+    finally:
+        cache.delete("analytics:views:flush_lock")
@@ -19,6 +19,35 @@ app.config_from_object("django.conf:settings")
 app.conf.timezone = "Asia/Tehran"
 packages = []
 app.autodiscover_tasks(packages=packages)
+# `core` is not an installed app, it and the app tasks are registered explicitly instead of through import side effects
+app.autodiscover_tasks(packages=["core", "apps.promotions"])
+
+app.conf.beat_schedule = {
+    "flush-buffered-views": {
+        "task": "core.tasks.flush_buffered_views_task",
+        "schedule": 60.0,  # seconds
+    },
+    "dispatch-pending-pushes": {
+        "task": "apps.messaging.tasks.dispatch_pending_pushes_task",
+        "schedule": 10.0,  # seconds
+    },
+    "drain-email-outbox": {
+        "task": "apps.messaging.tasks.drain_email_outbox_task",
+        "schedule": 30.0,  # seconds
+    },
+    "resume-stalled-fanouts": {
+        "task": "apps.messaging.tasks.resume_stalled_fanouts_task",
+        "schedule": 60.0 * 5,  # seconds
+    },
+    "reconcile-unread-counts": {
+        "task": "apps.messaging.tasks.reconcile_unread_counts_task",
+        "schedule": 60.0 * 60,  # seconds
+    },
+    "retry-failed-sms": {
+        "task": "apps.messaging.tasks.retry_failed_sms_task",
+        "schedule": 60.0,  # seconds
+    },
+}
 
 
 @app.task(bind=True)
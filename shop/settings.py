@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.gis",
+    "django.contrib.postgres",
     "django.contrib.humanize",
     # libs
     "leaflet",
@@ -280,6 +281,15 @@ CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}"
 MESSAGING_KAVENEGAR_APIKEY = env("MESSAGING_KAVENEGAR_APIKEY")
 MESSAGING_NAJVA_APIKEY = env("MESSAGING_NAJVA_APIKEY")
 MESSAGING_NAJVA_TOKEN = env("MESSAGING_NAJVA_TOKEN")
+MESSAGING_NAJVA_API_URL = env(
+    "MESSAGING_NAJVA_API_URL", default="https://app.najva.com/api/v2/notification/management/send-direct/"
+)  # Point it at `run_najva_stub` for offline benchmarks
+
+PRODUCTS_SEARCH_BACKEND = env("PRODUCTS_SEARCH_BACKEND", default="apps.products.search.PostgresSearchBackend")
+PRODUCTS_SEARCH_CONFIG = env("PRODUCTS_SEARCH_CONFIG", default="simple")  # Text search configuration, "simple" suits Persian
+
+CARTS_GUEST_CART_STORE = env("CARTS_GUEST_CART_STORE", default="database")  # "redis" keeps guest carts out of the database
+CARTS_GUEST_CART_TTL = env.int("CARTS_GUEST_CART_TTL", default=60 * 60 * 24 * 7)  # Seconds after the last change
 
 
 EMAIL_HOST = env("EMAIL_HOST")